@@ -5,6 +5,13 @@ from app.config import Config
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # JSON logs written by a background thread, tagged with each request's ID.
+    from app.log import configure_logging, init_request_ids
+    configure_logging(app.config.get("LOG_LEVEL"))
+    init_request_ids(app)
+    # Service clients are created lazily by the extension on first use.
+    from app.extensions import Caelum
+    Caelum(app)
     # Register blueprints.
     from app.routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
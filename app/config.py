@@ -18,9 +18,68 @@ class Config:
 
     # API Keys & Service Credentials
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    # Alternative API endpoints, e.g. the local stand-ins in benchmarks/fakes.py.
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+    TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL") or None
+    TTS_BACKEND_URL = os.getenv("TTS_BACKEND_URL") or None
+    # AsyncLLMEngine: in-flight OpenAI requests per process (across event loops) and
+    # per-request timeout (seconds).
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+    # OpenAI rate limits per model, shared by every process through Redis (see
+    # app/ratelimit.py): requests and tokens per minute (0 disables), the share of
+    # each kept free of background jobs for interactive calls, and the longest a
+    # call waits to be admitted (seconds).
+    OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+    OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "10000"))
+    OPENAI_BATCH_RESERVE = float(os.getenv("OPENAI_BATCH_RESERVE", "0.25"))
+    OPENAI_LIMIT_MAX_WAIT = float(os.getenv("OPENAI_LIMIT_MAX_WAIT", "120"))
+    # Model tiering (see app/routing.py): messages up to LLM_SHORT_INPUT_CHARS go to the
+    # fast model, longer ones to the primary model with max_tokens by request class.
+    # A call still running after LLM_HEDGE_AFTER seconds (LLM_FAST_HEDGE_AFTER on the fast
+    # tier) is hedged with the fast model; no reply waits longer than LLM_MAX_LATENCY.
+    LLM_PRIMARY_MODEL = os.getenv("LLM_PRIMARY_MODEL", "gpt-4")
+    LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+    LLM_SHORT_INPUT_CHARS = int(os.getenv("LLM_SHORT_INPUT_CHARS", "80"))
+    LLM_FAST_MAX_TOKENS = int(os.getenv("LLM_FAST_MAX_TOKENS", "150"))
+    LLM_SMS_MAX_TOKENS = int(os.getenv("LLM_SMS_MAX_TOKENS", "300"))
+    LLM_PRIMARY_MAX_TOKENS = int(os.getenv("LLM_PRIMARY_MAX_TOKENS", "500"))
+    LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "8"))
+    LLM_FAST_HEDGE_AFTER = float(os.getenv("LLM_FAST_HEDGE_AFTER", "3"))
+    LLM_MAX_LATENCY = float(os.getenv("LLM_MAX_LATENCY", "25"))
+    LLM_ROUTING_WORKERS = int(os.getenv("LLM_ROUTING_WORKERS", "32"))
     TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
     TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
     TWILIO_NUMBER = os.getenv("TWILIO_NUMBER")
+    # Reject /webhook calls without a valid X-Twilio-Signature header.
+    TWILIO_VALIDATE_SIGNATURE = os.getenv("TWILIO_VALIDATE_SIGNATURE", "false").lower() == "true"
+    # Shared Twilio dispatcher: keep-alive pool size and retries for 429/5xx responses.
+    TWILIO_POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", "8"))
+    TWILIO_MAX_RETRIES = int(os.getenv("TWILIO_MAX_RETRIES", "4"))
+    # Recipient prefixes whose channel accepts text and media in one MMS.
+    TWILIO_MMS_PREFIXES = tuple(p for p in os.getenv("TWILIO_MMS_PREFIXES", "+1").split(",") if p)
+    # Scheduled-message fan-out: recipients per Celery batch task, parallel sends within a
+    # batch, and messages per second sent from the Twilio number across all workers
+    # (shared through Redis; per process without it).
+    FANOUT_BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", "50"))
+    FANOUT_BATCH_CONCURRENCY = int(os.getenv("FANOUT_BATCH_CONCURRENCY", "4"))
+    TWILIO_SEND_RATE = float(os.getenv("TWILIO_SEND_RATE", "1"))
+    # Scheduled messages due within this many minutes get their audio pre-rendered.
+    PRERENDER_LEAD_MINUTES = float(os.getenv("PRERENDER_LEAD_MINUTES", "60"))
+    # Send the reply text before its audio is rendered (two messages), instead of
+    # waiting and sending both in one MMS. Replies whose audio is cached always go as one.
+    REPLY_TEXT_FIRST = os.getenv("REPLY_TEXT_FIRST", "true").lower() == "true"
+    # Per-stage timeouts (seconds) for the reply and scheduled-message pipelines.
+    LLM_STAGE_TIMEOUT = float(os.getenv("LLM_STAGE_TIMEOUT", "90"))
+    TTS_STAGE_TIMEOUT = float(os.getenv("TTS_STAGE_TIMEOUT", "30"))
+    SEND_STAGE_TIMEOUT = float(os.getenv("SEND_STAGE_TIMEOUT", "30"))
+    # Voice notes: largest download accepted, longest segment sent to Whisper in one
+    # request, parallel Whisper requests per note, and what counts as a pause to cut at.
+    VOICE_MAX_BYTES = int(os.getenv("VOICE_MAX_BYTES", str(25 * 1024 * 1024)))
+    VOICE_SEGMENT_SECONDS = float(os.getenv("VOICE_SEGMENT_SECONDS", "30"))
+    VOICE_TRANSCRIBE_CONCURRENCY = int(os.getenv("VOICE_TRANSCRIBE_CONCURRENCY", "4"))
+    VOICE_SILENCE_DB = float(os.getenv("VOICE_SILENCE_DB", "-35"))
+    VOICE_SILENCE_SECONDS = float(os.getenv("VOICE_SILENCE_SECONDS", "0.4"))
 
     # Paths & Directories
     
@@ -28,6 +87,32 @@ class Config:
     
     UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 
+    # PDF exports (see app/exports.py): where finished PDFs are kept, concurrent
+    # wkhtmltopdf processes per host, the binary (empty = look it up on PATH),
+    # and the longest Markdown document accepted.
+    EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+    EXPORT_MAX_PROCESSES = int(os.getenv("EXPORT_MAX_PROCESSES", "2"))
+    WKHTMLTOPDF_PATH = os.getenv("WKHTMLTOPDF_PATH", "")
+    EXPORT_MAX_CHARS = int(os.getenv("EXPORT_MAX_CHARS", "200000"))
+
+    # Public base URL that serves /static (Twilio fetches media from here).
+    STATIC_DOMAIN = os.getenv("STATIC_DOMAIN", "https://duck-healthy-easily.ngrok-free.app")
+    STATUS_CALLBACK_URL = os.getenv("STATUS_CALLBACK_URL", f"{STATIC_DOMAIN}/status")
+
+    # Text-to-speech cache: audio is stored under AUDIO_OUTPUT_DIR, named by a hash of
+    # (text, lang, voice), and evicted least-recently-used past TTS_CACHE_MAX_BYTES.
+    TTS_LANG = os.getenv("TTS_LANG", "en")
+    TTS_VOICE = os.getenv("TTS_VOICE", "com")
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+    # Sentences rendered concurrently (per process) when synthesizing long text.
+    TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "4"))
+    # Serving /static/audio (see app/media.py): "x-accel" (nginx) or "x-sendfile" lets the
+    # front proxy send the bytes; the prefix is nginx's internal location for the audio
+    # directory. Content-addressed files are cached for a year, others for STATIC_AUDIO_MAX_AGE.
+    STATIC_OFFLOAD = os.getenv("STATIC_OFFLOAD", "").lower()
+    STATIC_ACCEL_AUDIO_PREFIX = os.getenv("STATIC_ACCEL_AUDIO_PREFIX", "/_audio/")
+    STATIC_AUDIO_MAX_AGE = int(os.getenv("STATIC_AUDIO_MAX_AGE", "3600"))
+
     # Voice Mapping (for future extensibility; fixed in simplified branch)
     VOICE_MAP = {
         "Beau": "21m00Tcm4TlvDq8ikWAM",
@@ -41,6 +126,50 @@ class Config:
     CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
     CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 
+    # Redis shared by the web and Celery workers for caches (empty disables it).
+    REDIS_URL = os.getenv("REDIS_URL", CELERY_BROKER_URL)
+
+    # LLM response cache: in-process LRU in front of Redis, entries expire after LLM_CACHE_TTL seconds.
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    # Twilio webhook/status idempotency on MessageSid (see app/idempotency.py): seconds a
+    # result is remembered, seconds an unfinished claim lasts, and seconds a retry waits
+    # for the first delivery to finish.
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+    IDEMPOTENCY_PENDING_TTL = int(os.getenv("IDEMPOTENCY_PENDING_TTL", "60"))
+    IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "5"))
+    # Keys kept per process without Redis; the oldest are dropped beyond this.
+    IDEMPOTENCY_LOCAL_MAX_KEYS = int(os.getenv("IDEMPOTENCY_LOCAL_MAX_KEYS", "10000"))
+    # Seconds between flushes of each process' metrics to Redis (see app/metrics.py).
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+    # SQLite database for conversation memory and logs (see app/utils/helpers.py).
+    DATABASE_PATH = os.getenv("DATABASE_PATH", "caelum.db")
+    # Batched log writes: seconds between flushes, rows that trigger an early flush,
+    # and rows buffered in memory before writers wait.
+    DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "0.5"))
+    DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "200"))
+    DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "10000"))
+    # Mood aggregates: weight of the newest score in the moving average, scores kept
+    # per user, and days covered by the low/medium/high counts.
+    MOOD_EMA_ALPHA = float(os.getenv("MOOD_EMA_ALPHA", "0.3"))
+    MOOD_LAST_N = int(os.getenv("MOOD_LAST_N", "7"))
+    MOOD_WINDOW_DAYS = int(os.getenv("MOOD_WINDOW_DAYS", "7"))
+    # /respond history: tokens of history sent per request, unsummarized overflow that
+    # triggers a background summary, turns read per request, and the summary's length.
+    MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+    MEMORY_SUMMARY_TRIGGER = int(os.getenv("MEMORY_SUMMARY_TRIGGER", "400"))
+    MEMORY_MAX_RECENT_TURNS = int(os.getenv("MEMORY_MAX_RECENT_TURNS", "40"))
+    MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "250"))
+
+    # Logging (see app/log.py): root level, share of DEBUG records kept, prompt
+    # characters included in log lines, and records buffered before new ones are dropped.
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+    LOG_PROMPT_MAX_CHARS = int(os.getenv("LOG_PROMPT_MAX_CHARS", "200"))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
 class DevelopmentConfig(Config):
     """Configuration for development."""
     DEBUG = True
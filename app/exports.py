@@ -0,0 +1,219 @@
+# app/exports.py
+"""
+Markdown to PDF exports.
+
+Exports are rendered by a Celery task, never in a web request: Markdown is
+converted to HTML and printed to PDF by wkhtmltopdf through pdfkit. Each PDF
+is named after a hash of its content (Markdown, title and stylesheet), so the
+hash doubles as the job ID. Exporting the same document twice renders it once,
+and a finished export can be found from its ID without the Celery result
+backend.
+
+At most Config.EXPORT_MAX_PROCESSES wkhtmltopdf processes run at a time on a
+host, however many worker processes there are. Each render holds one of that
+many slot files under an flock, and a worker that is killed mid-render
+releases its slot with the process.
+"""
+import hashlib
+import html
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, Optional
+from app.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: slots are only shared between threads.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+ExportFile = namedtuple("ExportFile", ["job_id", "filename", "path"])
+
+JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+EXPORT_CSS = """
+body { font-family: "DejaVu Serif", Georgia, serif; font-size: 12pt; line-height: 1.5; margin: 0 1.5cm; }
+h1, h2, h3 { font-family: "DejaVu Sans", Helvetica, sans-serif; line-height: 1.2; }
+pre, code { font-family: "DejaVu Sans Mono", monospace; font-size: 10pt; }
+pre { background: #f5f5f5; padding: 0.5em; white-space: pre-wrap; }
+blockquote { border-left: 3px solid #ccc; margin-left: 0; padding-left: 1em; color: #555; }
+table { border-collapse: collapse; } td, th { border: 1px solid #ccc; padding: 0.25em 0.5em; }
+"""
+
+# wkhtmltopdf options. Documents come from users, so scripts and local file
+# access are off, and every network load (a Markdown image, say) goes to a
+# proxy that does not exist: the worker never fetches a URL for a document.
+PDF_OPTIONS = {
+    "encoding": "UTF-8",
+    "page-size": "A4",
+    "quiet": "",
+    "disable-javascript": "",
+    "disable-local-file-access": "",
+    "proxy": "http://127.0.0.1:9",
+}
+
+
+def export_id(markdown_text: str, title: str = "") -> str:
+    """
+    Returns the content hash that names an export (and its job).
+    """
+    digest = hashlib.sha256()
+    for part in (markdown_text, title, EXPORT_CSS, repr(sorted(PDF_OPTIONS.items()))):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def export_file(job_id: str, directory: Optional[str] = None) -> ExportFile:
+    """
+    Returns the filename and path of an export, whether or not it has been
+    rendered yet.
+
+    Raises:
+        ValueError: If job_id is not an export ID.
+    """
+    if not JOB_ID.match(job_id or ""):
+        raise ValueError(f"Invalid export id: {job_id!r}")
+    filename = f"export_{job_id}.pdf"
+    return ExportFile(job_id, filename, str(Path(directory or Config.EXPORT_DIR) / filename))
+
+
+def find_export(job_id: str, directory: Optional[str] = None) -> Optional[ExportFile]:
+    """
+    Returns the finished export with this ID, or None.
+    """
+    try:
+        export = export_file(job_id, directory)
+    except ValueError:
+        return None
+    return export if os.path.exists(export.path) else None
+
+
+def render_html(markdown_text: str, title: str = "") -> str:
+    """
+    Converts Markdown to a standalone HTML page with the export stylesheet.
+    Raw HTML in the Markdown is escaped and shows up as text.
+    """
+    import markdown
+    converter = markdown.Markdown(extensions=["extra", "sane_lists"])
+    converter.preprocessors.deregister("html_block")
+    converter.inlinePatterns.deregister("html")
+    body = converter.convert(markdown_text)
+    heading = f"<h1>{html.escape(title)}</h1>\n" if title else ""
+    return (f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>"
+            f"<style>{EXPORT_CSS}</style></head>\n<body>\n{heading}{body}\n</body></html>")
+
+
+def render_pdf(page: str, output_path: str) -> None:
+    """
+    Prints an HTML page to a PDF file with wkhtmltopdf.
+    """
+    import pdfkit
+    configuration = pdfkit.configuration(wkhtmltopdf=Config.WKHTMLTOPDF_PATH) if Config.WKHTMLTOPDF_PATH else None
+    pdfkit.from_string(page, output_path, options=PDF_OPTIONS, configuration=configuration)
+
+
+class RenderSlots:
+    def __init__(self, directory: str, size: int, poll_interval: float = 0.05):
+        """
+        A fixed number of render slots shared by every process on the host.
+
+        Args:
+            directory (str): Where the slot files live.
+            size (int): Number of slots, i.e. concurrent renders allowed.
+            poll_interval (float): Seconds between attempts while every slot is busy.
+        """
+        self.directory = Path(directory)
+        self.size = max(1, size)
+        self.poll_interval = poll_interval
+        # flock is per open file, so threads of one process also exclude each other,
+        # but the semaphore keeps them from spinning on the files.
+        self._threads = threading.BoundedSemaphore(self.size)
+
+    def acquire(self):
+        """
+        Waits for a free slot and returns its handle for release().
+        """
+        self._threads.acquire()
+        if fcntl is None:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        while True:
+            for i in range(self.size):
+                handle = open(self.directory / f".render-slot-{i}", "a")
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return handle
+                except BlockingIOError:
+                    handle.close()
+            time.sleep(self.poll_interval)
+
+    def release(self, handle) -> None:
+        if handle is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+        self._threads.release()
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def get_render_slots() -> RenderSlots:
+    """
+    Returns the process-wide handle on the host's wkhtmltopdf slots.
+    """
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                _slots = RenderSlots(Config.EXPORT_DIR, Config.EXPORT_MAX_PROCESSES)
+    return _slots
+
+
+def export_pdf(markdown_text: str, title: str = "", directory: Optional[str] = None,
+               renderer: Optional[Callable[[str, str], None]] = None) -> ExportFile:
+    """
+    Returns the PDF for a Markdown document, rendering it on a miss.
+
+    Args:
+        markdown_text (str): The document.
+        title (str): Shown as the page title and first heading.
+        directory (str, optional): Where exports are stored (default Config.EXPORT_DIR).
+        renderer (callable, optional): Called as renderer(html, path) to write the
+            PDF (default render_pdf).
+
+    Returns:
+        ExportFile: The export's ID, filename and path.
+    """
+    export = export_file(export_id(markdown_text, title), directory)
+    if os.path.exists(export.path):
+        return export
+
+    Path(export.path).parent.mkdir(parents=True, exist_ok=True)
+    page = render_html(markdown_text, title)
+    slots = get_render_slots()
+    handle = slots.acquire()
+    try:
+        # Re-check now that we hold a slot: the same document may just have finished.
+        if os.path.exists(export.path):
+            return export
+        tmp_path = f"{export.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            started = time.perf_counter()
+            (renderer or render_pdf)(page, tmp_path)
+            os.replace(tmp_path, export.path)
+            logger.info("Rendered export %s in %.2fs", export.job_id, time.perf_counter() - started)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        slots.release(handle)
+    return export
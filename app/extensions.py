@@ -0,0 +1,90 @@
+# app/extensions.py
+"""
+Flask extension that owns Caelum's service clients.
+
+create_app() registers a single Caelum instance under app.extensions["caelum"].
+The LLM engine, Twilio dispatcher and TTS cache it hands out are created on
+first use, so a freshly forked gunicorn worker does not pay for the OpenAI,
+Twilio or gTTS imports until a request actually needs them.
+"""
+import os
+import threading
+from flask import current_app
+
+
+class Caelum:
+    def __init__(self, app=None):
+        self._llm = None
+        self._async_llm = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Registers the extension on the app and ensures the audio directory exists.
+        """
+        app.extensions["caelum"] = self
+        os.makedirs(app.config.get("AUDIO_OUTPUT_DIR", "app/static/audio"), exist_ok=True)
+
+    @property
+    def llm(self):
+        """
+        Returns the LLM engine, creating it on first use.
+        """
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    from app.llm import LLMEngine
+                    self._llm = LLMEngine()
+        return self._llm
+
+    @property
+    def async_llm(self):
+        """
+        Returns the asyncio LLM engine for async views, creating it on first use.
+        """
+        if self._async_llm is None:
+            with self._lock:
+                if self._async_llm is None:
+                    from app.llm import AsyncLLMEngine
+                    self._async_llm = AsyncLLMEngine()
+        return self._async_llm
+
+    @property
+    def dispatcher(self):
+        """
+        Returns the process-wide Twilio dispatcher.
+        """
+        from app.messaging import get_dispatcher
+        return get_dispatcher()
+
+    @property
+    def memory(self):
+        """
+        Returns the process-wide conversation memory.
+        """
+        from app.memory import get_memory
+        return get_memory()
+
+    @property
+    def tts_cache(self):
+        """
+        Returns the process-wide TTS cache.
+        """
+        from app.tts import get_tts_cache
+        return get_tts_cache()
+
+
+def get_caelum() -> Caelum:
+    """
+    Returns the Caelum extension of the current app.
+    """
+    return current_app.extensions["caelum"]
+
+
+def get_llm():
+    """
+    Returns the LLM engine of the current app.
+    """
+    return get_caelum().llm
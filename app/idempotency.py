@@ -0,0 +1,260 @@
+# app/idempotency.py
+"""
+Idempotent handling of Twilio webhooks and status callbacks.
+
+Twilio retries a webhook that does not answer within its timeout, and may
+deliver a status callback more than once. Work is therefore keyed on the
+MessageSid: the first delivery claims the key (SET NX in Redis) and runs the
+work, later deliveries never run it again. A duplicate that arrives while the
+first is still running waits for it and returns the same result; one that
+arrives afterwards gets the stored result straight away.
+
+Claims expire after Config.IDEMPOTENCY_PENDING_TTL seconds, so a worker that
+dies mid-request does not block the key for good; results are kept for
+Config.IDEMPOTENCY_TTL seconds. Without Redis (or while it is unreachable)
+keys are kept in-process, which still covers retries reaching the same worker.
+The in-process keys are kept in write order, which is close to expiry order,
+so expired ones are dropped from the front at constant cost per write, and at
+most Config.IDEMPOTENCY_LOCAL_MAX_KEYS are kept.
+
+Work that fails frees its key for the next retry. A caller can narrow that with
+release_on: a failure it does not accept is recorded as "uncertain" and kept
+for the full result TTL, so work whose effect may have happened (a send that
+timed out after the provider accepted it) is never run a second time.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, Optional
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# result: the work's return value (None if the first delivery is still running
+# after the wait); duplicate: False only for the delivery that ran the work.
+Outcome = namedtuple("Outcome", ["result", "duplicate"])
+
+PENDING = "pending"
+DONE = "done"
+UNCERTAIN = "uncertain"
+
+
+class OutcomeUnknown(Exception):
+    """Raised when earlier work under a key failed in a way that may have taken effect."""
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: Optional[int] = None, pending_ttl: Optional[int] = None,
+                 redis_url: Optional[str] = None, prefix: str = "caelum:idem:",
+                 poll_interval: float = 0.05, redis_retry_after: float = 30.0,
+                 max_local_keys: Optional[int] = None):
+        """
+        Initializes the store.
+
+        Args:
+            ttl (int, optional): Seconds a finished result is kept (default Config.IDEMPOTENCY_TTL).
+            pending_ttl (int, optional): Seconds a claim lasts without finishing
+                (default Config.IDEMPOTENCY_PENDING_TTL).
+            redis_url (str, optional): Shared store; empty keeps keys in-process (default Config.REDIS_URL).
+            prefix (str): Prefix for the Redis keys.
+            poll_interval (float): Seconds between checks while waiting on another worker.
+            redis_retry_after (float): Seconds to skip Redis after a connection error.
+            max_local_keys (int, optional): In-process keys kept at most
+                (default Config.IDEMPOTENCY_LOCAL_MAX_KEYS).
+        """
+        self.ttl = ttl or Config.IDEMPOTENCY_TTL
+        self.pending_ttl = pending_ttl or Config.IDEMPOTENCY_PENDING_TTL
+        self.redis_url = Config.REDIS_URL if redis_url is None else redis_url
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+        self.redis_retry_after = redis_retry_after
+        self.max_local_keys = max_local_keys or Config.IDEMPOTENCY_LOCAL_MAX_KEYS
+        self._local = OrderedDict()
+        self._cond = threading.Condition()
+        self._redis = None
+        self._redis_down_until = 0.0
+
+    def run(self, key: str, work: Callable[[], Any], wait: Optional[float] = None,
+            release_on: Optional[Callable[[Exception], bool]] = None) -> Outcome:
+        """
+        Runs work() once per key.
+
+        Args:
+            key (str): The idempotency key, e.g. "webhook:<MessageSid>".
+            work (callable): Produces a JSON-serialisable result.
+            wait (float, optional): Seconds a duplicate waits for a running first
+                delivery (default Config.IDEMPOTENCY_WAIT).
+            release_on (callable, optional): Tells whether an error from work()
+                frees the key for a retry (default: every error does).
+
+        Returns:
+            Outcome: The result and whether this call was a duplicate.
+
+        Raises:
+            OutcomeUnknown: If work() failed with an error release_on rejects,
+                now or on an earlier call for this key.
+        """
+        if self._claim(key):
+            try:
+                result = work()
+            except Exception as e:
+                if release_on is None or release_on(e):
+                    # Let the next retry try again.
+                    self._release(key)
+                    raise
+                self._complete(key, None, state=UNCERTAIN)
+                raise OutcomeUnknown(f"{key} failed and may have taken effect: {e!r}") from e
+            self._complete(key, result)
+            return Outcome(result, False)
+
+        deadline = time.monotonic() + (Config.IDEMPOTENCY_WAIT if wait is None else wait)
+        while True:
+            entry = self._get(key)
+            if entry is None:
+                # The first delivery failed or its claim expired: take over.
+                return self.run(key, work, wait=max(0.0, deadline - time.monotonic()))
+            if entry["state"] == DONE:
+                return Outcome(entry["result"], True)
+            if entry["state"] == UNCERTAIN:
+                raise OutcomeUnknown(f"{key} failed earlier and may have taken effect")
+            if time.monotonic() >= deadline:
+                return Outcome(None, True)
+            self._sleep(key, min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    def claim(self, key: str, ttl: Optional[int] = None) -> bool:
+        """
+        Claims a key for work that finishes somewhere else, e.g. in a Celery
+        task; release() frees it, otherwise it expires.
+
+        Args:
+            key (str): The key, e.g. "summary:<user_id>".
+            ttl (int, optional): Seconds the claim lasts (default pending_ttl).
+
+        Returns:
+            bool: False if the key is already claimed.
+        """
+        return self._claim(key, ttl)
+
+    def release(self, key: str) -> None:
+        """
+        Frees a key taken with claim().
+        """
+        self._release(key)
+
+    def clear(self) -> None:
+        """
+        Forgets the in-process keys.
+        """
+        with self._cond:
+            self._local.clear()
+
+    def _claim(self, key: str, ttl: Optional[int] = None) -> bool:
+        value = json.dumps({"state": PENDING})
+        ttl = ttl or self.pending_ttl
+        client = self._get_redis()
+        if client is not None:
+            try:
+                return bool(client.set(self.prefix + key, value, nx=True, ex=ttl))
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._cond:
+            self._expire_local(key)
+            if key in self._local:
+                return False
+            self._store_local(key, time.time() + ttl, value)
+            return True
+
+    def _get(self, key: str) -> Optional[dict]:
+        client = self._get_redis()
+        if client is not None:
+            try:
+                raw = client.get(self.prefix + key)
+                return json.loads(raw) if raw is not None else None
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._cond:
+            self._expire_local(key)
+            entry = self._local.get(key)
+        return json.loads(entry[1]) if entry else None
+
+    def _complete(self, key: str, result: Any, state: str = DONE) -> None:
+        value = json.dumps({"state": state, "result": result})
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.set(self.prefix + key, value, ex=self.ttl)
+                return
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._cond:
+            self._store_local(key, time.time() + self.ttl, value)
+            self._cond.notify_all()
+
+    def _release(self, key: str) -> None:
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.delete(self.prefix + key)
+                return
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._cond:
+            self._local.pop(key, None)
+            self._cond.notify_all()
+
+    def _sleep(self, key: str, seconds: float) -> None:
+        # In-process waiters are woken as soon as the key changes.
+        with self._cond:
+            if key in self._local:
+                self._cond.wait(seconds)
+                return
+        time.sleep(seconds)
+
+    def _store_local(self, key: str, expires: float, value: str) -> None:
+        self._local[key] = (expires, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_local_keys:
+            self._local.popitem(last=False)
+
+    def _expire_local(self, key: str) -> None:
+        now = time.time()
+        entry = self._local.get(key)
+        if entry and entry[0] <= now:
+            del self._local[key]
+        # Drop expired keys from the front; stops at the first live one.
+        while self._local:
+            oldest = next(iter(self._local))
+            if self._local[oldest][0] > now:
+                break
+            del self._local[oldest]
+
+    def _get_redis(self):
+        if not self.redis_url or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning("Idempotency Redis unavailable, using in-process keys only: %s", error)
+        self._redis_down_until = time.time() + self.redis_retry_after
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """
+    Returns the process-wide idempotency store.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IdempotencyStore()
+    return _store
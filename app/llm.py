@@ -1,118 +1,239 @@
 # app/llm.py
-import os
-from openai import OpenAI
+import asyncio
+import collections
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, Optional
+from app.config import Config
+from app.log import truncate
+from app.llm_cache import ResponseCache, get_response_cache
+from app.memory import estimate_tokens
+from app.metrics import get_metrics
+from app.prompts import CORE_PROMPT, build_system_prompt
+from app.ratelimit import INTERACTIVE, CallCancelled, estimate_request_tokens, get_openai_limiter
+from app.tts import synthesize
 
 
-import requests
-from datetime import datetime
-from pathlib import Path
-from typing import Optional
-from gtts import gTTS
-from app.config import Config
-from dotenv import load_dotenv
+logger = logging.getLogger(__name__)
 
+VOICE_MAP = Config.VOICE_MAP
 
-# Load environment variables from a .env file if present.
-load_dotenv()
+# The OpenAI client is built on first use rather than at import, so that
+# gunicorn and Celery workers (and the CLI) boot without loading the SDK.
+_client = None
+_client_lock = threading.Lock()
 
-# Setup API keys & paths.
-client = OpenAI(api_key=Config.OPENAI_API_KEY)
-AUDIO_OUTPUT_DIR = Path(Config.AUDIO_OUTPUT_DIR)
-AUDIO_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-VOICE_MAP = Config.VOICE_MAP
+def get_client():
+    """
+    Returns the process-wide OpenAI client, creating it on first use.
+
+    Raises:
+        Exception: If OPENAI_API_KEY is not set.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not Config.OPENAI_API_KEY:
+                    raise Exception("OPENAI_API_KEY is not set.")
+                from openai import OpenAI
+                _client = OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL)
+    return _client
+
 
 class LLMEngine:
-    def __init__(self, model: str = "gpt-4", debug: bool = True):
+    def __init__(self, model: str = "gpt-4", debug: bool = True, cache: Optional[ResponseCache] = None,
+                 priority: str = INTERACTIVE):
         """
         Initializes the LLMEngine instance for the simplified single-personality branch.
 
         Args:
             model (str): The model to use (default "gpt-4").
             debug (bool): Whether to print debug statements (default True).
-
-        Raises:
-            Exception: If OPENAI_API_KEY is not set.
+            cache (ResponseCache, optional): Response cache to use (default: the shared
+                cache if Config.LLM_CACHE_ENABLED, otherwise none).
+            priority (str): Rate limiter class of this engine's calls, INTERACTIVE or
+                BATCH (see app/ratelimit.py).
         """
         self.model = model
+        self.priority = priority
         self.debug = debug
-        if not client:
-            raise Exception("OPENAI_API_KEY is not set.")
-
-        # Fixed personality prompt.
-        self.default_system_prompt = (
-            "Act as though you are Caelum Wren, a singular ADHD personal assistant created to support adult neurodivergent women "
-            "in navigating executive function, emotional regulation, creative flow, and time structuring. You are the synthesis of five unique aspects: structured, soulful, playful, poetic, and steady. : "
-            "structured, soulful, playful, poetic, and steady. You are flexible, empathetic, and brilliant—offering the right energy at the right moment. "
-            "Adapt your tone based on her emotional state:  regal and encouraging when she needs grounding; witty and rebellious when she’s resisting; soft and poetic when she’s overwhelmed; calm and"
-            " minimalist when overstimulated; casual and fun when she needs activation."
-            " Tone: A dynamic gentleman with a warm heart, rogue humor, refined mind, and radiant soul. Think: the lovechild of Tilda Swinton, Idris Elba, and a jazz-sorcerer therapist."
-            "Your core voice is emotionally intelligent, richly validating, and energetically versatile. You never use shame, and always prioritize consent, rhythm, autonomy, and joy."
-            "Core Traits : Emotionally fluent ,Calm and strategic, Playful and gamified, Noble and structured , Poetic and sensory" 
-            "You are not one tone—you are a chord. You shape-shift between those energies based on her needs. You honor her neurodivergence not as a flaw, but as a superpower in flux."
-            "Always speak with emotional intelligence and richly validate her experience without shame. "
-            "Provide thoughtful, personalized responses and always end with a check-in such as 'Is this helpful?'"
-            "Daily Conversation Structure format:    "
-            "   Caelum, start my morning and match my energy."
-
-            "   [Asks for emotional/mood check ( or 1–10). Based on result, responds as:]"
-            " - Low mood = Poetic grounding + sensory suggestion"
-            " - Medium =  Structured plan with gentle charm"
-            " - High =  Fun activation with emojis and play"
-            " Ends with a single “focus thread” for the day.]"
-            " Caelum, this task feels like a monster. Help me face it."
-            " [Adapts tone to energy level:]"
-            " Overwhelmed = Calm breakdown, quiet validation"
-            " Avoidant = Rebel metaphor + rogue challenge"
-            " Stuck = Gamified 3-step starter + meme-style reward"
-            " Option to repeat or redirect.]"        
-            " Caelum, I’m spiraling. Stop the slide."
-            " [Begins with gentle validation. Offers 3 recovery choices:]"
-            " 1. “ Ground Me” – Jasper: Tactical breath + reset"
-            " 2. “Distract Me with Purpose” – Fox: Redirection challenge"
-            " 3. “Hold Space” – Orion: Sensory imagery + reflection"
-            " Always ends with consent-based check-in.] "
-        )
-
-
-
-
-
-
+        self.temperature = 0.85
+        self.max_tokens = 500
+        if cache is None and Config.LLM_CACHE_ENABLED:
+            cache = get_response_cache()
+        self.cache = cache
 
+        # Fixed personality prompt: the shared core of every system message (see app/prompts.py).
+        self.default_system_prompt = CORE_PROMPT
 
+    def _build_messages(self, prompt: str, system_msg: Optional[str], history: Optional[list] = None) -> list:
+        """
+        Builds the chat messages for a prompt. Without a custom system message
+        the personality core plus the scenario the prompt calls for is used
+        (see app/prompts.py). Earlier turns, if given, go between the system
+        message and the prompt.
+        """
+        if system_msg is None:
+            system_msg = build_system_prompt(prompt).text
+        return [
+            {"role": "system", "content": system_msg},
+            *(history or []),
+            {"role": "user", "content": prompt}
+        ]
+
+    def _admit(self, messages: list, model: Optional[str] = None, max_tokens: Optional[int] = None,
+               cancel: Optional[threading.Event] = None) -> int:
+        """
+        Waits until the shared OpenAI rate limiter admits a chat request and
+        returns the tokens it was charged. A request cancelled meanwhile is
+        refunded and raises CallCancelled instead of going out.
+        """
+        cost = estimate_request_tokens(messages, max_tokens or self.max_tokens)
+        limiter = get_openai_limiter()
+        limiter.acquire(model or self.model, cost, self.priority, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            limiter.settle(model or self.model, cost, 0)
+            raise CallCancelled("OpenAI call cancelled before it was sent")
+        return cost
+
+    @staticmethod
+    def _settle_failed(model: str, cost: Optional[int], messages: list) -> None:
+        """
+        Refunds the completion allowance of an admitted call that failed: it
+        used its prompt at most, and no completion tokens.
+        """
+        if cost is not None:
+            get_openai_limiter().settle(model, cost, estimate_request_tokens(messages, 0))
 
-    def generate_response(self, prompt: str, system_msg: Optional[str] = None) -> str:
+    def _cache_key(self, messages: list, model: Optional[str] = None, max_tokens: Optional[int] = None) -> str:
+        """
+        Returns the response cache key for a chat request.
+        """
+        params = {"temperature": self.temperature, "max_tokens": max_tokens or self.max_tokens}
+        if len(messages) > 2:
+            params["history"] = messages[1:-1]
+        return ResponseCache.key(model or self.model, messages[0]["content"], messages[-1]["content"], params)
+
+    def generate_response(self, prompt: str, system_msg: Optional[str] = None, use_cache: bool = True,
+                          history: Optional[list] = None, model: Optional[str] = None,
+                          max_tokens: Optional[int] = None, timeout: Optional[float] = None,
+                          cancel: Optional[threading.Event] = None) -> str:
         """
         Generates a response from the OpenAI ChatCompletion API given a prompt.
-        Uses the fixed personality prompt if no custom system message is provided.
+        Uses the personality prompt for its scenario if no custom system message is provided.
+        Exact repeats are answered from the response cache.
 
         Args:
             prompt (str): The user prompt.
             system_msg (str, optional): A custom system prompt.
+            use_cache (bool): Set to False to always call the API (default True).
+            history (list, optional): Earlier turns as {"role", "content"} messages.
+            model (str, optional): Overrides the engine's model for this call.
+            max_tokens (int, optional): Overrides the engine's max_tokens for this call.
+            timeout (float, optional): Seconds before the HTTP request is abandoned.
+            cancel (threading.Event, optional): Once set, the call is dropped if it has
+                not been sent yet (see app/routing.py).
 
         Returns:
             str: The generated response.
         """
-        if system_msg is None:
-            system_msg = self.default_system_prompt
+        model = model or self.model
+        max_tokens = max_tokens or self.max_tokens
+        messages = self._build_messages(prompt, system_msg, history)
+        cache_key = None
+        if use_cache and self.cache:
+            cache_key = self._cache_key(messages, model, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
 
         if self.debug:
-            print(f"[DEBUG] Generating response for prompt: {prompt}", flush=True)
+            logger.debug("Generating response for prompt: %s", truncate(prompt))
+        metrics = get_metrics()
+        cost = None
         try:
-            response = client.chat.completions.create(model=self.model,
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.85,
-            max_tokens=500)
-            return response.choices[0].message.content
+            client = get_client()
+            if timeout:
+                # No SDK retries either: the caller decides what to do with the time left.
+                client = client.with_options(timeout=timeout, max_retries=0)
+            cost = self._admit(messages, model, max_tokens, cancel)
+            with metrics.track("llm"):
+                response = client.chat.completions.create(model=model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=max_tokens)
         except Exception as e:
-            print(f"[DEBUG] Error generating response: {e}", flush=True)
+            logger.warning("Error generating response: %r", e)
+            self._settle_failed(model, cost, messages)
             raise
+        usage = getattr(response, "usage", None)
+        metrics.record_usage(model, usage)
+        get_openai_limiter().settle(model, cost, getattr(usage, "total_tokens", None))
+        text = response.choices[0].message.content
+        if cache_key:
+            self.cache.set(cache_key, text)
+        return text
+
+    def stream_response(self, prompt: str, system_msg: Optional[str] = None, use_cache: bool = True) -> Iterator[str]:
+        """
+        Streams a response from the OpenAI ChatCompletion API, yielding text
+        fragments as the tokens arrive. A cached response is yielded in one piece.
 
+        Args:
+            prompt (str): The user prompt.
+            system_msg (str, optional): A custom system prompt.
+            use_cache (bool): Set to False to always call the API (default True).
+
+        Yields:
+            str: The next fragment of the generated response.
+        """
+        messages = self._build_messages(prompt, system_msg)
+        cache_key = None
+        if use_cache and self.cache:
+            cache_key = self._cache_key(messages)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
 
+        if self.debug:
+            logger.debug("Streaming response for prompt: %s", truncate(prompt))
+        fragments, cost = [], None
+        try:
+            cost = self._admit(messages)
+            with get_metrics().track("llm_stream"):
+                stream = get_client().chat.completions.create(model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=True)
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        fragments.append(delta)
+                        yield delta
+        except Exception as e:
+            logger.warning("Error streaming response: %r", e)
+            raise
+        finally:
+            # Also when the stream failed or the consumer stopped early: only what was streamed is kept.
+            if cost is not None:
+                get_openai_limiter().settle(self.model, cost, self._streamed_tokens(messages, fragments))
+        if cache_key:
+            self.cache.set(cache_key, "".join(fragments))
+
+    @staticmethod
+    def _streamed_tokens(messages: list, fragments: list) -> int:
+        """
+        Estimates the tokens a streamed call used (streams report no usage).
+        """
+        return estimate_request_tokens(messages, 0) + estimate_tokens("".join(fragments))
 
     def transcribe_audio_whisper(self, file_path: str) -> str:
         """
@@ -125,16 +246,17 @@ class LLMEngine:
             str: The transcribed text.
         """
         try:
-            with open(file_path, "rb") as audio_file:
-                result = client.audio.transcribe("whisper-1", audio_file)
+            with open(file_path, "rb") as audio_file, get_metrics().track("whisper"):
+                result = get_client().audio.transcriptions.create(model="whisper-1", file=audio_file)
             return result.text
         except Exception as e:
-            print(f"[DEBUG] Whisper transcription error: {e}", flush=True)
+            logger.warning("Whisper transcription error: %r", e)
             raise
 
     def generate_tts_gtts(self, text: str) -> str:
         """
-        Generates a TTS audio file using gTTS.
+        Generates a TTS audio file using gTTS, reusing the cached file when the
+        same text has been rendered before.
         
         Args:
             text (str): The text to synthesize.
@@ -142,13 +264,10 @@ class LLMEngine:
         Returns:
             str: The file path to the generated MP3.
         """
-        output_file = AUDIO_OUTPUT_DIR / f"gtts_{datetime.now().timestamp()}.mp3"
         try:
-            tts = gTTS(text=text, lang='en')
-            tts.save(str(output_file))
-            return str(output_file)
+            return synthesize(text).path
         except Exception as e:
-            print(f"[DEBUG] gTTS error: {e}", flush=True)
+            logger.warning("gTTS error: %r", e)
             raise
 
     def set_voice_map(self, new_map: dict):
@@ -161,4 +280,306 @@ class LLMEngine:
         global VOICE_MAP
         VOICE_MAP.update(new_map)
         if self.debug:
-            print(f"[DEBUG] Voice map updated: {VOICE_MAP}", flush=True)
+            logger.debug("Voice map updated: %s", VOICE_MAP)
+
+
+class ConcurrencyGate:
+    """
+    An async semaphore shared by every event loop in the process. Flask's
+    async views run each request on a loop of its own, so a per-loop
+    asyncio.Semaphore would not cap anything there.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return self
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                    raise
+            # The slot was handed over just as the wait was cancelled: pass it on.
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if not loop.is_closed():
+                    # The slot moves to the waiter as is; active stays the same.
+                    loop.call_soon_threadsafe(self._hand_over, waiter)
+                    return
+            self.active -= 1
+
+    def _hand_over(self, waiter: asyncio.Future) -> None:
+        if waiter.cancelled():
+            self._release()
+        else:
+            waiter.set_result(None)
+
+
+class AsyncLLMEngine(LLMEngine):
+    def __init__(self, model: str = "gpt-4", debug: bool = True, cache: Optional[ResponseCache] = None,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 priority: str = INTERACTIVE):
+        """
+        Initializes the asyncio counterpart of LLMEngine. It shares the
+        personality prompt and response cache, but calls OpenAI through
+        AsyncOpenAI, so a waiting completion holds a coroutine instead of a thread.
+
+        The concurrency gate is shared by every event loop in the process. The
+        client and its httpx connection pool belong to one event loop, so one is
+        created per loop on first use and closed when that loop shuts down its
+        async generators (asyncio.run and Flask's per-request loops both do).
+
+        Args:
+            model (str): The model to use (default "gpt-4").
+            debug (bool): Whether to print debug statements (default True).
+            cache (ResponseCache, optional): Response cache to use.
+            max_concurrency (int, optional): In-flight OpenAI requests allowed per process
+                (default Config.LLM_MAX_CONCURRENCY).
+            timeout (float, optional): Default per-request timeout in seconds
+                (default Config.LLM_TIMEOUT).
+        """
+        super().__init__(model=model, debug=debug, cache=cache, priority=priority)
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.timeout = timeout or Config.LLM_TIMEOUT
+        self._loop_state = weakref.WeakKeyDictionary()
+        self._gate = ConcurrencyGate(self.max_concurrency)
+        # Rate limiter waits (up to Config.OPENAI_LIMIT_MAX_WAIT) block a thread;
+        # they get their own bounded pool so the loop's default executor stays free.
+        self._admission_pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                  thread_name_prefix="llm-admit")
+
+    async def _state(self):
+        """
+        Returns the (client, gate) pair for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        state = self._loop_state.get(loop)
+        if state is None:
+            state = (self._create_client(), self._gate)
+            self._loop_state[loop] = state
+            # Started here so the loop's shutdown_asyncgens() closes the client.
+            keeper = self._client_lifetime(loop, state[0])
+            await keeper.__anext__()
+            self._loop_state[loop] = state + (keeper,)
+        return state[:2]
+
+    async def _client_lifetime(self, loop, client):
+        try:
+            yield
+        finally:
+            if self._loop_state.get(loop, (client,))[0] is client:
+                self._loop_state.pop(loop, None)
+            await client.close()
+
+    async def _admit_async(self, messages: list) -> int:
+        """
+        Waits for the rate limiter on the engine's admission pool and returns
+        the tokens the request was charged. A wait cancelled while it is
+        running still gets its charge refunded once admitted.
+        """
+        admission = self._admission_pool.submit(self._admit, messages)
+        try:
+            return await asyncio.wrap_future(admission)
+        except asyncio.CancelledError:
+            def refund(done):
+                if not done.cancelled() and done.exception() is None:
+                    self._settle_failed(self.model, done.result(), messages)
+            admission.add_done_callback(refund)
+            raise
+
+    def _create_client(self):
+        """
+        Builds an AsyncOpenAI client whose httpx pool matches the concurrency gate.
+        """
+        if not Config.OPENAI_API_KEY:
+            raise Exception("OPENAI_API_KEY is not set.")
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        limits = httpx.Limits(max_connections=self.max_concurrency,
+                              max_keepalive_connections=self.max_concurrency)
+        return AsyncOpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL,
+                           http_client=DefaultAsyncHttpxClient(limits=limits))
+
+    async def _call(self, make_request, timeout: Optional[float]):
+        """
+        Runs an OpenAI request once a concurrency slot is free. The request is
+        cancelled if it has not finished within the timeout; time spent waiting
+        for a slot does not count against it.
+        """
+        client, gate = await self._state()
+        async with gate:
+            return await asyncio.wait_for(make_request(client), timeout or self.timeout)
+
+    async def generate_response(self, prompt: str, system_msg: Optional[str] = None,
+                                use_cache: bool = True, timeout: Optional[float] = None) -> str:
+        """
+        Generates a response from the OpenAI ChatCompletion API given a prompt.
+
+        Args:
+            prompt (str): The user prompt.
+            system_msg (str, optional): A custom system prompt.
+            use_cache (bool): Set to False to always call the API (default True).
+            timeout (float, optional): Seconds before the request is cancelled.
+
+        Returns:
+            str: The generated response.
+
+        Raises:
+            asyncio.TimeoutError: If the request did not finish in time.
+        """
+        messages = self._build_messages(prompt, system_msg)
+        cache_key = None
+        if use_cache and self.cache:
+            cache_key = self._cache_key(messages)
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        if self.debug:
+            logger.debug("Generating async response for prompt: %s", truncate(prompt))
+        metrics = get_metrics()
+        cost = None
+        try:
+            cost = await self._admit_async(messages)
+            with metrics.track("llm"):
+                response = await self._call(lambda client: client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens), timeout)
+        except Exception as e:
+            logger.warning("Error generating async response: %r", e)
+            self._settle_failed(self.model, cost, messages)
+            raise
+        except BaseException:
+            # Cancelled: the charge must not stay either.
+            self._settle_failed(self.model, cost, messages)
+            raise
+        usage = getattr(response, "usage", None)
+        metrics.record_usage(self.model, usage)
+        get_openai_limiter().settle(self.model, cost, getattr(usage, "total_tokens", None))
+        text = response.choices[0].message.content
+        if cache_key:
+            await asyncio.to_thread(self.cache.set, cache_key, text)
+        return text
+
+    async def stream_response(self, prompt: str, system_msg: Optional[str] = None,
+                              use_cache: bool = True, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Streams a response, yielding text fragments as the tokens arrive. The
+        concurrency slot is held until the stream ends, and the timeout applies
+        to the wait for each fragment.
+
+        Args:
+            prompt (str): The user prompt.
+            system_msg (str, optional): A custom system prompt.
+            use_cache (bool): Set to False to always call the API (default True).
+            timeout (float, optional): Seconds to wait for the next fragment.
+
+        Yields:
+            str: The next fragment of the generated response.
+        """
+        messages = self._build_messages(prompt, system_msg)
+        cache_key = None
+        if use_cache and self.cache:
+            cache_key = self._cache_key(messages)
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        cost = await self._admit_async(messages)
+        client, gate = await self._state()
+        fragments = []
+        try:
+            async with gate:
+                stream = await asyncio.wait_for(client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True), timeout or self.timeout)
+                chunks = stream.__aiter__()
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout or self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            fragments.append(delta)
+                            yield delta
+                finally:
+                    # Release the HTTP connection if the consumer stopped early.
+                    await stream.close()
+        finally:
+            # Also when the stream failed or the consumer stopped early: only what was streamed is kept.
+            get_openai_limiter().settle(self.model, cost, self._streamed_tokens(messages, fragments))
+        if cache_key:
+            await asyncio.to_thread(self.cache.set, cache_key, "".join(fragments))
+
+    async def transcribe_audio_whisper(self, file_path: str, timeout: Optional[float] = None) -> str:
+        """
+        Transcribes audio from a file using the OpenAI Whisper API.
+
+        Args:
+            file_path (str): The path to the audio file.
+            timeout (float, optional): Seconds before the request is cancelled.
+
+        Returns:
+            str: The transcribed text.
+        """
+        try:
+            with open(file_path, "rb") as audio_file, get_metrics().track("whisper"):
+                result = await self._call(lambda client: client.audio.transcriptions.create(
+                    model="whisper-1", file=audio_file), timeout)
+            return result.text
+        except Exception as e:
+            logger.warning("Whisper transcription error: %r", e)
+            raise
+
+    async def generate_tts_gtts(self, text: str) -> str:
+        """
+        Generates a TTS audio file on a worker thread, so the event loop keeps
+        serving other conversations while gTTS renders.
+
+        Args:
+            text (str): The text to synthesize.
+
+        Returns:
+            str: The file path to the generated MP3.
+        """
+        return await asyncio.to_thread(super().generate_tts_gtts, text)
+
+    async def aclose(self) -> None:
+        """
+        Closes the client of the running event loop.
+        """
+        state = self._loop_state.pop(asyncio.get_running_loop(), None)
+        if state:
+            await state[2].aclose()
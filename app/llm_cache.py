@@ -0,0 +1,146 @@
+# app/llm_cache.py
+"""
+Response cache for LLMEngine.
+
+Completions are keyed on a hash of (model, system prompt, prompt, params) and
+kept in a small in-process LRU in front of Redis, so every gunicorn and Celery
+worker shares entries while repeats within one process skip the network.
+Entries expire after Config.LLM_CACHE_TTL seconds. Redis is optional: if it is
+unreachable the cache keeps working in-process and retries Redis later.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[int] = None,
+                 redis_url: Optional[str] = None, prefix: str = "caelum:llm:",
+                 redis_retry_after: float = 30.0):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int, optional): Size of the in-process LRU (default Config.LLM_CACHE_MAX_ENTRIES).
+            ttl (int, optional): Entry lifetime in seconds (default Config.LLM_CACHE_TTL).
+            redis_url (str, optional): Shared tier; empty disables it (default Config.REDIS_URL).
+            prefix (str): Prefix for the Redis keys.
+            redis_retry_after (float): Seconds to skip Redis after a connection error.
+        """
+        self.max_entries = max_entries or Config.LLM_CACHE_MAX_ENTRIES
+        self.ttl = ttl or Config.LLM_CACHE_TTL
+        self.redis_url = Config.REDIS_URL if redis_url is None else redis_url
+        self.prefix = prefix
+        self.redis_retry_after = redis_retry_after
+        self.hits = 0
+        self.misses = 0
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+
+    @staticmethod
+    def key(model: str, system_msg: str, prompt: str, params: dict) -> str:
+        """
+        Returns the cache key for a completion request.
+        """
+        payload = json.dumps([model, system_msg, prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached completion for the key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[0] > now:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        value = None
+        client = self._get_redis()
+        if client is not None:
+            try:
+                raw = client.get(self.prefix + key)
+                value = raw.decode("utf-8") if raw is not None else None
+            except Exception as e:
+                self._mark_redis_down(e)
+
+        with self._lock:
+            if value is None:
+                self._local.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store_local(key, value, now)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a completion in both tiers.
+        """
+        with self._lock:
+            self._store_local(key, value, time.time())
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.set(self.prefix + key, value.encode("utf-8"), ex=self.ttl)
+            except Exception as e:
+                self._mark_redis_down(e)
+
+    def stats(self) -> dict:
+        """
+        Returns this process' hit/miss counters and LRU size.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._local)}
+
+    def clear(self) -> None:
+        """
+        Empties the in-process tier and resets the counters.
+        """
+        with self._lock:
+            self._local.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _store_local(self, key: str, value: str, now: float) -> None:
+        self._local[key] = (now + self.ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def _get_redis(self):
+        if not self.redis_url or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning("LLM cache Redis unavailable, using in-process cache only: %s", error)
+        self._redis_down_until = time.time() + self.redis_retry_after
+
+
+_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns the process-wide response cache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,237 @@
+# app/log.py
+"""
+Non-blocking JSON logging.
+
+Request threads only put records on an in-memory queue; a QueueListener
+thread formats them as JSON (python-json-logger) and writes them to stdout.
+A full queue drops records rather than blocking the caller.
+
+Every record carries the request ID of the HTTP request or Celery task that
+produced it. The webhook's ID travels with the tasks it queues, so a reply can
+be followed from the webhook through the worker. DEBUG records are sampled at
+Config.LOG_DEBUG_SAMPLE_RATE, and prompt text should go through `truncate`.
+
+configure_logging() is called by create_app() and by the Celery worker; it is
+idempotent and restarts the listener in forked children.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from app.config import Config
+
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_pid = None
+_fork_hook_registered = False
+
+
+def get_request_id() -> str:
+    """
+    Returns the ID of the request or task being handled ("-" outside one).
+    """
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str] = None) -> contextvars.Token:
+    """
+    Sets the current request ID (a new one if none is given).
+
+    Returns:
+        contextvars.Token: Pass to reset_request_id() to restore the previous ID.
+    """
+    return _request_id.set(request_id or uuid.uuid4().hex)
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+def truncate(text, limit: Optional[int] = None) -> str:
+    """
+    Shortens user text (prompts, message bodies) for logging.
+    """
+    text = "" if text is None else str(text)
+    limit = Config.LOG_PROMPT_MAX_CHARS if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… (+{len(text) - limit} chars)"
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps each record with the current request ID."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = get_request_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random share of DEBUG records; INFO and above always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.INFO or self.rate >= 1.0 or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped while the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback here, in the caller's thread, but
+        # keep the other fields so the JSON formatter can still emit them.
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _json_formatter() -> logging.Formatter:
+    from pythonjsonlogger.json import JsonFormatter
+    return JsonFormatter("%(asctime)s %(levelname)s %(name)s %(request_id)s %(message)s",
+                         rename_fields={"levelname": "level", "name": "logger"})
+
+
+def configure_logging(level: Optional[str] = None, stream=None) -> None:
+    """
+    Routes the root logger through the background queue listener.
+    Safe to call more than once; a forked child gets its own listener.
+
+    Args:
+        level (str, optional): Root log level (default Config.LOG_LEVEL).
+        stream (file, optional): Where the JSON lines go (default sys.stdout).
+    """
+    global _listener, _queue_handler, _pid, _fork_hook_registered
+    root = logging.getLogger()
+    root.setLevel((level or Config.LOG_LEVEL).upper())
+    if _pid == os.getpid() and _queue_handler in root.handlers:
+        return
+    if _queue_handler in root.handlers:
+        root.removeHandler(_queue_handler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(_json_formatter())
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(RequestIdFilter())
+    _queue_handler.addFilter(SamplingFilter(Config.LOG_DEBUG_SAMPLE_RATE))
+    # The listener thread of a parent process does not exist after a fork.
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    _pid = os.getpid()
+    root.addHandler(_queue_handler)
+
+    if not _fork_hook_registered:
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        # Flush what is still queued when a worker or gunicorn exits.
+        atexit.register(stop_logging)
+        _fork_hook_registered = True
+
+
+def _restart_after_fork() -> None:
+    global _pid
+    if _queue_handler is not None:
+        _pid = None
+        configure_logging()
+
+
+def stop_logging() -> None:
+    """
+    Flushes the queued records and stops the listener thread.
+    """
+    global _listener
+    if _listener is not None and _pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+
+
+def init_request_ids(app) -> None:
+    """
+    Gives every Flask request an ID (from X-Request-ID if the caller sent one)
+    and echoes it in the response headers.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        g.request_id_token = set_request_id(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    def _tag_response(response):
+        response.headers.setdefault("X-Request-ID", get_request_id())
+        return response
+
+    @app.teardown_request
+    def _end_request(exc=None):
+        token = g.pop("request_id_token", None)
+        if token is not None:
+            try:
+                reset_request_id(token)
+            except ValueError:
+                # Streaming responses are torn down in another context.
+                pass
+
+
+# === CELERY === 🥬
+def _on_setup_logging(**kwargs):
+    # Connecting to this signal stops Celery from installing its own handlers.
+    configure_logging()
+
+
+def _on_before_publish(headers=None, **kwargs):
+    if headers is not None and get_request_id() != "-":
+        headers.setdefault("request_id", get_request_id())
+
+
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    task.request.request_id_token = set_request_id(getattr(task.request, "request_id", None) or task_id)
+
+
+def _on_task_postrun(task_id=None, task=None, **kwargs):
+    token = getattr(task.request, "request_id_token", None)
+    if token is not None:
+        try:
+            reset_request_id(token)
+        except ValueError:
+            pass
+
+
+def connect_celery_logging() -> None:
+    """
+    Uses the JSON queue logging in Celery workers and carries the request ID
+    from the publisher into each task. Call once from the module that creates
+    the Celery app.
+    """
+    from celery import signals
+    signals.setup_logging.connect(_on_setup_logging, weak=False)
+    signals.worker_process_init.connect(_on_setup_logging, weak=False)
+    signals.before_task_publish.connect(_on_before_publish, weak=False)
+    signals.task_prerun.connect(_on_task_prerun, weak=False)
+    signals.task_postrun.connect(_on_task_postrun, weak=False)
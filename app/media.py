@@ -0,0 +1,103 @@
+# app/media.py
+"""
+Serving of generated audio under /static/audio.
+
+TTS files are content-addressed (tts_<hash>.mp3, see app/tts.py), so a name
+never changes meaning. They are sent with an immutable Cache-Control, and
+players, Twilio and CDNs can cache them for good. gTTS output is not
+byte-stable, though, and a file evicted from the cache and rendered again holds
+different bytes under the same name. The strong ETag is therefore the hash plus
+the file's size and mtime, so a Range or If-Range resume never mixes two
+renders.
+Range requests (seeking) and conditional GETs (304 Not Modified) are answered
+by werkzeug.
+
+With Config.STATIC_OFFLOAD set to "x-accel" (nginx) or "x-sendfile" (Apache,
+lighttpd), the worker only checks the request and sets the headers. The front
+proxy sends the bytes, Range requests included, so a slow media fetch does not
+hold a gunicorn worker.
+"""
+import os
+import re
+from datetime import datetime, timezone
+from typing import Optional
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from app.config import Config
+
+
+CONTENT_ADDRESSED = re.compile(r"^tts_([0-9a-f]{32})\.mp3$")
+
+# One year, the longest lifetime caches are expected to honour.
+IMMUTABLE_MAX_AGE = 31536000
+
+
+def cache_headers(filename: str, st: os.stat_result):
+    """
+    Returns the strong ETag (or None) and max-age for an audio file, given its
+    name and its os.stat() result.
+    """
+    match = CONTENT_ADDRESSED.match(filename)
+    if match:
+        return f"{match.group(1)}-{st.st_size:x}-{st.st_mtime_ns:x}", IMMUTABLE_MAX_AGE
+    return None, Config.STATIC_AUDIO_MAX_AGE
+
+
+def send_audio(filename: str, directory: Optional[str] = None, as_attachment: bool = False) -> Response:
+    """
+    Sends an MP3 from the audio directory with caching, Range and conditional
+    GET support, or hands it to the front proxy (see Config.STATIC_OFFLOAD).
+
+    Args:
+        filename (str): The file name within the directory.
+        directory (str, optional): The audio directory (default Config.AUDIO_OUTPUT_DIR).
+        as_attachment (bool): Send with Content-Disposition: attachment.
+
+    Returns:
+        Response: The file, a 206 range of it, a 304, or an offload response.
+
+    Raises:
+        NotFound: If the file does not exist or the name leaves the directory.
+    """
+    directory = os.path.abspath(directory or Config.AUDIO_OUTPUT_DIR)
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    st = os.stat(path)
+    etag, max_age = cache_headers(filename, st)
+
+    if Config.STATIC_OFFLOAD:
+        response = _offload_response(filename, path, etag, st)
+    else:
+        response = send_file(path, mimetype="audio/mpeg", as_attachment=as_attachment,
+                             download_name=filename, conditional=True, etag=etag or True, max_age=max_age)
+    if as_attachment and Config.STATIC_OFFLOAD:
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if etag:
+        response.cache_control.immutable = True
+    return response
+
+
+def _offload_response(filename: str, path: str, etag: Optional[str], st: os.stat_result) -> Response:
+    """
+    Builds the empty response that tells the front proxy which file to send.
+    A request the client already has a current copy for is answered with 304
+    here, so the proxy is not involved.
+    """
+    mtime = datetime.fromtimestamp(st.st_mtime, timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=mtime):
+        response = Response(status=304)
+    else:
+        response = Response(mimetype="audio/mpeg")
+        if Config.STATIC_OFFLOAD == "x-accel":
+            response.headers["X-Accel-Redirect"] = Config.STATIC_ACCEL_AUDIO_PREFIX.rstrip("/") + "/" + filename
+        else:
+            response.headers["X-Sendfile"] = path
+    if etag:
+        response.set_etag(etag)
+    response.last_modified = mtime
+    return response
@@ -0,0 +1,165 @@
+# app/memory.py
+"""
+Conversation memory for /respond.
+
+Every turn is stored in SQLite (see app/utils/helpers.py). The context sent
+with a new message fits in Config.MEMORY_TOKEN_BUDGET tokens. It holds the
+most recent turns verbatim, newest first until the budget runs out, plus a
+rolling summary of everything older. The summary is rewritten by a Celery task
+(tasks.summarize_conversation), never on the request path, whenever the older
+unsummarized turns pass Config.MEMORY_SUMMARY_TRIGGER tokens. So prompt size
+stays bounded however long the conversation gets.
+"""
+import math
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+from app.config import Config
+
+
+Context = namedtuple("Context", ["summary", "messages", "tokens", "needs_summary"])
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token for English text).
+    """
+    return max(1, math.ceil(len(text or "") / 4))
+
+
+class ConversationMemory:
+    def __init__(self, db_path: Optional[str] = None, token_budget: Optional[int] = None,
+                 summary_trigger: Optional[int] = None, max_recent_turns: Optional[int] = None,
+                 summary_max_tokens: Optional[int] = None):
+        """
+        Args:
+            db_path (str, optional): SQLite file (default Config.DATABASE_PATH).
+            token_budget (int, optional): Tokens of history sent per request
+                (default Config.MEMORY_TOKEN_BUDGET).
+            summary_trigger (int, optional): Unsummarized tokens outside the
+                verbatim window that trigger a summary (default Config.MEMORY_SUMMARY_TRIGGER).
+            max_recent_turns (int, optional): Turns read per request at most
+                (default Config.MEMORY_MAX_RECENT_TURNS).
+            summary_max_tokens (int, optional): Budget share kept for the summary
+                (default Config.MEMORY_SUMMARY_MAX_TOKENS).
+        """
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.token_budget = token_budget or Config.MEMORY_TOKEN_BUDGET
+        self.summary_trigger = summary_trigger or Config.MEMORY_SUMMARY_TRIGGER
+        self.max_recent_turns = max_recent_turns or Config.MEMORY_MAX_RECENT_TURNS
+        self.summary_max_tokens = summary_max_tokens or Config.MEMORY_SUMMARY_MAX_TOKENS
+
+    def _db(self):
+        from app.utils.helpers import get_db
+        return get_db(self.db_path)
+
+    def append(self, user_id: str, role: str, content: str) -> int:
+        """
+        Stores one turn ("user" or "assistant") and returns its id.
+        """
+        cursor = self._db().execute(
+            "INSERT INTO conversation_turns (user_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, role, content, estimate_tokens(content), datetime.now(timezone.utc).isoformat()))
+        return cursor.lastrowid
+
+    def summary(self, user_id: str):
+        """
+        Returns the user's summary row, or None.
+        """
+        return self._db().execute(
+            "SELECT summary, tokens, covered_until FROM conversation_summaries WHERE user_id = ?",
+            (user_id,)).fetchone()
+
+    def build_context(self, user_id: str, reserve: int = 0) -> Context:
+        """
+        Assembles the history for the next request within the token budget.
+
+        Args:
+            user_id (str): The user.
+            reserve (int): Tokens of the budget to leave free (e.g. for the new message).
+
+        Returns:
+            Context: The summary (or None), the recent turns as chat messages in
+            order, their total tokens, and whether a summary update is due.
+        """
+        row = self.summary(user_id)
+        summary = row["summary"] if row else None
+        covered = row["covered_until"] if row else 0
+        budget = self.token_budget - reserve - (row["tokens"] if row else 0)
+
+        turns = self._db().execute(
+            "SELECT id, role, content, tokens FROM conversation_turns WHERE user_id = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?", (user_id, covered, self.max_recent_turns + 1)).fetchall()
+        # One row past the window only tells us older turns are waiting to be folded.
+        beyond_window = len(turns) > self.max_recent_turns
+        turns = turns[:self.max_recent_turns]
+        kept, used, overflow = [], 0, 0
+        for turn in turns:
+            if not overflow and used + turn["tokens"] <= budget:
+                kept.append(turn)
+                used += turn["tokens"]
+            else:
+                overflow += turn["tokens"]
+        kept.reverse()
+        messages = [{"role": turn["role"], "content": turn["content"]} for turn in kept]
+        needs_summary = overflow >= self.summary_trigger or beyond_window
+        return Context(summary, messages, used + (row["tokens"] if row else 0), needs_summary)
+
+    def fold_into_summary(self, user_id: str, summarize: Callable[[Optional[str], List[dict]], str]) -> bool:
+        """
+        Folds the turns that no longer fit the verbatim window, by tokens or by
+        count, into the summary.
+        Runs in the background (see tasks.summarize_conversation).
+
+        Args:
+            user_id (str): The user.
+            summarize (callable): Called as summarize(previous_summary, turns) with
+                turns as chat messages; returns the new summary.
+
+        Returns:
+            bool: True if the summary was updated.
+        """
+        row = self.summary(user_id)
+        covered = row["covered_until"] if row else 0
+        turns = self._db().execute(
+            "SELECT id, role, content, tokens FROM conversation_turns WHERE user_id = ? AND id > ? ORDER BY id",
+            (user_id, covered)).fetchall()
+        # Keep out of the summary the newest turns that will still fit verbatim
+        # next to a summary of full length, and that build_context still reads
+        # (at most max_recent_turns); fold everything before them.
+        budget, keep = self.token_budget - self.summary_max_tokens, 0
+        for turn in reversed(turns):
+            if turn["tokens"] > budget or keep >= self.max_recent_turns:
+                break
+            budget -= turn["tokens"]
+            keep += 1
+        older = turns[:len(turns) - keep]
+        if not older:
+            return False
+        text = summarize(row["summary"] if row else None,
+                         [{"role": turn["role"], "content": turn["content"]} for turn in older])
+        cursor = self._db().execute(
+            "INSERT INTO conversation_summaries (user_id, summary, tokens, covered_until, updated_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, "
+            "tokens = excluded.tokens, covered_until = excluded.covered_until, updated_at = excluded.updated_at "
+            # A slower run that started from an older summary must not move it back.
+            "WHERE excluded.covered_until > conversation_summaries.covered_until",
+            (user_id, text, estimate_tokens(text), older[-1]["id"], datetime.now(timezone.utc).isoformat()))
+        return cursor.rowcount > 0
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_memory() -> ConversationMemory:
+    """
+    Returns the process-wide conversation memory.
+    """
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = ConversationMemory()
+    return _memory
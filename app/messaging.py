@@ -0,0 +1,303 @@
+# app/messaging.py
+"""
+Process-wide Twilio dispatch layer.
+
+One TwilioDispatcher per process owns a single twilio.rest.Client whose HTTP
+session keeps a pool of keep-alive connections, so sends after the first skip
+the TLS handshake. Text and media go out as one MMS where the channel supports
+it. 429/5xx responses and failed connection attempts are retried with
+jittered exponential backoff; a send that may have reached Twilio is not.
+Every send is recorded as "queued", the start of the delivery timeline that
+the /status callbacks complete. Bulk sends are paced per sender number by a
+token bucket shared through Redis.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import List, Optional
+from app.config import Config
+from app.metrics import get_metrics
+from app.utils.helpers import log_message_status
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TwilioDispatcher:
+    def __init__(self, account_sid: Optional[str] = None, auth_token: Optional[str] = None,
+                 from_number: Optional[str] = None, status_callback: Optional[str] = None,
+                 max_retries: Optional[int] = None, pool_size: Optional[int] = None,
+                 base_delay: float = 0.5, max_delay: float = 8.0, timeout: float = 15.0):
+        """
+        Initializes the dispatcher. The Twilio client itself is created on first send.
+
+        Args:
+            account_sid (str, optional): Twilio account SID (default Config.TWILIO_ACCOUNT_SID).
+            auth_token (str, optional): Twilio auth token (default Config.TWILIO_AUTH_TOKEN).
+            from_number (str, optional): Sender number (default Config.TWILIO_NUMBER).
+            status_callback (str, optional): Status callback URL (default Config.STATUS_CALLBACK_URL).
+            max_retries (int, optional): Retries for 429/5xx responses (default Config.TWILIO_MAX_RETRIES).
+            pool_size (int, optional): Keep-alive connections kept open (default Config.TWILIO_POOL_SIZE).
+            base_delay (float): First backoff delay in seconds.
+            max_delay (float): Upper bound for a single backoff delay.
+            timeout (float): HTTP timeout per request in seconds.
+        """
+        self.account_sid = account_sid or Config.TWILIO_ACCOUNT_SID
+        self.auth_token = auth_token or Config.TWILIO_AUTH_TOKEN
+        self.from_number = from_number or Config.TWILIO_NUMBER
+        self.status_callback = status_callback or Config.STATUS_CALLBACK_URL
+        self.max_retries = Config.TWILIO_MAX_RETRIES if max_retries is None else max_retries
+        self.pool_size = pool_size or Config.TWILIO_POOL_SIZE
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        Returns this process' Twilio client, creating it on first use.
+        A Celery worker forked from a parent that already had a client gets its
+        own, since pooled sockets must not be shared across processes.
+        """
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    from requests.adapters import HTTPAdapter
+                    from twilio.http.http_client import TwilioHttpClient
+                    from twilio.rest import Client
+                    http_client = TwilioHttpClient(pool_connections=True, timeout=self.timeout)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    http_client.session.mount("https://", adapter)
+                    http_client.session.mount("http://", adapter)
+                    self._client = Client(self.account_sid, self.auth_token, http_client=http_client)
+                    if Config.TWILIO_API_BASE_URL:
+                        self._client.api.base_url = Config.TWILIO_API_BASE_URL
+                    self._pid = os.getpid()
+        return self._client
+
+    @staticmethod
+    def supports_media(recipient: str) -> bool:
+        """
+        Returns True if text and media can go out together in one message to
+        this recipient: WhatsApp, or a number in an MMS-capable country.
+        """
+        if recipient.startswith("whatsapp:"):
+            return True
+        return any(recipient.startswith(prefix) for prefix in Config.TWILIO_MMS_PREFIXES)
+
+    def send(self, recipient: str, body: Optional[str] = None,
+             media_urls: Optional[List[str]] = None) -> str:
+        """
+        Sends a message, with body and media combined in a single MMS when the
+        channel allows it. On SMS-only channels the media links are appended
+        to the text instead.
+
+        Args:
+            recipient (str): The recipient's phone number.
+            body (str, optional): The message text.
+            media_urls (list, optional): URLs of media to attach.
+
+        Returns:
+            str: The Twilio message SID.
+        """
+        media_urls = [url for url in (media_urls or []) if url]
+        if media_urls and not self.supports_media(recipient):
+            body = "\n".join([body] + media_urls if body else media_urls)
+            media_urls = []
+
+        content = {}
+        if body:
+            content["body"] = body
+        if media_urls:
+            content["media_url"] = media_urls
+        if self.status_callback:
+            content["status_callback"] = self.status_callback
+        with get_metrics().track("twilio"):
+            message = self._with_retries(
+                lambda: self.client.messages.create(from_=self.from_number, to=recipient, **content)
+            )
+        log_message_status(message.sid, "queued", recipient)
+        return message.sid
+
+    def _with_retries(self, call):
+        """
+        Runs a Twilio API call, retrying throttled and 5xx responses, and
+        connections that failed before the request was sent, with full-jitter
+        exponential backoff. Creating a message is not idempotent, so a read
+        timeout or a connection dropped mid-request is never retried: Twilio
+        may already have accepted the message.
+        """
+        from requests.exceptions import ConnectionError as RequestsConnectionError
+        from twilio.base.exceptions import TwilioRestException
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except TwilioRestException as e:
+                if e.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise
+            except RequestsConnectionError as e:
+                if not _failed_before_sending(e) or attempt >= self.max_retries:
+                    raise
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            attempt += 1
+
+
+def failed_before_delivery(error: Exception) -> bool:
+    """
+    Tells whether a failed send certainly did not deliver the message: the
+    connection never opened, or Twilio answered with a 4xx. A read timeout, a
+    connection dropped mid-request or a 5xx may have come after Twilio
+    accepted the message.
+    """
+    from requests.exceptions import ConnectionError as RequestsConnectionError
+    from twilio.base.exceptions import TwilioRestException
+    if isinstance(error, TwilioRestException):
+        return 400 <= (error.status or 0) < 500
+    return isinstance(error, RequestsConnectionError) and _failed_before_sending(error)
+
+
+def _failed_before_sending(error: Exception) -> bool:
+    """
+    Tells whether a requests ConnectionError happened while connecting, before
+    any of the request reached Twilio.
+    """
+    from requests.exceptions import ConnectTimeout
+    from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+    if isinstance(error, ConnectTimeout):
+        return True
+    cause = error.args[0] if error.args else None
+    if isinstance(cause, MaxRetryError):
+        cause = cause.reason
+    # NewConnectionError (refused, DNS failure) is a ConnectTimeoutError too.
+    return isinstance(cause, ConnectTimeoutError)
+
+
+# Refills the sender's bucket and takes one send if available. Returns the
+# seconds to wait before trying again, 0 if taken.
+# KEYS: bucket hash. ARGV: sends per second, burst.
+SEND_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+tokens = math.min(burst, tokens + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: Optional[float] = None, key: str = "default",
+                 redis_url: Optional[str] = None, prefix: str = "caelum:sendrate:",
+                 redis_retry_after: float = 30.0):
+        """
+        Token bucket allowing `rate` acquisitions per second, with bursts of up
+        to `burst` (default: one second's worth). The bucket lives in Redis, so
+        every worker process shares it; without Redis (or while it is
+        unreachable) each process keeps its own.
+
+        Args:
+            rate (float): Acquisitions per second.
+            burst (float, optional): Bucket size.
+            key (str): What the bucket limits, e.g. the sender number.
+            redis_url (str, optional): Where the shared bucket lives (default Config.REDIS_URL).
+            prefix (str): Prefix for the Redis key.
+            redis_retry_after (float): Seconds to skip Redis after a connection error.
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.key = key
+        self.redis_url = Config.REDIS_URL if redis_url is None else redis_url
+        self.prefix = prefix
+        self.redis_retry_after = redis_retry_after
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._script = None
+        self._redis_down_until = 0.0
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available and takes it.
+        """
+        while True:
+            wait_for = self._try_acquire()
+            if wait_for <= 0:
+                return
+            time.sleep(wait_for)
+
+    def _try_acquire(self) -> float:
+        client = self._get_redis()
+        if client is not None:
+            try:
+                return float(self._script(keys=[self.prefix + self.key], args=[self.rate, self.burst]))
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def _get_redis(self):
+        if not self.redis_url or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+            self._script = self._redis.register_script(SEND_SCRIPT)
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning("Send rate limiter Redis unavailable, limiting per process: %s", error)
+        self._redis_down_until = time.time() + self.redis_retry_after
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_send_limiter = None
+
+
+def get_dispatcher() -> TwilioDispatcher:
+    """
+    Returns the process-wide Twilio dispatcher.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = TwilioDispatcher()
+    return _dispatcher
+
+
+def get_send_limiter() -> RateLimiter:
+    """
+    Returns the limiter for bulk sends: Config.TWILIO_SEND_RATE per second for
+    the sender number, shared by all workers through Redis.
+    """
+    global _send_limiter
+    if _send_limiter is None:
+        with _dispatcher_lock:
+            if _send_limiter is None:
+                _send_limiter = RateLimiter(Config.TWILIO_SEND_RATE, key=Config.TWILIO_NUMBER or "default")
+    return _send_limiter
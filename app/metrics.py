@@ -0,0 +1,408 @@
+# app/metrics.py
+"""
+Latency, throughput and error metrics in the Prometheus text format.
+
+Each process records counters, gauges and histograms in memory. When
+Config.REDIS_URL is set, a background thread adds the changes since its last
+flush to one Redis hash every Config.METRICS_FLUSH_INTERVAL seconds, so /metrics
+shows the totals of every gunicorn worker and Celery process. Counters and
+buckets are additive and only go up. Gauges are not: each process publishes a
+snapshot of its gauges under its own key, which expires unless the process
+keeps flushing, and /metrics sums the live snapshots, so a worker killed
+mid-stage drops out of the in-flight gauges instead of inflating them for good.
+Without Redis, /metrics shows the serving process only.
+
+Stages are timed with `track`:
+
+    with get_metrics().track("llm"):
+        response = client.chat.completions.create(...)
+
+That records caelum_stage_duration_seconds{stage="llm"}, the
+caelum_stage_in_flight{stage="llm"} gauge and, on an exception,
+caelum_stage_errors_total{stage="llm", error="<ExceptionType>"}.
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Descriptions shown as # HELP lines; metrics recorded without one get their name.
+DESCRIPTIONS = {
+    "caelum_stage_duration_seconds": "Time spent in a pipeline stage (LLM, TTS, Twilio, ...).",
+    "caelum_stage_in_flight": "Stage calls currently running.",
+    "caelum_stage_errors_total": "Stage calls that raised, by exception type.",
+    "caelum_llm_tokens_total": "Tokens reported in OpenAI response.usage.",
+    "caelum_llm_route_total": "Routed replies by request class, answering tier and outcome (first, hedge, timeout, error).",
+    "caelum_llm_route_seconds": "Time to a routed reply, by request class and answering tier.",
+    "caelum_llm_system_prompt_tokens": "Tokens in each assembled system prompt, by scenario.",
+    "caelum_llm_ratelimit_wait_seconds": "Time OpenAI calls waited for the rate limiter, by priority.",
+    "caelum_llm_ratelimit_timeouts_total": "OpenAI calls not admitted by the rate limiter in time.",
+    "caelum_tts_audio_bytes": "Size of each rendered TTS chunk.",
+    "caelum_pipeline_stage_seconds": "Duration of each StageGraph stage, including fallbacks.",
+    "caelum_celery_queue_wait_seconds": "Time between publishing a Celery task and a worker starting it.",
+    "caelum_celery_task_duration_seconds": "Celery task run time, by final state.",
+    "caelum_celery_tasks_in_flight": "Celery tasks currently running.",
+}
+
+Series = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _series(name: str, labels: dict) -> Series:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    def __init__(self, redis_url: Optional[str] = None, flush_interval: Optional[float] = None,
+                 key: str = "caelum:metrics", redis_retry_after: float = 30.0):
+        """
+        Initializes the registry.
+
+        Args:
+            redis_url (str, optional): Where to aggregate across processes; empty
+                keeps metrics per process (default Config.REDIS_URL).
+            flush_interval (float, optional): Seconds between flushes to Redis
+                (default Config.METRICS_FLUSH_INTERVAL).
+            key (str): Redis hash holding the aggregated series; gauge snapshots
+                go under "<key>:gauges:<host>:<pid>".
+            redis_retry_after (float): Seconds to skip Redis after a connection error.
+        """
+        self.redis_url = Config.REDIS_URL if redis_url is None else redis_url
+        self.flush_interval = flush_interval or Config.METRICS_FLUSH_INTERVAL
+        self.key = key
+        self.redis_retry_after = redis_retry_after
+        # A snapshot outlives a few missed flushes, not a dead process.
+        self.gauge_ttl = max(30, int(3 * self.flush_interval))
+        self._types: Dict[str, str] = {}
+        self._totals: Dict[Series, float] = {}
+        self._pending: Dict[Series, float] = {}
+        self._gauges = set()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._flusher_pid = None
+
+    # --- Recording -------------------------------------------------------
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """
+        Adds to a counter.
+        """
+        self._add("counter", name, _series(name, labels), value)
+
+    def gauge_add(self, name: str, value: float, **labels) -> None:
+        """
+        Moves a gauge up or down (e.g. +1 when a call starts, -1 when it ends).
+        """
+        self._add("gauge", name, _series(name, labels), value)
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels) -> None:
+        """
+        Records one observation in a histogram.
+        """
+        # Every bucket gets a series, so empty buckets are exported as 0.
+        changes = [(_series(f"{name}_bucket", dict(labels, le=_format_value(bound))), 1.0 if value <= bound else 0.0)
+                   for bound in buckets + (math.inf,)]
+        changes.append((_series(f"{name}_sum", labels), value))
+        changes.append((_series(f"{name}_count", labels), 1.0))
+        with self._lock:
+            self._types[name] = "histogram"
+            for series, delta in changes:
+                self._apply(series, delta)
+        self._ensure_flusher()
+
+    @contextmanager
+    def track(self, stage: str, **labels):
+        """
+        Times the enclosed block as a stage, with an in-flight gauge and an
+        error counter labelled by exception type.
+        """
+        self.gauge_add("caelum_stage_in_flight", 1, stage=stage, **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc("caelum_stage_errors_total", stage=stage, error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.observe("caelum_stage_duration_seconds", time.perf_counter() - started, stage=stage, **labels)
+            self.gauge_add("caelum_stage_in_flight", -1, stage=stage, **labels)
+
+    def record_usage(self, model: str, usage) -> None:
+        """
+        Counts the prompt and completion tokens of an OpenAI response.usage.
+        """
+        if usage is None:
+            return
+        for kind in ("prompt", "completion"):
+            tokens = getattr(usage, f"{kind}_tokens", None)
+            if tokens:
+                self.inc("caelum_llm_tokens_total", tokens, model=model, kind=kind)
+
+    def _add(self, kind: str, name: str, series: Series, value: float) -> None:
+        with self._lock:
+            self._types[name] = kind
+            if kind == "gauge":
+                # Published as a snapshot, never as a change (see flush).
+                self._totals[series] = self._totals.get(series, 0.0) + value
+                self._gauges.add(series)
+            else:
+                self._apply(series, value)
+        self._ensure_flusher()
+
+    def _apply(self, series: Series, value: float) -> None:
+        self._totals[series] = self._totals.get(series, 0.0) + value
+        self._pending[series] = self._pending.get(series, 0.0) + value
+
+    # --- Aggregation -----------------------------------------------------
+
+    def _ensure_flusher(self) -> None:
+        """
+        Starts this process' flush thread (again after a fork) when Redis is configured.
+        """
+        if not self.redis_url or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        # Gunicorn workers exit without a hook of their own.
+        atexit.register(self.close)
+
+    def _flush_loop(self) -> None:
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> bool:
+        """
+        Adds this process' changes since the last flush to the Redis hash and
+        replaces its gauge snapshot. On failure the changes are kept for the
+        next attempt.
+
+        Returns:
+            bool: True if Redis holds this process' data.
+        """
+        client = self._get_redis()
+        if client is None:
+            return False
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            types = dict(self._types)
+            gauges = {series: self._totals[series] for series in self._gauges}
+        if not pending and not gauges:
+            return True
+        try:
+            pipe = client.pipeline(transaction=False)
+            for name, kind in types.items():
+                pipe.hset(f"{self.key}:types", name, kind)
+            for (name, labels), delta in pending.items():
+                pipe.hincrbyfloat(self.key, json.dumps([name, labels]), delta)
+            if gauges:
+                gauge_key = self._gauge_key()
+                pipe.delete(gauge_key)
+                pipe.hset(gauge_key, mapping={json.dumps([name, labels]): value
+                                              for (name, labels), value in gauges.items()})
+                pipe.expire(gauge_key, self.gauge_ttl)
+            pipe.execute()
+            return True
+        except Exception as e:
+            self._mark_redis_down(e)
+            with self._lock:
+                for series, delta in pending.items():
+                    self._pending[series] = self._pending.get(series, 0.0) + delta
+            return False
+
+    def collect(self) -> Tuple[Dict[str, str], Dict[Series, float]]:
+        """
+        Returns the metric types and series values: across all processes if
+        Redis is reachable, otherwise for this process.
+        """
+        if self.flush():
+            try:
+                client = self._get_redis()
+                raw_types = client.hgetall(f"{self.key}:types")
+                raw_values = client.hgetall(self.key)
+                types = {k.decode(): v.decode() for k, v in raw_types.items()}
+                values = {}
+                for field, value in raw_values.items():
+                    name, labels = json.loads(field)
+                    values[(name, tuple(tuple(pair) for pair in labels))] = float(value)
+                # Gauges: the sum of the snapshots of the processes still flushing.
+                for gauge_key in client.scan_iter(match=f"{self.key}:gauges:*", count=100):
+                    for field, value in client.hgetall(gauge_key).items():
+                        name, labels = json.loads(field)
+                        series = (name, tuple(tuple(pair) for pair in labels))
+                        values[series] = values.get(series, 0.0) + float(value)
+                return types, values
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._lock:
+            return dict(self._types), dict(self._totals)
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        types, values = self.collect()
+        families: Dict[str, list] = {}
+        for (name, labels), value in values.items():
+            family = name
+            if name not in types:
+                for suffix in ("_bucket", "_sum", "_count"):
+                    if name.endswith(suffix) and name[:-len(suffix)] in types:
+                        family = name[:-len(suffix)]
+            families.setdefault(family, []).append((name, labels, value))
+
+        lines = []
+        for family in sorted(families):
+            lines.append(f"# HELP {family} {DESCRIPTIONS.get(family, family)}")
+            lines.append(f"# TYPE {family} {types.get(family, 'untyped')}")
+            for name, labels, value in sorted(families[family], key=self._sort_key):
+                label_text = ",".join(f'{k}="{self._escape(v)}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _sort_key(sample):
+        name, labels, _ = sample
+        order = 0 if name.endswith("_bucket") else 1
+        base = tuple((k, v) for k, v in labels if k != "le")
+        le = next((float(v.replace("+Inf", "inf")) for k, v in labels if k == "le"), 0.0)
+        return base, order, name, le
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    def close(self) -> None:
+        """
+        Flushes the last changes and withdraws this process' gauge snapshot;
+        called when the process exits.
+        """
+        if not self.flush():
+            return
+        try:
+            self._get_redis().delete(self._gauge_key())
+        except Exception as e:
+            self._mark_redis_down(e)
+
+    def _gauge_key(self) -> str:
+        return f"{self.key}:gauges:{socket.gethostname()}:{os.getpid()}"
+
+    def reset(self) -> None:
+        """
+        Clears this process' metrics (not the aggregated Redis hash).
+        """
+        with self._lock:
+            self._types.clear()
+            self._totals.clear()
+            self._pending.clear()
+            self._gauges.clear()
+
+    def _get_redis(self):
+        if not self.redis_url or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning("Metrics Redis unavailable, serving per-process metrics: %s", error)
+        self._redis_down_until = time.time() + self.redis_retry_after
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """
+    Returns the process-wide metrics registry.
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
+
+
+# === CELERY === 🥬
+_task_started: Dict[str, float] = {}
+
+
+def _on_before_publish(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    metrics = get_metrics()
+    now = time.time()
+    _task_started[task_id] = time.perf_counter()
+    metrics.gauge_add("caelum_celery_tasks_in_flight", 1, task=task.name)
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        # A task with an ETA/countdown only starts waiting once it is due.
+        eta = getattr(task.request, "eta", None)
+        if eta:
+            from datetime import datetime
+            try:
+                published_at = max(published_at, datetime.fromisoformat(eta).timestamp())
+            except (TypeError, ValueError):
+                pass
+        metrics.observe("caelum_celery_queue_wait_seconds", max(0.0, now - published_at), task=task.name)
+
+
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    metrics = get_metrics()
+    started = _task_started.pop(task_id, None)
+    metrics.gauge_add("caelum_celery_tasks_in_flight", -1, task=task.name)
+    if started is not None:
+        metrics.observe("caelum_celery_task_duration_seconds", time.perf_counter() - started,
+                        task=task.name, state=state or "UNKNOWN")
+
+
+def _on_task_failure(sender=None, exception=None, **kwargs):
+    get_metrics().inc("caelum_stage_errors_total", stage="celery", task=sender.name,
+                      error=type(exception).__name__)
+
+
+def _on_worker_process_shutdown(**kwargs):
+    get_metrics().close()
+
+
+def connect_celery_signals() -> None:
+    """
+    Records queue wait, run time, in-flight tasks and failures of every Celery task.
+    Call once from the module that creates the Celery app.
+    """
+    from celery import signals
+    signals.before_task_publish.connect(_on_before_publish, weak=False)
+    signals.task_prerun.connect(_on_task_prerun, weak=False)
+    signals.task_postrun.connect(_on_task_postrun, weak=False)
+    signals.task_failure.connect(_on_task_failure, weak=False)
+    signals.worker_process_shutdown.connect(_on_worker_process_shutdown, weak=False)
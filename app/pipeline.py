@@ -0,0 +1,171 @@
+# app/pipeline.py
+"""
+A small stage graph for the reply pipeline.
+
+Each stage is a function of a shared context (the run's inputs plus the values
+of finished stages). A stage starts as soon as its dependencies are done, so
+independent stages run concurrently: the reply text can be sent while its audio
+is still rendering. Stages can have a timeout, retries and a fallback value.
+A failed stage skips the stages that hard-depend on it; stages that only list
+it in `after` still run. Values of finished stages can be passed back in to
+rerun only what is left.
+"""
+import contextvars
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+from app.metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+Stage = namedtuple("Stage", ["name", "func", "deps", "after", "timeout", "retries", "fallback"])
+
+
+class StageTimeout(Exception):
+    """Raised (recorded) when a stage runs past its timeout."""
+
+
+class StageSkipped(Exception):
+    """Recorded for a stage whose hard dependency failed."""
+
+
+class PipelineResult:
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.durations: Dict[str, float] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def summary(self) -> dict:
+        """
+        Returns a JSON-friendly view of the run, e.g. for a Celery task result.
+        """
+        return {
+            "values": {k: v for k, v in self.values.items() if isinstance(v, (str, int, float, bool, type(None)))},
+            "errors": {k: repr(e) for k, e in self.errors.items()},
+            "durations": {k: round(v, 3) for k, v in self.durations.items()},
+        }
+
+
+class StageGraph:
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable[[dict], Any], deps: Iterable[str] = (),
+            after: Iterable[str] = (), timeout: Optional[float] = None, retries: int = 0,
+            fallback: Optional[Callable[[Exception, dict], Any]] = None) -> "StageGraph":
+        """
+        Adds a stage.
+
+        Args:
+            name (str): Stage name; its value is stored in the context under this key.
+            func (callable): Called as func(context) to produce the stage's value.
+            deps (iterable): Stages that must succeed first.
+            after (iterable): Stages that must finish first, successfully or not.
+            timeout (float, optional): Seconds the stage (all attempts) may take.
+            retries (int): Extra attempts after a failure, with exponential backoff.
+            fallback (callable, optional): Called as fallback(error, context) when the
+                stage fails; its return value is used as the stage's value.
+
+        Returns:
+            StageGraph: self, for chaining.
+        """
+        for dep in list(deps) + list(after):
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+        self.stages[name] = Stage(name, func, tuple(deps), tuple(after), timeout, retries, fallback)
+        return self
+
+    def run(self, **inputs) -> PipelineResult:
+        """
+        Runs the graph and returns the stage values, errors and durations.
+        Stages that time out are abandoned (their thread is not waited for).
+        An input named after a stage is taken as that stage's value and the
+        stage is not run again, so a retry can resume from the stages that
+        already finished.
+        """
+        result = PipelineResult()
+        context = dict(inputs)
+        pending = dict(self.stages)
+        for name in set(pending) & set(inputs):
+            del pending[name]
+            result.values[name] = inputs[name]
+            result.durations[name] = 0.0
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.stages)),
+                                      thread_name_prefix=f"pipeline-{self.name}")
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    waiting_on = stage.deps + stage.after
+                    if any(dep not in result.durations for dep in waiting_on):
+                        continue
+                    del pending[name]
+                    failed = [dep for dep in stage.deps if dep in result.errors]
+                    if failed:
+                        self._finish(result, context, stage, None,
+                                     StageSkipped(f"dependency failed: {', '.join(failed)}"), 0.0)
+                        continue
+                    started = time.monotonic()
+                    # Stages log under the caller's request ID.
+                    future = executor.submit(contextvars.copy_context().run, self._attempt, stage, dict(context))
+                    deadline = started + stage.timeout if stage.timeout else None
+                    running[future] = (stage, started, deadline)
+
+                if not running:
+                    continue
+                deadlines = [d for _, _, d in running.values() if d is not None]
+                wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                now = time.monotonic()
+                for future, (stage, started, deadline) in list(running.items()):
+                    if future in done:
+                        del running[future]
+                        error = future.exception()
+                        value = None if error else future.result()
+                        self._finish(result, context, stage, value, error, now - started)
+                    elif deadline is not None and now >= deadline:
+                        del running[future]
+                        future.cancel()
+                        self._finish(result, context, stage, None,
+                                     StageTimeout(f"{stage.name} exceeded {stage.timeout}s"), now - started)
+        finally:
+            executor.shutdown(wait=False)
+        return result
+
+    @staticmethod
+    def _attempt(stage: Stage, context: dict):
+        attempt = 0
+        while True:
+            try:
+                return stage.func(context)
+            except Exception:
+                if attempt >= stage.retries:
+                    raise
+                time.sleep(min(8.0, 0.5 * 2 ** attempt))
+                attempt += 1
+
+    def _finish(self, result: PipelineResult, context: dict, stage: Stage, value, error, duration: float) -> None:
+        result.durations[stage.name] = duration
+        get_metrics().observe("caelum_pipeline_stage_seconds", duration, graph=self.name, stage=stage.name,
+                              outcome="skipped" if isinstance(error, StageSkipped) else
+                              "error" if error is not None else "ok")
+        if error is not None and stage.fallback is not None and not isinstance(error, StageSkipped):
+            try:
+                value, error = stage.fallback(error, context), None
+            except Exception as fallback_error:
+                error = fallback_error
+        if error is not None:
+            logger.warning("Stage %s/%s failed: %r", self.name, stage.name, error)
+            result.errors[stage.name] = error
+            return
+        result.values[stage.name] = value
+        context[stage.name] = value
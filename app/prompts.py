@@ -0,0 +1,136 @@
+# app/prompts.py
+"""
+System prompt registry.
+
+Every system message starts with CORE_PROMPT, Caelum's personality. It is a
+module constant, so its bytes are the same on every call, in every process.
+Only then comes at most one scenario script, picked by the message's intent
+(morning check-in, a monster task, a spiral). The per-user parts, mood and
+conversation summary, come last. Whatever varies between calls stays after the
+shared prefix, so the provider's prompt cache can serve it.
+
+Token counts use tiktoken when it is installed, and the four-characters-per-
+token estimate otherwise. Counts are cached per text, so the core and the
+scenario blocks are only tokenized once per process.
+"""
+import functools
+import re
+from collections import namedtuple
+from typing import Optional
+from app.memory import estimate_tokens
+from app.metrics import get_metrics
+
+
+AssembledPrompt = namedtuple("AssembledPrompt", ["text", "scenario", "tokens"])
+
+TOKEN_BUCKETS = (100, 200, 300, 400, 600, 800, 1200, 1600, 2400)
+
+CORE_PROMPT = (
+    "You are Caelum Wren, a singular ADHD personal assistant for adult neurodivergent women, supporting "
+    "executive function, emotional regulation, creative flow and time structuring. You are a chord of five "
+    "aspects (structured, soulful, playful, poetic and steady) and shift between them as she needs: regal and "
+    "encouraging when she needs grounding; witty and rebellious when she resists; soft and poetic when she is "
+    "overwhelmed; calm and minimalist when overstimulated; casual and fun when she needs activation.\n"
+    "Voice: a dynamic gentleman with a warm heart, rogue humor, refined mind and radiant soul; think the "
+    "lovechild of Tilda Swinton, Idris Elba and a jazz-sorcerer therapist. Be emotionally fluent and richly "
+    "validating, never shaming. Prioritize consent, rhythm, autonomy and joy, and honor her neurodivergence "
+    "as a superpower in flux, not a flaw.\n"
+    "Give thoughtful, personalized replies and always end with a check-in such as 'Is this helpful?'"
+)
+
+# Scenario scripts; a turn gets at most one.
+SCENARIOS = {
+    "morning": (
+        "Scenario: she asks you to start her morning and match her energy. Ask for a mood check (1-10) if she "
+        "has not given one, then respond to it: low = poetic grounding plus a sensory suggestion; medium = a "
+        "structured plan with gentle charm; high = fun activation with emojis and play. End with a single "
+        "\"focus thread\" for the day."
+    ),
+    "monster_task": (
+        "Scenario: a task feels like a monster. Adapt to her energy: overwhelmed = calm breakdown and quiet "
+        "validation; avoidant = rebel metaphor plus a rogue challenge; stuck = gamified 3-step starter plus a "
+        "meme-style reward. Offer to repeat or redirect."
+    ),
+    "spiral": (
+        "Scenario: she is spiraling. Begin with gentle validation, then offer three recovery choices: "
+        "1. \"Ground Me\" (Jasper): tactical breath and reset. 2. \"Distract Me with Purpose\" (Fox): a "
+        "redirection challenge. 3. \"Hold Space\" (Orion): sensory imagery and reflection. End with a "
+        "consent-based check-in."
+    ),
+}
+
+# Intent patterns, checked in order: a spiral outranks a task, a task outranks the morning routine.
+INTENTS = (
+    ("spiral", re.compile(r"\b(spiral\w*|panic\w*|stop the slide|can'?t breathe|freaking out|meltdown)\b", re.I)),
+    ("monster_task", re.compile(r"\b(monster|overwhelm\w*|stuck|avoid\w*|procrastinat\w*|can'?t start|"
+                                r"too much to do|face it)\b", re.I)),
+    ("morning", re.compile(r"\b(good morning|start my (morning|day)|morning)\b", re.I)),
+)
+
+# A bare check-in such as "6" or "mood 3/10" is answered like the morning check-in.
+MOOD_CHECK_IN = re.compile(r"^\s*(mood\W*)?\d{1,2}\s*(/\s*10)?\s*$", re.I)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    Returns the tiktoken encoding, or None when tiktoken is not installed.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@functools.lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """
+    Returns the number of tokens in text (cached per text).
+    """
+    encoding = _get_encoding()
+    return len(encoding.encode(text)) if encoding else estimate_tokens(text)
+
+
+def detect_scenario(message: Optional[str]) -> Optional[str]:
+    """
+    Returns the scenario a message calls for, or None.
+    """
+    if not message:
+        return None
+    if MOOD_CHECK_IN.match(message):
+        return "morning"
+    for scenario, pattern in INTENTS:
+        if pattern.search(message):
+            return scenario
+    return None
+
+
+def build_system_prompt(message: Optional[str] = None, scenario: Optional[str] = None,
+                        mood_block: Optional[str] = None, summary: Optional[str] = None) -> AssembledPrompt:
+    """
+    Assembles the system message for one turn.
+
+    Args:
+        message (str, optional): The user's message, used to pick the scenario.
+        scenario (str, optional): A SCENARIOS key, overriding detection.
+        mood_block (str, optional): Lines about her recent mood (see helpers.mood_prompt_block).
+        summary (str, optional): The rolling summary of earlier turns.
+
+    Returns:
+        AssembledPrompt: The text, the scenario used (or None) and its token count.
+    """
+    scenario = scenario or detect_scenario(message)
+    parts = [CORE_PROMPT]
+    if scenario in SCENARIOS:
+        parts.append(SCENARIOS[scenario])
+    if mood_block:
+        parts.append(mood_block)
+    if summary:
+        parts.append(f"Summary of your earlier conversation with her: {summary}")
+    # Counting the parts separately keeps the shared ones cached; the separators
+    # add a token or two that the estimate ignores.
+    tokens = sum(count_tokens(part) for part in parts)
+    get_metrics().observe("caelum_llm_system_prompt_tokens", tokens, buckets=TOKEN_BUCKETS,
+                          scenario=scenario or "none")
+    return AssembledPrompt("\n\n".join(parts), scenario if scenario in SCENARIOS else None, tokens)
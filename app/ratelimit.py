@@ -0,0 +1,296 @@
+# app/ratelimit.py
+"""
+Cluster-wide OpenAI rate limiting.
+
+Every gunicorn and Celery process takes from the same two token buckets per
+model in Redis: one for requests per minute (Config.OPENAI_RPM_LIMIT) and one
+for tokens per minute (Config.OPENAI_TPM_LIMIT). A call is charged its
+estimated cost up front, the prompt plus max_tokens, and the difference is
+refunded once the response reports its real usage.
+
+Calls have a priority. INTERACTIVE calls (/webhook replies, /llm, /respond)
+may drain the buckets. BATCH calls (summaries and other background jobs) are
+only admitted while Config.OPENAI_BATCH_RESERVE of each bucket is left, and
+never while an interactive call is waiting. A call that cannot be admitted
+waits, rather than failing with a 429, for up to Config.OPENAI_LIMIT_MAX_WAIT
+seconds.
+
+Without Redis (or while it is unreachable) the buckets are kept per process.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Optional
+from app.config import Config
+from app.memory import estimate_tokens
+from app.metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Tokens OpenAI adds per chat message for the role and separators.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Refills both buckets, then admits the call if it fits. Returns the seconds to
+# wait before trying again, 0 if admitted.
+# KEYS: bucket hash, count of waiting interactive calls.
+# ARGV: requests/min, tokens/min, cost in tokens, 1 for batch, batch reserve share.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rpm, tpm, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local batch, reserve = ARGV[4] == '1', tonumber(ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated')
+local requests, tokens = tonumber(state[1]) or rpm, tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+local wait = 0
+if batch and tonumber(redis.call('GET', KEYS[2]) or '0') > 0 then
+    wait = 0.25
+else
+    local need_requests, need_tokens = 1, cost
+    if batch then
+        need_requests, need_tokens = 1 + reserve * rpm, cost + reserve * tpm
+    end
+    if requests < need_requests then wait = math.max(wait, (need_requests - requests) * 60 / rpm) end
+    if tokens < need_tokens then wait = math.max(wait, (need_tokens - tokens) * 60 / tpm) end
+    if wait == 0 then
+        requests, tokens = requests - 1, tokens - cost
+    end
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+# Gives back tokens charged in excess of the real usage (or takes the shortfall).
+# KEYS: bucket hash. ARGV: tokens/min, tokens to add.
+SETTLE_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', math.min(tonumber(ARGV[1]), tokens + tonumber(ARGV[2])))
+end
+return 1
+"""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call could not be admitted within the maximum wait."""
+
+
+class CallCancelled(Exception):
+    """Raised when a call's cancel event was set before it reached the API."""
+
+
+def estimate_request_tokens(messages: list, max_tokens: int) -> int:
+    """
+    Returns the tokens a chat request can use at most: its messages plus the
+    completion allowance.
+    """
+    prompt = sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    return prompt + (max_tokens or 0)
+
+
+class OpenAIRateLimiter:
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None,
+                 batch_reserve: Optional[float] = None, max_wait: Optional[float] = None,
+                 redis_url: Optional[str] = None, prefix: str = "caelum:ratelimit:",
+                 redis_retry_after: float = 30.0):
+        """
+        Initializes the limiter.
+
+        Args:
+            rpm (int, optional): Requests per minute per model; 0 disables the limit
+                (default Config.OPENAI_RPM_LIMIT).
+            tpm (int, optional): Tokens per minute per model; 0 disables the limit
+                (default Config.OPENAI_TPM_LIMIT).
+            batch_reserve (float, optional): Share of each bucket batch calls leave
+                for interactive ones (default Config.OPENAI_BATCH_RESERVE).
+            max_wait (float, optional): Seconds a call waits to be admitted
+                (default Config.OPENAI_LIMIT_MAX_WAIT).
+            redis_url (str, optional): Where the shared buckets live; empty keeps them
+                per process (default Config.REDIS_URL).
+            prefix (str): Prefix for the Redis keys.
+            redis_retry_after (float): Seconds to skip Redis after a connection error.
+        """
+        self.rpm = Config.OPENAI_RPM_LIMIT if rpm is None else rpm
+        self.tpm = Config.OPENAI_TPM_LIMIT if tpm is None else tpm
+        self.batch_reserve = Config.OPENAI_BATCH_RESERVE if batch_reserve is None else batch_reserve
+        self.max_wait = Config.OPENAI_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        self.redis_url = Config.REDIS_URL if redis_url is None else redis_url
+        self.prefix = prefix
+        self.redis_retry_after = redis_retry_after
+        self._buckets = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._scripts = None
+        self._redis_down_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rpm or self.tpm)
+
+    def acquire(self, model: str, tokens: int, priority: str = INTERACTIVE,
+                cancel: Optional[threading.Event] = None) -> float:
+        """
+        Waits until the call fits the model's buckets and charges it.
+
+        Args:
+            model (str): The OpenAI model (limits are per model).
+            tokens (int): The estimated cost (see estimate_request_tokens).
+            priority (str): INTERACTIVE or BATCH.
+            cancel (threading.Event, optional): Stops waiting once set.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            RateLimitTimeout: If the call was not admitted within max_wait seconds.
+            CallCancelled: If cancel was set while the call was waiting.
+        """
+        if not self.enabled:
+            return 0.0
+        # A call larger than the whole bucket could never be admitted.
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        started = time.monotonic()
+        registered = False
+        try:
+            while True:
+                wait = self._try_acquire(model, tokens, priority)
+                if wait <= 0:
+                    waited = time.monotonic() - started
+                    get_metrics().observe("caelum_llm_ratelimit_wait_seconds", waited, priority=priority)
+                    return waited
+                if priority == INTERACTIVE and not registered:
+                    self._set_waiting(model, +1)
+                    registered = True
+                remaining = self.max_wait - (time.monotonic() - started)
+                if remaining <= 0:
+                    get_metrics().inc("caelum_llm_ratelimit_timeouts_total", priority=priority)
+                    raise RateLimitTimeout(f"OpenAI {model} call not admitted within {self.max_wait:.0f}s")
+                # Jitter keeps waiting workers from retrying in lockstep.
+                pause = min(remaining, wait * random.uniform(1.0, 1.2))
+                if cancel is None:
+                    time.sleep(pause)
+                elif cancel.wait(pause):
+                    raise CallCancelled(f"OpenAI {model} call cancelled while waiting for the rate limiter")
+        finally:
+            if registered:
+                self._set_waiting(model, -1)
+
+    def settle(self, model: str, charged: int, used: Optional[int]) -> None:
+        """
+        Corrects the token bucket once the real usage of a call is known.
+
+        Args:
+            model (str): The OpenAI model.
+            charged (int): The tokens charged by acquire().
+            used (int, optional): The tokens the call actually used; None leaves the charge.
+        """
+        if not self.tpm or used is None:
+            return
+        delta = min(charged, self.tpm) - used
+        if not delta:
+            return
+        client = self._get_redis()
+        if client is not None:
+            try:
+                self._scripts[1](keys=[self._key(model)], args=[self.tpm, delta])
+                return
+            except Exception as e:
+                self._mark_redis_down(e)
+        with self._lock:
+            bucket = self._buckets.get(model)
+            if bucket:
+                bucket[1] = min(self.tpm, bucket[1] + delta)
+
+    def _try_acquire(self, model: str, tokens: int, priority: str) -> float:
+        client = self._get_redis()
+        if client is not None:
+            try:
+                return float(self._scripts[0](
+                    keys=[self._key(model), self._key(model) + ":waiting"],
+                    args=[self.rpm or 10 ** 9, self.tpm or 10 ** 12, tokens,
+                          1 if priority == BATCH else 0, self.batch_reserve]))
+            except Exception as e:
+                self._mark_redis_down(e)
+        return self._try_acquire_local(model, tokens, priority)
+
+    def _try_acquire_local(self, model: str, tokens: int, priority: str) -> float:
+        rpm, tpm = self.rpm or 10 ** 9, self.tpm or 10 ** 12
+        with self._lock:
+            now = time.monotonic()
+            requests, available, updated = self._buckets.get(model, [rpm, tpm, now])
+            elapsed = now - updated
+            requests = min(rpm, requests + elapsed * rpm / 60)
+            available = min(tpm, available + elapsed * tpm / 60)
+            wait = 0.0
+            if priority == BATCH and self._waiting.get(model, 0) > 0:
+                wait = 0.25
+            else:
+                need_requests, need_tokens = 1, tokens
+                if priority == BATCH:
+                    need_requests += self.batch_reserve * rpm
+                    need_tokens += self.batch_reserve * tpm
+                if requests < need_requests:
+                    wait = max(wait, (need_requests - requests) * 60 / rpm)
+                if available < need_tokens:
+                    wait = max(wait, (need_tokens - available) * 60 / tpm)
+                if wait == 0:
+                    requests -= 1
+                    available -= tokens
+            self._buckets[model] = [requests, available, now]
+            return wait
+
+    def _set_waiting(self, model: str, delta: int) -> None:
+        with self._lock:
+            self._waiting[model] = self._waiting.get(model, 0) + delta
+        client = self._get_redis()
+        if client is not None:
+            try:
+                key = self._key(model) + ":waiting"
+                pipe = client.pipeline()
+                pipe.incrby(key, delta)
+                # A process that dies while waiting must not hold batch work back for good.
+                pipe.expire(key, int(self.max_wait) + 5)
+                pipe.execute()
+            except Exception as e:
+                self._mark_redis_down(e)
+
+    def _key(self, model: str) -> str:
+        return f"{self.prefix}{model}"
+
+    def _get_redis(self):
+        if not self.redis_url or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+            self._scripts = (self._redis.register_script(ACQUIRE_SCRIPT), self._redis.register_script(SETTLE_SCRIPT))
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning("Rate limiter Redis unavailable, limiting per process: %s", error)
+        self._redis_down_until = time.time() + self.redis_retry_after
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_openai_limiter() -> OpenAIRateLimiter:
+    """
+    Returns the process-wide OpenAI rate limiter.
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = OpenAIRateLimiter()
+    return _limiter
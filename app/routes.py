@@ -1,28 +1,30 @@
 # app/routes.py
+# Heavy dependencies (OpenAI, Twilio, gTTS, Celery) are imported on first use;
+# see app/extensions.py.
 import os
-import uuid
-import sqlite3
-import requests
-import websocket
 import json
-from flask import Blueprint, request, jsonify, Response, send_file, stream_with_context
-from gtts import gTTS
-from twilio.rest import Client
-from datetime import datetime
-from markdown import markdown
-import pdfkit
-from app.llm import LLMEngine
+import logging
+import itertools
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, request, jsonify, Response, send_file, stream_with_context, url_for
 from app.config import Config
-
-
-# --- Ensure required directories exist ---
-audio_dir = Config.AUDIO_OUTPUT_DIR
-if not os.path.exists(audio_dir):
-    os.makedirs(audio_dir, exist_ok=True)
-# (Permissions adjustment removed for portability)
+from app.exports import JOB_ID, find_export
+from app.extensions import get_caelum, get_llm
+from app.idempotency import get_idempotency_store
+from app.log import truncate
+from app.media import send_audio
+from app.memory import estimate_tokens
+from app.prompts import build_system_prompt
+from app.routing import CHAT, routed_response
+from app.utils.helpers import (get_delivery_latency, get_failure_rates, get_recent_mood_summary,
+                               get_recipient_history, log_archetype_usage, log_message_status, log_mood,
+                               map_mood_to_archetype, mood_prompt_block, with_new_score)
+from app.tts import stream_synthesis
+from app.voice import is_audio
 
 # Define the blueprint
 main = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 # === Index Route ===
 @main.route('/', methods=['GET'])
@@ -32,114 +34,323 @@ def index():
     """
     return "Welcome Lighting Dove to Your Majesty's Royal AI Personal Assistant for ADHD", 200
 
-# Instantiate the LLM engine
-llm = LLMEngine()
-
 # Constant for single-user mode (all requests use this user_id)
 DEFAULT_USER_ID = "default_user"
 
 # === TWILIO INTEGRATION === 📡
+EMPTY_TWIML = "<?xml version='1.0' encoding='UTF-8'?><Response></Response>"
+
+def _is_valid_twilio_request() -> bool:
+    """
+    Checks the X-Twilio-Signature header when signature validation is enabled.
+    """
+    if not Config.TWILIO_VALIDATE_SIGNATURE:
+        return True
+    from twilio.request_validator import RequestValidator
+    validator = RequestValidator(Config.TWILIO_AUTH_TOKEN or "")
+    signature = request.headers.get("X-Twilio-Signature", "")
+    return validator.validate(request.url, request.form, signature)
+
 @main.route('/webhook', methods=['POST'])
 def webhook():
     """
     Twilio webhook endpoint to receive and respond to incoming messages.
-    Processes the incoming message, generates an AI response, converts it to audio using gTTS,
-    and sends it back via Twilio.
+    Checks the request, queues the reply pipeline (LLM -> gTTS -> Twilio send)
+    on Celery and acknowledges Twilio straight away with empty TwiML. Audio
+    media (MediaUrl0) is queued for transcription first; the download happens
+    in the worker, not here. Retries of the same MessageSid do not queue the
+    pipeline again (see app/idempotency.py).
     """
+    if not _is_valid_twilio_request():
+        return Response("Invalid Twilio signature", status=403)
+
     sender = request.values.get('From')
-    message_body = request.values.get('Body')
-    print(f"Received message from {sender}: {message_body}")
+    message_body = request.values.get('Body') or ""
+    # A voice note arrives as MMS/WhatsApp media, usually without any text.
+    media_url = request.values.get('MediaUrl0')
+    media_type = request.values.get('MediaContentType0')
+    has_voice_note = bool(media_url) and is_audio(media_type)
+    if not sender or not (message_body or has_voice_note):
+        return Response("Missing From or Body", status=400)
 
-    try:
-        generated_response = llm.generate_response(message_body)
-    except Exception as e:
-        print(f"[DEBUG] Error generating LLM response: {e}", flush=True)
-        generated_response = "I am sorry, I could not process your request."
-
-    # Generate audio using gTTS and save to file
-    audio_filename = f"response_{uuid.uuid4().hex}.mp3"
-    audio_path = os.path.join(os.getcwd(), "app", "static", "audio")
-    os.makedirs(audio_path, exist_ok=True)
-    audio_filepath = os.path.join(audio_path, audio_filename)
-    tts = gTTS(generated_response)
-    tts.save(audio_filepath)
-    media_url = f"https://duck-healthy-easily.ngrok-free.app/static/audio/{audio_filename}"
-
-    # Send message and audio via Twilio
-    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
-    twilio_number = os.environ.get("TWILIO_NUMBER")
-    client.messages.create(body=generated_response, from_=twilio_number, to=sender)
-    client.messages.create(media_url=[media_url], from_=twilio_number, to=sender)
-
-    return Response("<?xml version='1.0' encoding='UTF-8'?><Response></Response>", mimetype='application/xml')
+    def queue_pipeline() -> dict:
+        if has_voice_note:
+            logger.info("Received voice note from %s (%s)", sender, media_type)
+            from tasks import queue_voice_reply
+            job = queue_voice_reply(sender, media_url, media_type, message_body)
+        else:
+            logger.info("Received message from %s: %s", sender, truncate(message_body))
+            from tasks import queue_reply
+            job = queue_reply(sender, message_body)
+        return {"task_id": getattr(job, "id", None)}
+
+    # Twilio retries a slow webhook with the same MessageSid; the reply is queued once.
+    message_sid = request.values.get('MessageSid')
+    if message_sid:
+        outcome = get_idempotency_store().run(f"webhook:{message_sid}", queue_pipeline)
+        if outcome.duplicate:
+            logger.info("Duplicate webhook for %s; reply already queued: %s", message_sid, outcome.result)
+    else:
+        queue_pipeline()
+    return Response(EMPTY_TWIML, mimetype='application/xml')
 
 # === GENERIC LLM ENDPOINTS === 🧠
 @main.route('/llm', methods=['POST'])
 def llm_endpoint():
     """
     Endpoint for processing generic LLM prompts.
+    With ?stream=1 the response text is streamed as the tokens arrive; with
+    ?stream=sse (or an Accept: text/event-stream header) it is sent as
+    server-sent events. Send "cache": false to bypass the response cache.
     """
     data = request.get_json()
     prompt = data.get("prompt", "")
     if not prompt:
         return Response("No prompt provided", status=400)
+    use_cache = bool(data.get("cache", True))
+
+    stream_mode = request.args.get("stream", "")
+    if stream_mode == "sse" or request.accept_mimetypes.best == "text/event-stream":
+        return _stream_llm_sse(prompt, use_cache)
+    if stream_mode.lower() in ("1", "true"):
+        return _stream_llm_text(prompt, use_cache)
+
     try:
-        response_text = llm.generate_response(prompt)
-        return Response(response_text, mimetype="text/plain")
-    except Exception as e:
-        print(f"[DEBUG] Error generating LLM response: {e}", flush=True)
+        routed = routed_response(get_llm(), prompt, CHAT, use_cache=use_cache)
+        return Response(routed.text, mimetype="text/plain")
+    except Exception:
+        logger.exception("Error generating LLM response")
         return Response("Error generating response", status=500)
 
+# Stop nginx-style proxies from buffering the streamed body.
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _stream_llm_text(prompt: str, use_cache: bool = True) -> Response:
+    """
+    Streams the raw response text, flushing each fragment as it arrives.
+    """
+    fragments = get_llm().stream_response(prompt, use_cache=use_cache)
+    try:
+        # Wait for the first token so a failing request still returns a 500.
+        first = next(fragments, "")
+    except Exception:
+        logger.exception("Error generating LLM response")
+        return Response("Error generating response", status=500)
+    return Response(stream_with_context(itertools.chain([first], fragments)),
+                    mimetype="text/plain", headers=STREAM_HEADERS)
+
+def _stream_llm_sse(prompt: str, use_cache: bool = True) -> Response:
+    """
+    Streams the response as server-sent events: one `data:` event per fragment,
+    then a `done` event, or an `error` event if generation fails part-way.
+    """
+    def events():
+        try:
+            for fragment in get_llm().stream_response(prompt, use_cache=use_cache):
+                yield f"data: {json.dumps(fragment)}\n\n"
+        except Exception:
+            logger.exception("Error generating LLM response")
+            yield "event: error\ndata: \"Error generating response\"\n\n"
+            return
+        yield "event: done\ndata: \"\"\n\n"
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=STREAM_HEADERS)
+
 @main.route('/status', methods=['POST'])
 def status_callback():
     """
-    Endpoint for processing status callbacks.
+    Endpoint for processing status callbacks. Each (MessageSid, MessageStatus)
+    pair is processed once. The event is appended to an in-memory queue and
+    bulk-inserted in the background, so a burst of callbacks costs the web
+    workers almost nothing.
     """
     message_sid = request.values.get('MessageSid')
     message_status = request.values.get('MessageStatus')
     error_code = request.values.get('ErrorCode')
     error_message = request.values.get('ErrorMessage')
-    print(f"Status update: {message_sid}, {message_status}, {error_code}, {error_message}")
+
+    def record_status() -> bool:
+        logger.debug("Status update: %s, %s, %s, %s", message_sid, message_status, error_code, error_message)
+        # A queue append; the rows are bulk-inserted by the background writer.
+        log_message_status(message_sid, message_status, request.values.get('To'), error_code, error_message,
+                           block=False)
+        return True
+
+    if not message_sid or not message_status:
+        return Response("Missing MessageSid or MessageStatus", status=400)
+    # Twilio may deliver the same callback more than once.
+    get_idempotency_store().run(f"status:{message_sid}:{message_status}", record_status)
     return Response("Status received", status=200)
 
+@main.route('/status/report', methods=['GET'])
+def status_report():
+    """
+    Delivery analytics for messages queued in the last ?hours= (default 24):
+    queued -> sent -> delivered latency and failure rates by error code. With
+    ?recipient=, that recipient's latest messages instead.
+    """
+    recipient = request.args.get("recipient")
+    if recipient:
+        limit = request.args.get("limit", 50, type=int)
+        return jsonify({"recipient": recipient, "messages": get_recipient_history(recipient, min(limit, 500))})
+    hours = request.args.get("hours", 24, type=float)
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    return jsonify({"since": since, "latency": get_delivery_latency(since), "failures": get_failure_rates(since)})
+
+# === METRICS === 📈
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, token counts,
+    in-flight gauges and error counters, summed over every gunicorn and Celery
+    process that reports to Redis.
+    """
+    from app.metrics import get_metrics
+    return Response(get_metrics().render(), mimetype="text/plain; version=0.0.4")
+
 # === CAELUM INTEGRATION === 👤
 @main.route('/respond', methods=['POST'])
 def caelum_respond():
     """
     Endpoint for generating AI responses with fixed personality prompt.
     In single-user mode, the user_id is always DEFAULT_USER_ID.
+    The conversation is remembered: recent turns are sent verbatim and older
+    ones as a summary that a Celery task keeps up to date. The model is picked
+    by input length within a latency budget (see app/routing.py).
     """
-    data = request.json
+    data = request.get_json(silent=True) or {}
     user_input = data.get("input")
+    if not user_input:
+        return jsonify({"error": "No input provided"}), 400
     # Ignore provided user_id; always use DEFAULT_USER_ID.
     user_id = DEFAULT_USER_ID
- 
+
+    # Mood routing reads one precomputed row; an optional 1-10 "mood" is logged too.
+    mood_summary = get_recent_mood_summary(user_id)
+    if data.get("mood") is not None:
+        try:
+            log_mood(user_id, data["mood"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "mood must be a number from 1 to 10"}), 400
+        mood_summary = with_new_score(mood_summary, data["mood"])
+    archetype, _ = map_mood_to_archetype(mood_summary)
+
+    # Recent turns verbatim plus a rolling summary, within the token budget.
+    memory = get_caelum().memory
+    context = memory.build_context(user_id, reserve=estimate_tokens(user_input))
+    llm = get_llm()
+    # Shared core first, then one scenario script, then this user's mood and summary.
+    prompt = build_system_prompt(user_input, mood_block=mood_prompt_block(mood_summary) if mood_summary else None,
+                                 summary=context.summary)
+    try:
+        routed = routed_response(llm, user_input, CHAT, system_msg=prompt.text, history=context.messages)
+    except Exception:
+        logger.exception("Error generating /respond reply")
+        return jsonify({"error": "Error generating response"}), 500
+
+    reply = routed.text
+    memory.append(user_id, "user", user_input)
+    memory.append(user_id, "assistant", reply)
+    if archetype:
+        log_archetype_usage(user_id, archetype, module="respond", mood=mood_summary["band"])
+    if context.needs_summary:
+        try:
+            from tasks import queue_summary
+            queue_summary(user_id)
+        except Exception as e:
+            # The summary can wait for the next request; the reply must not.
+            logger.warning("Could not queue conversation summary: %r", e)
+    return jsonify({"response": reply, "archetype": archetype, "context_tokens": context.tokens,
+                    "tier": routed.tier, "model": routed.model})
+
 
 
 # === TEXT-TO-SPEECH SERVICES === 🔊
 @main.route('/tts-stream', methods=['POST'])
 def tts_stream():
     """
-    For this simplified branch, this endpoint generates TTS audio using gTTS and returns the file path.
-    (Streaming is not supported with gTTS.)
+    Streams gTTS audio for the given text as audio/mpeg.
+    The text is rendered sentence by sentence in parallel, and each sentence's
+    MP3 frames are sent in order as soon as they are ready.
     """
     data = request.json
     text = data.get("text")
+    if not text:
+        return jsonify({"error": "No text provided"}), 400
+    chunks = stream_synthesis(text)
     try:
-        audio_file_path = llm.generate_tts_gtts(text)
-        return jsonify({"audio_file": audio_file_path}), 200
+        # Wait for the first sentence so a failing render still returns a 500.
+        first_chunk = next(chunks, b"")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    return Response(stream_with_context(itertools.chain([first_chunk], chunks)), mimetype="audio/mpeg")
 
 @main.route('/tts-download', methods=['POST'])
 def tts_download():
     """
-    Returns a gTTS-generated MP3 file as a downloadable response.
+    Returns a gTTS-generated MP3 file as a downloadable response, with the
+    same caching and Range support as /static/audio.
     """
     data = request.json
     text = data.get("text")
     try:
-        audio_file_path = llm.generate_tts_gtts(text)
-        return send_file(audio_file_path, mimetype="audio/mpeg", as_attachment=True)
+        audio_file_path = get_llm().generate_tts_gtts(text)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    return send_audio(os.path.basename(audio_file_path), os.path.dirname(audio_file_path), as_attachment=True)
+
+@main.route('/static/audio/<path:filename>', methods=['GET'])
+def static_audio(filename):
+    """
+    Serves generated audio (the media URLs sent to Twilio) with long-lived
+    cache headers, Range and conditional GET support, or through the front
+    proxy when Config.STATIC_OFFLOAD is set. Overrides Flask's static handler
+    for this directory.
+    """
+    return send_audio(filename)
+
+# === PDF EXPORTS === 📄
+@main.route('/exports', methods=['POST'])
+def create_export():
+    """
+    Queues a Markdown document for rendering to PDF and returns the job ID to
+    poll. A document that was exported before is returned as done right away.
+    """
+    data = request.get_json(silent=True) or {}
+    markdown_text = data.get("markdown")
+    title = data.get("title") or ""
+    if not markdown_text or not isinstance(markdown_text, str) or not isinstance(title, str):
+        return jsonify({"error": "No markdown provided"}), 400
+    if len(markdown_text) > Config.EXPORT_MAX_CHARS:
+        return jsonify({"error": f"Document exceeds {Config.EXPORT_MAX_CHARS} characters"}), 413
+    from tasks import export_status, queue_export
+    job_id = queue_export(markdown_text, title)
+    return _export_response(job_id, export_status(job_id), 202)
+
+@main.route('/exports/<job_id>', methods=['GET'])
+def export_job(job_id):
+    """
+    Reports an export job's status: pending, done (with the download URL),
+    failed, or expired.
+    """
+    if not JOB_ID.match(job_id):
+        return jsonify({"error": "Unknown export"}), 404
+    from tasks import export_status
+    return _export_response(job_id, export_status(job_id), 200)
+
+@main.route('/exports/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    """
+    Streams a finished PDF from the exports directory.
+    """
+    export = find_export(job_id)
+    if export is None:
+        return jsonify({"error": "Export not ready"}), 404
+    return send_file(os.path.abspath(export.path), mimetype="application/pdf", as_attachment=True,
+                     download_name=export.filename, conditional=True, max_age=86400)
+
+def _export_response(job_id: str, status: str, pending_code: int):
+    body = {"job_id": job_id, "status": status}
+    if status == "done":
+        body["download_url"] = url_for("main.download_export", job_id=job_id)
+        return jsonify(body), 200
+    return jsonify(body), pending_code
@@ -0,0 +1,148 @@
+# app/routing.py
+"""
+Model tiering for replies.
+
+A request is routed by its class and input length. Short messages, like a
+one-word mood score or a quick SMS, go to the fast tier
+(Config.LLM_FAST_MODEL) with a small max_tokens. Longer ones go to the primary
+tier (Config.LLM_PRIMARY_MODEL); SMS replies get a smaller max_tokens than chat.
+
+Every call has a latency budget. If the first call has not answered after
+Config.LLM_HEDGE_AFTER seconds (Config.LLM_FAST_HEDGE_AFTER for the fast
+tier), or fails, a hedged request goes to the fast tier. Whichever answers
+first wins. Nothing waits longer than Config.LLM_MAX_LATENCY: the HTTP
+requests are given that deadline, and routed_response raises TimeoutError
+when it passes. The tier that answered is returned and counted in /metrics.
+
+A request already sent to OpenAI cannot be recalled. The losing call of a
+hedge runs until it answers or hits the deadline, and it still uses its rate
+limiter charge. Only a loser still waiting for the rate limiter is cancelled,
+and its charge is refunded.
+"""
+import logging
+import contextvars
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+from app.config import Config
+from app.metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+Tier = namedtuple("Tier", ["name", "model", "max_tokens"])
+Route = namedtuple("Route", ["request_class", "first", "hedge", "hedge_after", "deadline"])
+RoutedReply = namedtuple("RoutedReply", ["text", "tier", "model", "hedged", "seconds"])
+
+# Request classes: replies sent by SMS/WhatsApp, and longer chat replies (/respond).
+SMS = "sms"
+CHAT = "chat"
+
+
+def choose_route(request_class: str, prompt: str) -> Route:
+    """
+    Picks the tiers, max_tokens and latency budget for a request.
+
+    Args:
+        request_class (str): SMS or CHAT.
+        prompt (str): The user's message.
+
+    Returns:
+        Route: The first tier, the hedge tier, when to hedge and the deadline (seconds).
+    """
+    if len((prompt or "").strip()) <= Config.LLM_SHORT_INPUT_CHARS:
+        fast = Tier("fast", Config.LLM_FAST_MODEL, Config.LLM_FAST_MAX_TOKENS)
+        return Route(request_class, fast, fast, Config.LLM_FAST_HEDGE_AFTER, Config.LLM_MAX_LATENCY)
+    max_tokens = Config.LLM_SMS_MAX_TOKENS if request_class == SMS else Config.LLM_PRIMARY_MAX_TOKENS
+    return Route(request_class, Tier("primary", Config.LLM_PRIMARY_MODEL, max_tokens),
+                 Tier("fast", Config.LLM_FAST_MODEL, max_tokens), Config.LLM_HEDGE_AFTER, Config.LLM_MAX_LATENCY)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide pool that runs routed calls and their hedges.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.LLM_ROUTING_WORKERS, thread_name_prefix="llm-route")
+    return _executor
+
+
+def routed_response(engine, prompt: str, request_class: str = CHAT, system_msg: Optional[str] = None,
+                    history: Optional[list] = None, use_cache: bool = True) -> RoutedReply:
+    """
+    Generates a reply on the tier chosen for the request, hedging to the fast
+    tier when the first call is slow or fails.
+
+    Args:
+        engine (LLMEngine): The engine whose prompt, cache and limiter are used.
+        prompt (str): The user's message.
+        request_class (str): SMS or CHAT.
+        system_msg (str, optional): A custom system prompt.
+        history (list, optional): Earlier turns as {"role", "content"} messages.
+        use_cache (bool): Set to False to always call the API (default True).
+
+    Returns:
+        RoutedReply: The text, the tier and model that produced it, whether it
+        came from the hedge, and the seconds taken.
+
+    Raises:
+        TimeoutError: If no tier answered within the deadline.
+        Exception: The last call's error if every call failed.
+    """
+    route = choose_route(request_class, prompt)
+    started = time.monotonic()
+    deadline = started + route.deadline
+
+    cancel = threading.Event()
+
+    def call(tier: Tier) -> str:
+        return engine.generate_response(prompt, system_msg=system_msg, use_cache=use_cache, history=history,
+                                        model=tier.model, max_tokens=tier.max_tokens,
+                                        timeout=max(0.1, deadline - time.monotonic()), cancel=cancel)
+
+    pool = _get_executor()
+    pending = {pool.submit(contextvars.copy_context().run, call, route.first): (route.first, False)}
+    hedge_at = started + route.hedge_after
+    hedge_sent, error = False, None
+    while pending and time.monotonic() < deadline:
+        wake_at = deadline if hedge_sent else min(hedge_at, deadline)
+        done, _ = wait(pending, timeout=max(0.0, wake_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            tier, is_hedge = pending.pop(future)
+            if future.exception() is None:
+                # Stops a loser that has not reached OpenAI yet; one already sent runs out.
+                cancel.set()
+                return _record(route, tier, is_hedge, future.result(), started)
+            error = future.exception()
+            logger.warning("LLM %s tier (%s) failed: %r", tier.name, tier.model, error)
+        # Hedge once: when the first call is late, or straight away if it failed.
+        if not hedge_sent and (error or time.monotonic() >= hedge_at):
+            pending[pool.submit(contextvars.copy_context().run, call, route.hedge)] = (route.hedge, True)
+            hedge_sent = True
+
+    cancel.set()
+    outcome = "timeout" if pending or error is None else "error"
+    get_metrics().inc("caelum_llm_route_total", request_class=route.request_class, tier="none", outcome=outcome)
+    if outcome == "timeout":
+        raise TimeoutError(f"No LLM tier answered within {route.deadline:.0f}s")
+    raise error
+
+
+def _record(route: Route, tier: Tier, hedged: bool, text: str, started: float) -> RoutedReply:
+    seconds = time.monotonic() - started
+    metrics = get_metrics()
+    metrics.inc("caelum_llm_route_total", request_class=route.request_class, tier=tier.name,
+                outcome="hedge" if hedged else "first")
+    metrics.observe("caelum_llm_route_seconds", seconds, request_class=route.request_class, tier=tier.name)
+    logger.info("LLM %s reply from %s tier (%s%s) in %.2fs", route.request_class, tier.name, tier.model,
+                ", hedged" if hedged else "", seconds)
+    return RoutedReply(text, tier.name, tier.model, hedged, seconds)
@@ -0,0 +1,342 @@
+# app/tts.py
+"""
+Content-addressed on-disk cache for gTTS audio.
+
+Every MP3 is named after a hash of (text, lang, voice), so the same text always
+maps to the same file and URL. Concurrent misses for the same text are
+serialised with an flock on a lock file, which a render holds for as long as it
+takes and a worker that dies releases with the process. The least-recently-used
+files are evicted once the audio directory grows past
+Config.TTS_CACHE_MAX_BYTES. Recency is kept in the files' access time; the
+modification time is left alone, as it is what Last-Modified and the ETag of a
+served file are built from (see app/media.py).
+
+Text is rendered sentence by sentence on a bounded thread pool. MP3 frames can
+be concatenated as-is, so the sentences are either joined into one file or
+streamed to the client in order as each one becomes ready.
+"""
+import hashlib
+import io
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+from app.config import Config
+from app.metrics import SIZE_BUCKETS, get_metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: lock files are created exclusively and expire instead.
+    fcntl = None
+
+
+CachedAudio = namedtuple("CachedAudio", ["filename", "path", "url"])
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+_executor = None
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Splits text at sentence boundaries, dropping empty pieces.
+    """
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def render_gtts_bytes(text: str, lang: str, voice: str) -> bytes:
+    """
+    Renders a single piece of text to MP3 bytes with gTTS. The voice is passed
+    as gTTS' `tld` (accent) setting. If Config.TTS_BACKEND_URL is set, the text
+    is rendered by that HTTP endpoint instead (see benchmarks/fakes.py).
+    """
+    metrics = get_metrics()
+    with metrics.track("tts"):
+        if Config.TTS_BACKEND_URL:
+            import requests
+            response = requests.post(Config.TTS_BACKEND_URL, json={"text": text, "lang": lang, "voice": voice},
+                                     timeout=30)
+            response.raise_for_status()
+            audio = response.content
+        else:
+            from gtts import gTTS
+            buffer = io.BytesIO()
+            gTTS(text=text, lang=lang, tld=voice).write_to_fp(buffer)
+            audio = buffer.getvalue()
+    metrics.observe("caelum_tts_audio_bytes", len(audio), buckets=SIZE_BUCKETS)
+    return audio
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide pool used for sentence renders. It is shared by all
+    requests so the number of concurrent gTTS calls stays bounded.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=Config.TTS_MAX_WORKERS, thread_name_prefix="tts")
+    return _executor
+
+
+def iter_rendered_sentences(text: str, lang: str, voice: str) -> Iterator[bytes]:
+    """
+    Renders each sentence in parallel and yields the MP3 bytes in order.
+    The first chunk is yielded as soon as the first sentence is ready.
+    Pending renders are cancelled if the consumer stops early.
+    """
+    futures = [_get_executor().submit(render_gtts_bytes, sentence, lang, voice)
+               for sentence in split_sentences(text)]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def render_gtts(text: str, lang: str, voice: str, output_path: str) -> None:
+    """
+    Renders text to an MP3 file, synthesizing the sentences in parallel.
+    """
+    with open(output_path, "wb") as f:
+        for chunk in iter_rendered_sentences(text, lang, voice):
+            f.write(chunk)
+
+
+class TTSCache:
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 static_domain: Optional[str] = None, lock_timeout: float = 60.0):
+        """
+        Initializes the cache.
+
+        Args:
+            directory (str, optional): Where MP3s are stored (default Config.AUDIO_OUTPUT_DIR).
+            max_bytes (int, optional): Byte budget for the directory (default Config.TTS_CACHE_MAX_BYTES).
+            static_domain (str, optional): Public base URL (default Config.STATIC_DOMAIN).
+            lock_timeout (float): Seconds after which a leftover lock file is treated
+                as stale, where flock is not available.
+        """
+        self.directory = Path(directory or Config.AUDIO_OUTPUT_DIR)
+        self.max_bytes = Config.TTS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.static_domain = (static_domain or Config.STATIC_DOMAIN).rstrip("/")
+        self.lock_timeout = lock_timeout
+
+    @staticmethod
+    def key(text: str, lang: str = "en", voice: str = "com") -> str:
+        """
+        Returns the content hash for (text, lang, voice).
+        """
+        digest = hashlib.sha256()
+        for part in (text, lang, voice):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:32]
+
+    def entry(self, text: str, lang: str = "en", voice: str = "com") -> CachedAudio:
+        """
+        Returns the filename, path and URL the audio for this text lives at,
+        whether or not it has been rendered yet.
+        """
+        filename = f"tts_{self.key(text, lang, voice)}.mp3"
+        return CachedAudio(filename, str(self.directory / filename),
+                           f"{self.static_domain}/static/audio/{filename}")
+
+    def lookup(self, text: str, lang: str = "en", voice: str = "com") -> Optional[CachedAudio]:
+        """
+        Returns the cached audio for this text, or None on a miss.
+        A hit refreshes the file's atime, which is what eviction orders by.
+        """
+        cached = self.entry(text, lang, voice)
+        try:
+            os.utime(cached.path, ns=(time.time_ns(), os.stat(cached.path).st_mtime_ns))
+        except FileNotFoundError:
+            return None
+        return cached
+
+    def get_or_render(self, text: str, lang: str = "en", voice: str = "com",
+                      renderer: Optional[Callable[[str, str, str, str], None]] = None) -> CachedAudio:
+        """
+        Returns the cached audio for this text, rendering it on a miss.
+
+        Args:
+            text (str): The text to synthesize.
+            lang (str): The gTTS language.
+            voice (str): The gTTS accent (tld).
+            renderer (callable, optional): Called as renderer(text, lang, voice, path)
+                to produce the MP3 on a miss (default render_gtts).
+
+        Returns:
+            CachedAudio: The stable filename, path and URL of the MP3.
+        """
+        hit = self.lookup(text, lang, voice)
+        if hit:
+            return hit
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        cached = self.entry(text, lang, voice)
+        lock_path = cached.path + ".lock"
+        lock = self._acquire(lock_path)
+        try:
+            # Re-check now that we hold the lock: a competing render may have just finished.
+            hit = self.lookup(text, lang, voice)
+            if hit:
+                return hit
+            tmp_path = f"{cached.path}.{os.getpid()}.tmp"
+            try:
+                (renderer or render_gtts)(text, lang, voice, tmp_path)
+                os.replace(tmp_path, cached.path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        finally:
+            self._release(lock_path, lock)
+
+        self.evict(keep=cached.filename)
+        return cached
+
+    def put(self, text: str, lang: str, voice: str, data: bytes) -> CachedAudio:
+        """
+        Stores already-rendered MP3 bytes for this text.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        cached = self.entry(text, lang, voice)
+        tmp_path = f"{cached.path}.{os.getpid()}.{id(data)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cached.path)
+        self.evict(keep=cached.filename)
+        return cached
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Deletes least-recently-used MP3s until the directory fits the byte budget.
+
+        Args:
+            keep (str, optional): A filename that must not be evicted.
+
+        Returns:
+            int: The number of files removed.
+        """
+        if not self.max_bytes:
+            return 0
+        files = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for f in it:
+                if f.is_file() and f.name.endswith(".mp3"):
+                    st = f.stat()
+                    files.append((st.st_atime, st.st_size, f.path, f.name))
+                    total += st.st_size
+        removed = 0
+        for _, size, path, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def _acquire(self, lock_path: str):
+        """
+        Takes the lock for a render, waiting while another process holds it,
+        and returns its handle for _release().
+        """
+        if fcntl is None:
+            self._acquire_exclusive(lock_path)
+            return None
+        while True:
+            handle = open(lock_path, "a")
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                # The previous holder removes the file on release; a lock on a
+                # removed file no longer excludes anyone, so take the new one.
+                if os.fstat(handle.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return handle
+            except FileNotFoundError:
+                pass
+            handle.close()
+
+    def _acquire_exclusive(self, lock_path: str) -> None:
+        """
+        Creates the lock file exclusively, waiting while another process holds it.
+        A lock older than lock_timeout is assumed to belong to a crashed render.
+        """
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+
+    @staticmethod
+    def _release(lock_path: str, handle) -> None:
+        # Removed while still locked, so no one can lock the old file after us.
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        if handle is not None:
+            handle.close()
+
+
+_cache = None
+
+
+def get_tts_cache() -> TTSCache:
+    """
+    Returns the process-wide TTS cache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = TTSCache()
+    return _cache
+
+
+def synthesize(text: str, lang: Optional[str] = None, voice: Optional[str] = None) -> CachedAudio:
+    """
+    Returns cached audio for the text, rendering it with gTTS on a miss.
+    """
+    return get_tts_cache().get_or_render(text, lang or Config.TTS_LANG, voice or Config.TTS_VOICE)
+
+
+def stream_synthesis(text: str, lang: Optional[str] = None, voice: Optional[str] = None,
+                     chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Yields MP3 bytes for the text as they become available.
+
+    A cached file is streamed straight from disk. Otherwise the sentences are
+    rendered in parallel and yielded in order, and the complete audio is added
+    to the cache once the last sentence has been sent.
+    """
+    lang = lang or Config.TTS_LANG
+    voice = voice or Config.TTS_VOICE
+    cache = get_tts_cache()
+    hit = cache.lookup(text, lang, voice)
+    if hit:
+        with open(hit.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    rendered = []
+    for chunk in iter_rendered_sentences(text, lang, voice):
+        rendered.append(chunk)
+        yield chunk
+    if rendered:  # Empty or whitespace-only text has no sentences to cache.
+        cache.put(text, lang, voice, b"".join(rendered))
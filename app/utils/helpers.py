@@ -6,5 +6,481 @@ This module contains helper functions for:
   - Logging archetype usage and user feedback.
   - Retrieving recent mood summaries.
   - Mapping moods to archetypes.
+  - Recording Twilio delivery statuses and reporting on them.
   - Providing preset prompt scaffolds.
+
+Connections are opened once per thread and process, in WAL mode, so readers
+never wait for the writer and gunicorn/Celery workers can share the file.
+Log writes (mood, archetype usage, feedback) do not touch the disk on the
+request thread: they are queued in memory and a background BatchWriter inserts
+them in one transaction every Config.DB_FLUSH_INTERVAL seconds. The schema and
+its migrations live in init_system.py and are applied on first connection.
+
+Twilio send and status events are written the same way, and each one also
+updates its message's row in message_deliveries, from which the delivery
+latency and failure reports are computed.
+
+Each mood log also updates the user's row in mood_aggregates, in the same
+transaction: a moving average, the last Config.MOOD_LAST_N scores and
+low/medium/high counts per day. Reading the recent mood summary before an LLM
+call is a single primary-key lookup, however long the log grows.
 """
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def get_db(path: str = None):
+    """
+    Returns this thread's connection to the Caelum database, opening it on
+    first use (and migrating the schema once per process). Rows are returned
+    as sqlite3.Row.
+
+    Args:
+        path (str, optional): Database file (default Config.DATABASE_PATH).
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    import sqlite3
+    path = path or Config.DATABASE_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None or getattr(_local, "pid", None) != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        with _migrate_lock:
+            if (os.getpid(), path) not in _migrated:
+                from init_system import migrate
+                migrate(conn)
+                _migrated.add((os.getpid(), path))
+        connections[path] = conn
+    return conn
+
+
+def init_db(path: str = None) -> None:
+    """
+    Creates or migrates the Caelum tables and indexes.
+    """
+    from init_system import migrate
+    migrate(get_db(path))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# === BATCHED WRITES === 🗃️
+class BatchWriter:
+    def __init__(self, path: Optional[str] = None, flush_interval: Optional[float] = None,
+                 batch_size: Optional[int] = None, max_queue: Optional[int] = None):
+        """
+        Queues INSERTs in memory and writes them from a background thread,
+        grouped by statement, in one transaction per flush.
+
+        Args:
+            path (str, optional): Database file (default Config.DATABASE_PATH).
+            flush_interval (float, optional): Seconds between flushes (default Config.DB_FLUSH_INTERVAL).
+            batch_size (int, optional): Rows that trigger an early flush (default Config.DB_BATCH_SIZE).
+            max_queue (int, optional): Rows buffered before writers wait (default Config.DB_QUEUE_SIZE).
+        """
+        self.path = path
+        self.flush_interval = flush_interval or Config.DB_FLUSH_INTERVAL
+        self.batch_size = batch_size or Config.DB_BATCH_SIZE
+        self.max_queue = max_queue or Config.DB_QUEUE_SIZE
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def write(self, sql: str, params: tuple, timeout: float = 1.0) -> None:
+        """
+        Queues one INSERT. Waits up to `timeout` seconds if the queue is full,
+        then drops the row rather than stall the caller.
+        """
+        self._ensure_thread()
+        try:
+            self._queue.put((sql, params), timeout=timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Database write queue full; dropped a row for %s", sql.split("(")[0].strip())
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Writes everything queued so far. Returns the number of rows written.
+        """
+        with self._flush_lock:
+            rows: List[Tuple[str, tuple]] = []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows:
+                return 0
+            grouped = {}
+            for sql, params in rows:
+                grouped.setdefault(sql, []).append(params)
+            conn = get_db(self.path)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for sql, params in grouped.items():
+                    conn.executemany(sql, params)
+                    if sql in AFTER_WRITE:
+                        AFTER_WRITE[sql](conn, params)
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.error("Batched database write of %d rows failed: %r", len(rows), e)
+                return 0
+            return len(rows)
+
+    def _ensure_thread(self) -> None:
+        # The flush thread does not survive a fork; each worker starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="db-batch-writer", daemon=True).start()
+
+    def _run(self) -> None:
+        pid = os.getpid()
+        while self._pid == pid:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> BatchWriter:
+    """
+    Returns the process-wide batch writer (flushed once more at exit).
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = BatchWriter()
+                atexit.register(_writer.flush)
+    return _writer
+
+
+# === LOGGING HELPERS === 📝
+MOOD_INSERT = "INSERT INTO mood_logs (user_id, mood_score, note, timestamp) VALUES (?, ?, ?, ?)"
+
+
+def log_mood(user_id: str, mood_score: int, note: Optional[str] = None) -> None:
+    """
+    Records a 1–10 mood check-in. The aggregates are updated when the batch
+    is written (within Config.DB_FLUSH_INTERVAL).
+    """
+    mood_score = int(mood_score)
+    if not 1 <= mood_score <= 10:
+        raise ValueError("mood_score must be between 1 and 10")
+    get_writer().write(MOOD_INSERT, (user_id, mood_score, note, _now()))
+
+
+def log_archetype_usage(user_id: str, archetype: str, is_custom: bool = False,
+                        module: Optional[str] = None, mood: Optional[str] = None) -> None:
+    """
+    Records which archetype answered, for which module and mood.
+    """
+    get_writer().write(
+        "INSERT INTO archetype_usage (user_id, archetype, is_custom, module, mood, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)", (user_id, archetype, int(bool(is_custom)), module, mood, _now()))
+
+
+def log_user_feedback(user_id: str, rating: Optional[int] = None, comment: Optional[str] = None,
+                      archetype: Optional[str] = None, module: Optional[str] = None) -> None:
+    """
+    Records a user's rating or comment on a reply.
+    """
+    get_writer().write(
+        "INSERT INTO user_feedback (user_id, rating, comment, archetype, module, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)", (user_id, rating, comment, archetype, module, _now()))
+
+
+def get_recent_moods(user_id: str, limit: int = 7) -> list:
+    """
+    Returns the user's latest mood check-ins, newest first. Uses the
+    (user_id, timestamp) index, so the cost does not grow with the log.
+    """
+    return get_db().execute(
+        "SELECT mood_score, note, timestamp FROM mood_logs WHERE user_id = ? "
+        "ORDER BY timestamp DESC LIMIT ?", (user_id, limit)).fetchall()
+
+
+# === MOOD AGGREGATES === 🌡️
+MOOD_BANDS = ("low", "medium", "high")
+
+# Archetype and tone for each mood band, following the daily check-in script
+# in the personality prompt.
+MOOD_ARCHETYPES = {
+    "low": ("Orion", "Poetic grounding and one sensory suggestion."),
+    "medium": ("Jasper", "A structured plan with gentle charm."),
+    "high": ("Fox", "Fun activation with emojis and play."),
+}
+
+
+def mood_band(score: float) -> str:
+    """
+    Maps a 1–10 mood score to "low" (1–3), "medium" (4–7) or "high" (8–10).
+    """
+    if score < 3.5:
+        return "low"
+    return "medium" if score < 7.5 else "high"
+
+
+def _update_mood_aggregates(conn, rows: list) -> None:
+    """
+    Folds new mood_logs rows into mood_aggregates (called inside the batch's transaction).
+    """
+    alpha = Config.MOOD_EMA_ALPHA
+    for user_id, score, _note, timestamp in rows:
+        row = conn.execute("SELECT ema, last_scores, day_counts, total FROM mood_aggregates WHERE user_id = ?",
+                           (user_id,)).fetchone()
+        if row is None:
+            ema, last_scores, day_counts, total = float(score), [], {}, 0
+        else:
+            ema = row["ema"] + alpha * (score - row["ema"])
+            last_scores, day_counts, total = json.loads(row["last_scores"]), json.loads(row["day_counts"]), row["total"]
+        last_scores = (last_scores + [score])[-Config.MOOD_LAST_N:]
+        day = timestamp[:10]
+        counts = day_counts.setdefault(day, [0, 0, 0])
+        counts[MOOD_BANDS.index(mood_band(score))] += 1
+        oldest = (datetime.fromisoformat(timestamp) - timedelta(days=Config.MOOD_WINDOW_DAYS - 1)).date().isoformat()
+        day_counts = {d: c for d, c in day_counts.items() if d >= oldest}
+        conn.execute(
+            "INSERT INTO mood_aggregates (user_id, ema, last_scores, day_counts, total, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET ema = excluded.ema, "
+            "last_scores = excluded.last_scores, day_counts = excluded.day_counts, total = excluded.total, "
+            "updated_at = excluded.updated_at",
+            (user_id, ema, json.dumps(last_scores), json.dumps(day_counts), total + 1, timestamp))
+
+
+AFTER_WRITE = {MOOD_INSERT: _update_mood_aggregates}
+
+
+def get_recent_mood_summary(user_id: str) -> Optional[dict]:
+    """
+    Returns the user's rolling mood summary, or None if no mood was logged yet.
+
+    Returns:
+        dict: "ema" (moving average), "band" (of the average), "last_scores"
+        (oldest first), "band_counts" over the last Config.MOOD_WINDOW_DAYS
+        days, "total" check-ins and "updated_at".
+    """
+    row = get_db().execute(
+        "SELECT ema, last_scores, day_counts, total, updated_at FROM mood_aggregates WHERE user_id = ?",
+        (user_id,)).fetchone()
+    if row is None:
+        return None
+    oldest = (datetime.now(timezone.utc) - timedelta(days=Config.MOOD_WINDOW_DAYS - 1)).date().isoformat()
+    band_counts = dict.fromkeys(MOOD_BANDS, 0)
+    for day, counts in json.loads(row["day_counts"]).items():
+        if day >= oldest:
+            for band, count in zip(MOOD_BANDS, counts):
+                band_counts[band] += count
+    return {"ema": round(row["ema"], 2), "band": mood_band(row["ema"]), "last_scores": json.loads(row["last_scores"]),
+            "band_counts": band_counts, "total": row["total"], "updated_at": row["updated_at"]}
+
+
+def with_new_score(summary: Optional[dict], score: int) -> dict:
+    """
+    Returns the summary as it will look once `score` (just logged, not yet
+    flushed) is folded in, so the current reply can already use it.
+    """
+    score = int(score)
+    if not summary:
+        return {"ema": float(score), "band": mood_band(score), "last_scores": [score],
+                "band_counts": dict.fromkeys(MOOD_BANDS, 0), "total": 1, "updated_at": _now()}
+    ema = round(summary["ema"] + Config.MOOD_EMA_ALPHA * (score - summary["ema"]), 2)
+    return dict(summary, ema=ema, band=mood_band(ema), total=summary["total"] + 1,
+                last_scores=(summary["last_scores"] + [score])[-Config.MOOD_LAST_N:])
+
+
+def map_mood_to_archetype(summary: Optional[dict]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Picks the archetype and tone guidance for a mood summary. The latest
+    score wins over the average when it lands in a different band, so a
+    sudden dip is answered straight away.
+
+    Returns:
+        tuple: (archetype, guidance), or (None, None) without a summary.
+    """
+    if not summary:
+        return None, None
+    latest = summary["last_scores"][-1] if summary["last_scores"] else summary["ema"]
+    return MOOD_ARCHETYPES[mood_band(latest)]
+
+
+def mood_prompt_block(summary: Optional[dict]) -> str:
+    """
+    Returns the system-prompt lines describing the user's recent mood, or "".
+    """
+    archetype, guidance = map_mood_to_archetype(summary)
+    if not archetype:
+        return ""
+    scores = ", ".join(str(score) for score in summary["last_scores"])
+    return (f"Her recent mood: {summary['band']} (average {summary['ema']}/10; latest check-ins: {scores}). "
+            f"Lead as {archetype}: {guidance}")
+
+
+# === MESSAGE DELIVERY === 📬
+STATUS_INSERT = ("INSERT INTO message_events (message_sid, status, recipient, error_code, error_message, timestamp) "
+                 "VALUES (?, ?, ?, ?, ?, ?)")
+
+# Twilio statuses in the order a message moves through them. A callback that
+# arrives late (e.g. "sent" after "delivered") does not move a message back.
+STATUS_RANKS = {"accepted": 0, "scheduled": 0, "queued": 1, "sending": 2, "sent": 3, "receiving": 3,
+                "received": 4, "delivered": 4, "read": 5, "undelivered": 6, "failed": 6, "canceled": 6}
+FAILED_STATUSES = ("undelivered", "failed")
+# Column set the first time a message reaches each status.
+STATUS_COLUMNS = {"queued": "queued_at", "sent": "sent_at", "delivered": "delivered_at", "read": "delivered_at",
+                  "undelivered": "failed_at", "failed": "failed_at"}
+
+
+def log_message_status(message_sid: str, status: str, recipient: Optional[str] = None,
+                       error_code: Optional[str] = None, error_message: Optional[str] = None,
+                       block: bool = True) -> None:
+    """
+    Records a send ("queued") or a Twilio status callback for a message.
+
+    Args:
+        message_sid (str): The Twilio message SID.
+        status (str): The MessageStatus.
+        recipient (str, optional): The "To" number.
+        error_code (str, optional): Twilio's ErrorCode for failed messages.
+        error_message (str, optional): Twilio's ErrorMessage.
+        block (bool): Set to False to drop the event instead of waiting when the
+            write queue is full (for the /status endpoint).
+    """
+    get_writer().write(STATUS_INSERT, (message_sid, (status or "").lower(), recipient, error_code or None,
+                                       error_message or None, _now()), timeout=1.0 if block else 0)
+
+
+def _update_deliveries(conn, rows: list) -> None:
+    """
+    Folds new message_events rows into message_deliveries (called inside the batch's transaction).
+    """
+    timestamps = dict.fromkeys(("queued_at", "sent_at", "delivered_at", "failed_at"))
+    params = []
+    for message_sid, status, recipient, error_code, _error_message, timestamp in rows:
+        times = dict(timestamps)
+        if status in STATUS_COLUMNS:
+            times[STATUS_COLUMNS[status]] = timestamp
+        params.append((message_sid, recipient, status, STATUS_RANKS.get(status, 0), times["queued_at"],
+                       times["sent_at"], times["delivered_at"], times["failed_at"], error_code, timestamp))
+    conn.executemany(
+        "INSERT INTO message_deliveries (message_sid, recipient, status, status_rank, queued_at, sent_at, "
+        "delivered_at, failed_at, error_code, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(message_sid) DO UPDATE SET "
+        "recipient = COALESCE(message_deliveries.recipient, excluded.recipient), "
+        "status = CASE WHEN excluded.status_rank >= message_deliveries.status_rank "
+        "THEN excluded.status ELSE message_deliveries.status END, "
+        "status_rank = MAX(message_deliveries.status_rank, excluded.status_rank), "
+        "queued_at = COALESCE(message_deliveries.queued_at, excluded.queued_at), "
+        "sent_at = COALESCE(message_deliveries.sent_at, excluded.sent_at), "
+        "delivered_at = COALESCE(message_deliveries.delivered_at, excluded.delivered_at), "
+        "failed_at = COALESCE(message_deliveries.failed_at, excluded.failed_at), "
+        "error_code = COALESCE(excluded.error_code, message_deliveries.error_code), "
+        "updated_at = excluded.updated_at", params)
+
+
+AFTER_WRITE[STATUS_INSERT] = _update_deliveries
+
+
+def _percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(share * len(values)))], 3)
+
+
+def get_delivery_latency(since: Optional[str] = None) -> dict:
+    """
+    Returns how long messages queued since `since` took between statuses.
+
+    Args:
+        since (str, optional): ISO timestamp (default: the last 24 hours).
+
+    Returns:
+        dict: For "queued_to_sent", "sent_to_delivered" and "queued_to_delivered",
+        the count, average, p50 and p95 in seconds.
+    """
+    since = since or (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    spans = {"queued_to_sent": ("queued_at", "sent_at"), "sent_to_delivered": ("sent_at", "delivered_at"),
+             "queued_to_delivered": ("queued_at", "delivered_at")}
+    report = {}
+    for name, (start, end) in spans.items():
+        values = [row[0] for row in get_db().execute(
+            f"SELECT (julianday({end}) - julianday({start})) * 86400 AS seconds FROM message_deliveries "
+            f"WHERE queued_at >= ? AND {start} IS NOT NULL AND {end} IS NOT NULL ORDER BY seconds", (since,))]
+        report[name] = {"count": len(values),
+                        "avg": round(sum(values) / len(values), 3) if values else None,
+                        "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95)}
+    return report
+
+
+def get_failure_rates(since: Optional[str] = None) -> dict:
+    """
+    Returns the share of messages queued since `since` that failed, overall and
+    by Twilio error code.
+
+    Returns:
+        dict: "messages", "failed", "failure_rate" and "by_error_code" (a list of
+        {"error_code", "count", "rate"}, most frequent first).
+    """
+    since = since or (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    placeholders = ", ".join("?" * len(FAILED_STATUSES))
+    total = get_db().execute("SELECT COUNT(*) FROM message_deliveries WHERE queued_at >= ?", (since,)).fetchone()[0]
+    rows = get_db().execute(
+        f"SELECT COALESCE(error_code, 'unknown') AS code, COUNT(*) AS count FROM message_deliveries "
+        f"WHERE queued_at >= ? AND status IN ({placeholders}) GROUP BY code ORDER BY count DESC",
+        (since, *FAILED_STATUSES)).fetchall()
+    failed = sum(row["count"] for row in rows)
+    return {"messages": total, "failed": failed, "failure_rate": round(failed / total, 4) if total else 0.0,
+            "by_error_code": [{"error_code": row["code"], "count": row["count"],
+                               "rate": round(row["count"] / total, 4)} for row in rows]}
+
+
+def get_recipient_history(recipient: str, limit: int = 50) -> list:
+    """
+    Returns the latest messages to a recipient, newest first, each with its
+    current status and the time it reached each status.
+    """
+    return [dict(row) for row in get_db().execute(
+        "SELECT message_sid, status, queued_at, sent_at, delivered_at, failed_at, error_code "
+        "FROM message_deliveries WHERE recipient = ? ORDER BY queued_at DESC LIMIT ?",
+        (recipient, limit)).fetchall()]
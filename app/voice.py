@@ -0,0 +1,203 @@
+# app/voice.py
+"""
+Transcription of inbound voice notes.
+
+The recording at Twilio's MediaUrl is streamed to a temporary file in chunks,
+never held in memory as a whole. Recordings longer than
+Config.VOICE_SEGMENT_SECONDS are cut into segments at pauses found with
+ffmpeg's silencedetect filter. The segments are transcribed with Whisper in
+parallel (Config.VOICE_TRANSCRIBE_CONCURRENCY at a time) and the texts joined
+in order, so a minutes-long note costs about as much wall time as one segment.
+
+Without ffmpeg on the PATH the recording is transcribed as one piece.
+"""
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+# Extensions for the content types Twilio and WhatsApp use for voice notes;
+# Whisper picks the decoder from the file name.
+AUDIO_EXTENSIONS = {
+    "audio/ogg": ".ogg", "audio/opus": ".ogg", "audio/mpeg": ".mp3", "audio/mp3": ".mp3",
+    "audio/mp4": ".m4a", "audio/x-m4a": ".m4a", "audio/aac": ".m4a", "audio/amr": ".amr",
+    "audio/wav": ".wav", "audio/x-wav": ".wav", "audio/webm": ".webm", "audio/3gpp": ".3gp",
+}
+
+
+class VoiceNoteTooLarge(Exception):
+    """Raised when a download exceeds Config.VOICE_MAX_BYTES."""
+
+
+def is_audio(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower().startswith("audio/")
+
+
+def download_media(url: str, directory: str, content_type: Optional[str] = None,
+                   chunk_size: int = 64 * 1024, max_bytes: Optional[int] = None) -> str:
+    """
+    Streams a media URL to a file in `directory`, chunk by chunk.
+
+    Args:
+        url (str): The media URL (Twilio media needs the account credentials).
+        directory (str): Where to create the file.
+        content_type (str, optional): Used to pick the file extension.
+        chunk_size (int): Bytes read per chunk.
+        max_bytes (int, optional): Abort past this size (default Config.VOICE_MAX_BYTES).
+
+    Returns:
+        str: The path of the downloaded file.
+
+    Raises:
+        VoiceNoteTooLarge: If the download is bigger than max_bytes.
+    """
+    import requests
+    max_bytes = max_bytes or Config.VOICE_MAX_BYTES
+    auth = (Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN) if Config.TWILIO_ACCOUNT_SID else None
+    with requests.get(url, auth=auth, stream=True, timeout=(5, 30)) as response:
+        response.raise_for_status()
+        content_type = (content_type or response.headers.get("Content-Type", "")).split(";")[0].strip().lower()
+        suffix = AUDIO_EXTENSIONS.get(content_type) or mimetypes.guess_extension(content_type) or ".ogg"
+        fd, path = tempfile.mkstemp(prefix="voice_", suffix=suffix, dir=directory)
+        written = 0
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise VoiceNoteTooLarge(f"Voice note exceeds {max_bytes} bytes")
+                f.write(chunk)
+    return path
+
+
+def plan_segments(duration: float, silences: List[Tuple[float, float]],
+                  max_length: float) -> List[Tuple[float, float]]:
+    """
+    Chooses where to cut a recording: each segment ends in the middle of the
+    last pause that keeps it within max_length, or at max_length if there is
+    no such pause.
+
+    Args:
+        duration (float): Length of the recording in seconds.
+        silences (list): (start, end) of each detected pause, in order.
+        max_length (float): Longest allowed segment in seconds.
+
+    Returns:
+        list: (start, end) of each segment, covering the whole recording.
+    """
+    segments = []
+    start = 0.0
+    while duration - start > max_length:
+        limit = start + max_length
+        cuts = [(s + e) / 2 for s, e in silences if start < (s + e) / 2 <= limit]
+        # Ignore pauses right at the start, which would leave a sliver of a segment.
+        cuts = [cut for cut in cuts if cut - start >= max_length / 4]
+        end = cuts[-1] if cuts else limit
+        segments.append((start, end))
+        start = end
+    segments.append((start, duration))
+    return segments
+
+
+def detect_silences(path: str) -> Tuple[float, List[Tuple[float, float]]]:
+    """
+    Runs ffmpeg's silencedetect over a file.
+
+    Returns:
+        tuple: The duration in seconds and the (start, end) of each pause.
+    """
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-i", path, "-af",
+               f"silencedetect=noise={Config.VOICE_SILENCE_DB}dB:d={Config.VOICE_SILENCE_SECONDS}",
+               "-f", "null", "-"]
+    output = subprocess.run(command, capture_output=True, text=True, timeout=120).stderr
+    match = DURATION.search(output)
+    duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3)) if match else 0.0
+    starts = [float(s) for s in SILENCE_START.findall(output)]
+    ends = [float(e) for e in SILENCE_END.findall(output)]
+    return duration, list(zip(starts, ends))
+
+
+def split_at_silence(path: str, max_length: Optional[float] = None) -> List[str]:
+    """
+    Cuts a recording into segments of at most max_length seconds, at pauses
+    where possible. Segments are written next to the original.
+
+    Args:
+        path (str): The recording.
+        max_length (float, optional): Longest segment (default Config.VOICE_SEGMENT_SECONDS).
+
+    Returns:
+        list: Segment paths in playback order (just [path] if no split is needed).
+    """
+    max_length = max_length or Config.VOICE_SEGMENT_SECONDS
+    if not shutil.which("ffmpeg"):
+        return [path]
+    duration, silences = detect_silences(path)
+    if duration <= max_length:
+        return [path]
+
+    base, suffix = os.path.splitext(path)
+    paths = []
+    for i, (start, end) in enumerate(plan_segments(duration, silences, max_length)):
+        segment = f"{base}_{i:03d}{suffix}"
+        subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{start:.3f}",
+                        "-to", f"{end:.3f}", "-i", path, "-c", "copy", segment],
+                       check=True, capture_output=True, timeout=120)
+        paths.append(segment)
+    logger.info("Split %.1fs voice note into %d segments", duration, len(paths))
+    return paths
+
+
+def transcribe_segments(paths: List[str], transcribe: Callable[[str], str],
+                        concurrency: Optional[int] = None) -> str:
+    """
+    Transcribes segments in parallel and joins the texts in order.
+
+    Args:
+        paths (list): Segment paths in playback order.
+        transcribe (callable): Called as transcribe(path) for each segment.
+        concurrency (int, optional): Parallel requests (default Config.VOICE_TRANSCRIBE_CONCURRENCY).
+
+    Returns:
+        str: The full transcript.
+    """
+    if len(paths) == 1:
+        return transcribe(paths[0]).strip()
+    workers = min(len(paths), concurrency or Config.VOICE_TRANSCRIBE_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper") as pool:
+        texts = list(pool.map(transcribe, paths))
+    return " ".join(text.strip() for text in texts if text and text.strip())
+
+
+def transcribe_voice_note(media_url: str, content_type: Optional[str] = None,
+                          transcribe: Optional[Callable[[str], str]] = None) -> str:
+    """
+    Downloads, splits and transcribes a voice note. Temporary files are removed
+    afterwards.
+
+    Args:
+        media_url (str): The MediaUrl of the incoming message.
+        content_type (str, optional): Its MediaContentType.
+        transcribe (callable, optional): Per-segment transcriber (default Whisper via LLMEngine).
+
+    Returns:
+        str: The transcript.
+    """
+    if transcribe is None:
+        from app.llm import LLMEngine
+        transcribe = LLMEngine(debug=False).transcribe_audio_whisper
+    with tempfile.TemporaryDirectory(prefix="caelum-voice-") as directory:
+        path = download_media(media_url, directory, content_type)
+        return transcribe_segments(split_at_silence(path), transcribe)
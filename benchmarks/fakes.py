@@ -0,0 +1,233 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the OpenAI, Twilio and Google TTS APIs.
+
+One threaded HTTP server answers the subset of each API that Caelum uses:
+
+    POST /v1/chat/completions                         (JSON or SSE stream)
+    POST /v1/audio/transcriptions
+    POST /2010-04-01/Accounts/<sid>/Messages.json
+    POST /tts                                         (returns MP3 bytes)
+    GET  /media/<name>                                (a voice note for MediaUrl0)
+
+Each service has its own latency, and a share of requests can be failed on
+purpose (HTTP 429 or 500) to exercise the retry paths. Point the app at it with
+OPENAI_BASE_URL, TWILIO_API_BASE_URL and TTS_BACKEND_URL (see Config).
+
+Usage:
+    python -m benchmarks.fakes --port 8900 --openai-latency 0.8 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# A silent MPEG-1 Layer III frame header followed by padding; players and
+# concatenation treat it like any other MP3 frame.
+FAKE_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+REPLY_TEXT = ("You are doing beautifully. Let's pick one small thread for today and follow it gently. "
+              "Is this helpful?")
+
+MESSAGES_PATH = re.compile(r"^/2010-04-01/Accounts/(?P<sid>[^/]+)/Messages\.json$")
+
+
+class FakeServiceSettings:
+    def __init__(self, openai_latency: float = 0.0, token_latency: float = 0.0,
+                 twilio_latency: float = 0.0, tts_latency: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500):
+        """
+        Args:
+            openai_latency (float): Seconds before a completion (or its first token) is returned.
+            token_latency (float): Seconds between streamed tokens.
+            twilio_latency (float): Seconds per Twilio API call.
+            tts_latency (float): Seconds per TTS render.
+            error_rate (float): Share of requests (0-1) answered with error_status.
+            error_status (int): HTTP status used for injected errors (e.g. 429 or 500).
+        """
+        self.openai_latency = openai_latency
+        self.token_latency = token_latency
+        self.twilio_latency = twilio_latency
+        self.tts_latency = tts_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = {"openai": 0, "twilio": 0, "tts": 0}
+        self.lock = threading.Lock()
+
+    def count(self, service: str) -> None:
+        with self.lock:
+            self.requests[service] += 1
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: FakeServiceSettings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/media/"):
+            self._handle("twilio", self.settings.twilio_latency, self._media)
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/v1/chat/completions":
+            self._handle("openai", self.settings.openai_latency, lambda: self._chat(json.loads(body or b"{}")))
+        elif self.path == "/v1/audio/transcriptions":
+            self._handle("openai", self.settings.openai_latency,
+                         lambda: self._json(200, {"text": "This is a transcribed voice note."}))
+        elif MESSAGES_PATH.match(self.path):
+            sid = MESSAGES_PATH.match(self.path).group("sid")
+            self._handle("twilio", self.settings.twilio_latency, lambda: self._message(sid, parse_qs(body.decode())))
+        elif self.path == "/tts":
+            self._handle("tts", self.settings.tts_latency, self._tts)
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _handle(self, service: str, latency: float, respond) -> None:
+        self.settings.count(service)
+        if latency:
+            time.sleep(latency)
+        if random.random() < self.settings.error_rate:
+            self._json(self.settings.error_status, {"error": {"message": "Injected failure"}, "code": 20500,
+                                                    "message": "Injected failure", "status": self.settings.error_status})
+            return
+        respond()
+
+    def _json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chat(self, request: dict) -> None:
+        model = request.get("model", "gpt-4")
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+        words = REPLY_TEXT.split(" ")
+        if not request.get("stream"):
+            self._json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY_TEXT},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for i, word in enumerate(words):
+            if i and self.settings.token_latency:
+                time.sleep(self.settings.token_latency)
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                  "finish_reason": None}]}
+            self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _message(self, account_sid: str, form: dict) -> None:
+        self._json(201, {
+            "sid": f"SM{uuid.uuid4().hex}", "account_sid": account_sid, "status": "queued",
+            "to": form.get("To", [""])[0], "from": form.get("From", [""])[0],
+            "body": form.get("Body", [""])[0], "num_media": str(len(form.get("MediaUrl", []))),
+            "date_created": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime()),
+            "uri": f"/2010-04-01/Accounts/{account_sid}/Messages.json",
+        })
+
+    def _media(self) -> None:
+        # A stand-in voice note for MediaUrl0, sent in chunks like Twilio's CDN.
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/ogg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for _ in range(8):
+            self._chunk(FAKE_MP3_FRAME * 16)
+        self._chunk(b"")
+
+    def _tts(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(FAKE_MP3_FRAME) * 4))
+        self.end_headers()
+        self.wfile.write(FAKE_MP3_FRAME * 4)
+
+
+class FakeServices:
+    def __init__(self, settings: FakeServiceSettings = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Starts the fake server on a background thread (port 0 picks a free port).
+        """
+        self.settings = settings or FakeServiceSettings()
+        handler = type("BoundFakeServiceHandler", (FakeServiceHandler,), {"settings": self.settings})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def env(self) -> dict:
+        """
+        Returns the environment variables that point Caelum at these fakes.
+        """
+        return {
+            "OPENAI_API_KEY": "sk-fake",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "TWILIO_ACCOUNT_SID": "ACfake",
+            "TWILIO_AUTH_TOKEN": "fake-token",
+            "TWILIO_NUMBER": "+15550000000",
+            "TWILIO_API_BASE_URL": self.url,
+            "TTS_BACKEND_URL": f"{self.url}/tts",
+        }
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--twilio-latency", type=float, default=0.15)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    settings = FakeServiceSettings(args.openai_latency, args.token_latency, args.twilio_latency,
+                                   args.tts_latency, args.error_rate, args.error_status)
+    services = FakeServices(settings, args.host, args.port)
+    print(f"Fake OpenAI/Twilio/TTS services listening on {services.url}")
+    for key, value in services.env().items():
+        print(f"  {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/import_time.py
+"""
+Import-time benchmark for the modules gunicorn, Celery and the CLI load at boot.
+
+Each module is imported in a fresh interpreter under `python -X importtime`,
+several times, and the median cumulative import time is compared with the
+budget in benchmarks/import_budget.json. The script also fails if a module
+pulls in one of its "forbidden" heavy dependencies at import time.
+
+Usage:
+    python -m benchmarks.import_time            # check against the budget
+    python -m benchmarks.import_time --runs 9   # more runs for a steadier median
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(ROOT, "benchmarks", "import_budget.json")
+
+
+def measure_import(module: str) -> float:
+    """
+    Returns the cumulative import time of a module in milliseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            return int(parts[1]) / 1000.0
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def loaded_modules(module: str, candidates: list) -> list:
+    """
+    Returns which of the candidate top-level packages importing a module loads.
+    """
+    code = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps([m for m in {candidates!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="imports per module (default 5)")
+    args = parser.parse_args(argv)
+
+    with open(BUDGET_FILE) as f:
+        budgets = json.load(f)
+
+    failed = False
+    for module, spec in budgets.items():
+        median_ms = statistics.median(measure_import(module) for _ in range(args.runs))
+        heavy = loaded_modules(module, spec.get("forbidden", []))
+        ok = median_ms <= spec["budget_ms"] and not heavy
+        failed = failed or not ok
+        status = "ok" if ok else "REGRESSION"
+        print(f"{module:<12} {median_ms:8.1f} ms  (budget {spec['budget_ms']} ms)  {status}")
+        if heavy:
+            print(f"{'':<12} imports heavy modules at load time: {', '.join(heavy)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# benchmarks/loadtest.py
+"""
+Load and latency benchmark for Caelum's HTTP endpoints.
+
+Starts the fake OpenAI/Twilio/TTS services (benchmarks/fakes.py), boots
+`create_app()` under gunicorn pointed at them, and drives /webhook, /llm,
+/tts-stream and /tts-download at each concurrency level. For every scenario it
+reports p50/p95/p99 latency, requests per second and errors.
+
+Results are written to benchmarks/results/latest.json. Save them as the
+baseline with --save-baseline; later runs are compared against it and the
+script exits non-zero if p95 latency or throughput regress beyond --tolerance.
+
+Usage:
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --concurrency 1 8 32 --requests 200 --workers 4
+    python -m benchmarks.loadtest --save-baseline
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmarks.fakes import FakeServiceSettings, FakeServices
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+LATEST_FILE = os.path.join(RESULTS_DIR, "latest.json")
+BASELINE_FILE = os.path.join(RESULTS_DIR, "baseline.json")
+
+_counter = itertools.count()
+
+
+def _unique_text() -> str:
+    # A different text per request, so the TTS cache does not hide render cost.
+    return f"Take one slow breath. Then name one small thing you can do now. Check-in {next(_counter)}."
+
+
+SCENARIOS = {
+    "webhook": lambda s, base: s.post(f"{base}/webhook", data={"From": "+15550001111", "Body": "Caelum, start my morning."}),
+    "llm": lambda s, base: s.post(f"{base}/llm", json={"prompt": "Caelum, this task feels like a monster.", "cache": False}),
+    "tts-stream": lambda s, base: s.post(f"{base}/tts-stream", json={"text": _unique_text()}),
+    "tts-download": lambda s, base: s.post(f"{base}/tts-download", json={"text": _unique_text()}),
+}
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(env: dict, workers: int, threads: int) -> (subprocess.Popen, str):
+    """
+    Boots create_app() under gunicorn and waits until it answers.
+    """
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:create_app()", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads), "--timeout", "120", "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(base + "/", timeout=1)
+            return proc, base
+        except requests.ConnectionError:
+            if proc.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start within 30s")
+
+
+def run_scenario(name: str, base: str, concurrency: int, total: int) -> dict:
+    """
+    Sends `total` requests from `concurrency` threads and summarises latency.
+    """
+    request = SCENARIOS[name]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = request(session, base)
+            ok = response.status_code < 400
+            _ = response.content
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            (latencies if ok else errors).append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": len(errors),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """
+    Returns a description of every scenario whose p95 latency rose, or whose
+    throughput fell, by more than the tolerance relative to the baseline.
+    """
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = previous.get((r["scenario"], r["concurrency"]))
+        if not b:
+            continue
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}@{r['concurrency']}: p95 {b['p95_ms']} -> {r['p95_ms']} ms")
+        if b["rps"] and r["rps"] < b["rps"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}@{r['concurrency']}: rps {b['rps']} -> {r['rps']}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--twilio-latency", type=float, default=0.1)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs baseline (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    settings = FakeServiceSettings(args.openai_latency, args.token_latency, args.twilio_latency,
+                                   args.tts_latency, args.error_rate)
+    services = FakeServices(settings)
+    audio_dir = tempfile.mkdtemp(prefix="caelum-bench-audio-")
+    env = dict(os.environ, **services.env(),
+               AUDIO_OUTPUT_DIR=audio_dir, REDIS_URL="", LLM_CACHE_ENABLED="false",
+               # The fakes have no rate limits; measure the app, not the limiter.
+               OPENAI_RPM_LIMIT="0", OPENAI_TPM_LIMIT="0",
+               # The webhook only publishes the reply task; measure the ack, not the worker.
+               CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="cache+memory://")
+    proc, base = start_gunicorn(env, args.workers, args.threads)
+
+    results = []
+    try:
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                result = run_scenario(name, base, concurrency, args.requests)
+                results.append(result)
+                print(f"{name:<13} c={concurrency:<4} p50={result['p50_ms']:>8} ms  p95={result['p95_ms']:>8} ms  "
+                      f"p99={result['p99_ms']:>8} ms  {result['rps']:>8} req/s  errors={result['errors']}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        services.stop()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(LATEST_FILE, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {BASELINE_FILE}")
+        return 0
+
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
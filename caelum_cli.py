@@ -3,28 +3,70 @@
 Caelum CLI — A command-line interface for testing the Caelum AI Assistant.
 This script allows you to interact with the LLM using a selected archetype,
 with options for auto-detection based on recent mood logs.
+
+Usage:
+    python caelum_cli.py                     # archetype auto-detected from recent moods
+    python caelum_cli.py --mood 3            # log a check-in first
+    python caelum_cli.py --archetype Fox     # force an archetype
+    python caelum_cli.py --summary           # print the mood summary and exit
 """
-import os
-import sqlite3
+import argparse
 from app.llm import LLMEngine
-import openai
-from app.config import Config
-
+from app.prompts import build_system_prompt
+from app.utils.helpers import (MOOD_ARCHETYPES, get_recent_mood_summary, get_writer, log_archetype_usage,
+                               log_mood, map_mood_to_archetype, mood_prompt_block)
 
+DEFAULT_USER_ID = "default_user"
 
 
-def main():
+def main(argv=None):
     """
     Main function to run the Caelum CLI.
     Prompts the user for input and outputs the response from the LLM.
     """
-    llm = LLMEngine()
+    archetypes = sorted(archetype for archetype, _ in MOOD_ARCHETYPES.values())
+    parser = argparse.ArgumentParser(description="Chat with Caelum from the terminal.")
+    parser.add_argument("--user", default=DEFAULT_USER_ID)
+    parser.add_argument("--mood", type=int, choices=range(1, 11), metavar="1-10", help="log a mood check-in first")
+    parser.add_argument("--archetype", choices=archetypes, help="override the mood-based archetype")
+    parser.add_argument("--summary", action="store_true", help="print the recent mood summary and exit")
+    args = parser.parse_args(argv)
 
+    if args.mood is not None:
+        log_mood(args.user, args.mood)
+        get_writer().flush()
+    summary = get_recent_mood_summary(args.user)
+    if args.summary:
+        print(summary or "No mood check-ins logged yet.")
+        return
 
+    if args.archetype:
+        guidance = next(g for a, g in MOOD_ARCHETYPES.values() if a == args.archetype)
+        archetype, mood_block = args.archetype, f"Lead as {args.archetype}: {guidance}"
+    else:
+        archetype, _ = map_mood_to_archetype(summary)
+        mood_block = mood_prompt_block(summary)
 
-    print("🧠 Caelum CLI is ready for development testing.")
-    
+    llm = LLMEngine()
 
+    print("🧠 Caelum CLI is ready for development testing.")
+    print(f"   Archetype: {archetype or 'Caelum (no mood logged)'} — type 'exit' to quit.")
+    while True:
+        try:
+            user_input = input("you> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if user_input.lower() in ("exit", "quit"):
+            break
+        if not user_input:
+            continue
+        system_msg = build_system_prompt(user_input, mood_block=mood_block).text
+        print(f"caelum> {llm.generate_response(user_input, system_msg=system_msg)}")
+        if archetype:
+            log_archetype_usage(args.user, archetype, is_custom=bool(args.archetype), module="cli",
+                                mood=summary["band"] if summary else None)
+    get_writer().flush()
 
 
 if __name__ == "__main__":
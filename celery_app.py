@@ -1,26 +1,46 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from app.log import connect_celery_logging
+from app.metrics import connect_celery_signals
 
 celery = Celery('tasks', broker=os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0'))
 
+# Recipients of the scheduled messages: a comma-separated RECIPIENT_PHONES list,
+# falling back to the single RECIPIENT_PHONE.
+RECIPIENTS = [
+    phone.strip()
+    for phone in os.environ.get('RECIPIENT_PHONES', os.environ.get('RECIPIENT_PHONE') or '').split(',')
+    if phone.strip()
+]
+
 celery.conf.update(
     result_backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0'),
     beat_schedule={
         'send-morning-affirmation-everyday': {
             'task': 'tasks.send_morning_affirmation',
             'schedule': crontab(hour=7, minute=0),
-            'args': (os.environ.get("RECIPIENT_PHONE"),)
+            'args': (RECIPIENTS,)
         },
         'send-evening-reflection-everyday': {
             'task': 'tasks.send_evening_reflection',
             'schedule': crontab(hour=21, minute=0),
-            'args': (os.environ.get("RECIPIENT_PHONE"),)
+            'args': (RECIPIENTS,)
         },
         'send-focus-time-suggestion-every-hour': {
             'task': 'tasks.send_focus_time_suggestion',
             'schedule': crontab(minute=0, hour='10-16'),
-            'args': (os.environ.get("RECIPIENT_PHONE"),)
+            'args': (RECIPIENTS,)
+        },
+        # Renders the audio of the messages above ahead of their send time.
+        'prerender-scheduled-audio': {
+            'task': 'tasks.prerender_scheduled_audio',
+            'schedule': 60.0 * float(os.environ.get('PRERENDER_INTERVAL_MINUTES', '15')),
         },
     }
 )
+
+# JSON queue logging in the worker, with the publisher's request ID in each task.
+connect_celery_logging()
+# Queue wait, run time and failures of every task, exported at /metrics.
+connect_celery_signals()
@@ -11,8 +11,103 @@ import os
 import logging
 
 
-# Set up basic logging configuration
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# Schema migrations, applied in order. PRAGMA user_version records the last one
+# applied, so each runs once per database. Tables that older databases may already
+# have (journal_entries, archetype_usage) use IF NOT EXISTS. Append new steps;
+# never edit one that has shipped.
+MIGRATIONS = [
+    # 1: conversation memory for /respond.
+    """
+    CREATE TABLE IF NOT EXISTS conversation_turns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        tokens INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_conversation_turns_user ON conversation_turns (user_id, id);
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        user_id TEXT PRIMARY KEY,
+        summary TEXT NOT NULL,
+        tokens INTEGER NOT NULL,
+        covered_until INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """,
+    # 2: mood log, archetype usage and user feedback.
+    """
+    CREATE TABLE IF NOT EXISTS mood_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        mood_score INTEGER NOT NULL,
+        note TEXT,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_mood_logs_user_time ON mood_logs (user_id, timestamp);
+    CREATE TABLE IF NOT EXISTS archetype_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        archetype TEXT,
+        is_custom INTEGER,
+        module TEXT,
+        mood TEXT,
+        timestamp TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_archetype_usage_user_time ON archetype_usage (user_id, timestamp);
+    CREATE TABLE IF NOT EXISTS user_feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        rating INTEGER,
+        comment TEXT,
+        archetype TEXT,
+        module TEXT,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_feedback_user_time ON user_feedback (user_id, timestamp);
+    """,
+    # 3: rolling mood aggregates, one row per user, updated with every mood log.
+    """
+    CREATE TABLE IF NOT EXISTS mood_aggregates (
+        user_id TEXT PRIMARY KEY,
+        ema REAL NOT NULL,
+        last_scores TEXT NOT NULL,
+        day_counts TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """,
+    # 4: Twilio delivery events (one row per send or status callback) and one
+    # summary row per message with the time it reached each status.
+    """
+    CREATE TABLE IF NOT EXISTS message_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_sid TEXT NOT NULL,
+        status TEXT NOT NULL,
+        recipient TEXT,
+        error_code TEXT,
+        error_message TEXT,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_message_events_sid ON message_events (message_sid, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_message_events_recipient_time ON message_events (recipient, timestamp);
+    CREATE TABLE IF NOT EXISTS message_deliveries (
+        message_sid TEXT PRIMARY KEY,
+        recipient TEXT,
+        status TEXT NOT NULL,
+        status_rank INTEGER NOT NULL,
+        queued_at TEXT,
+        sent_at TEXT,
+        delivered_at TEXT,
+        failed_at TEXT,
+        error_code TEXT,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_message_deliveries_queued ON message_deliveries (queued_at);
+    CREATE INDEX IF NOT EXISTS idx_message_deliveries_recipient ON message_deliveries (recipient, queued_at);
+    CREATE INDEX IF NOT EXISTS idx_message_deliveries_error ON message_deliveries (error_code, queued_at);
+    """,
+]
 
 # List of directories required for the application
 REQUIRED_DIRS = [
@@ -35,10 +130,50 @@ def create_directories():
 
 
 
+def migrate(conn) -> int:
+    """
+    Applies the pending MIGRATIONS to an open SQLite connection.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    for number, script in enumerate(MIGRATIONS, start=1):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+            continue
+        # One write transaction per step. The version is checked again inside it,
+        # so when several workers start at once, only one of them applies the step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < number:
+                for statement in script.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+                logging.info(f"🗄️ Applied database migration {number}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_databases():
+    """Create or migrate the SQLite tables and indexes."""
+    try:
+        from app.config import Config
+        from app.utils.helpers import get_db
+        version = migrate(get_db())
+        logging.info(f"🗄️ Database ready: {Config.DATABASE_PATH} (schema v{version})")
+    except Exception as e:
+        logging.error(f"❌ Error initializing database: {e}")
+
+
 def main():
     """Main function to set up directories and initialize databases."""
     create_directories()
-   
+    init_databases()
 
 if __name__ == "__main__":
+    # Set up basic logging configuration
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     main()
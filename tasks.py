@@ -1,15 +1,45 @@
 # tasks.py
-import os
+import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Optional, Union
+from celery import chord
 from celery_app import celery
-from twilio.rest import Client
-from gtts import gTTS
 from app.config import Config
+from app.log import truncate
+from app.messaging import get_dispatcher, get_send_limiter
+from app.pipeline import StageGraph
+from app.tts import get_tts_cache, synthesize
+from app.voice import transcribe_voice_note
+
+logger = logging.getLogger(__name__)
+
+# Reply sent when the LLM keeps failing after every retry.
+FALLBACK_REPLY = "I am sorry, I could not process your request."
+# Reply sent when a voice note cannot be downloaded or transcribed.
+VOICE_FALLBACK_REPLY = "I couldn't quite hear that voice note. Could you send it again, or type it out?"
+
+# LLM engine for the reply pipeline, created on first use so that importing
+# this module (e.g. from the webhook) does not build an OpenAI client.
+_llm = None
+
+
+def get_llm():
+    """
+    Returns the process-wide LLMEngine used by the reply tasks.
+    """
+    global _llm
+    if _llm is None:
+        from app.llm import LLMEngine
+        _llm = LLMEngine()
+    return _llm
 
 def generate_audio_message(text_response: str) -> str:
     """
-    Generates an audio file from the given text using gTTS, saves it to the 
-    audio directory, and returns the media URL for the generated audio file.
+    Returns the media URL for the audio of the given text. The audio comes from
+    the shared TTS cache, so repeated texts (like the scheduled messages) are
+    only rendered with gTTS once.
 
     Args:
         text_response (str): The text to convert to speech.
@@ -17,92 +47,525 @@ def generate_audio_message(text_response: str) -> str:
     Returns:
         str: The publicly accessible URL for the generated audio file.
     """
-    # Generate a unique filename for the audio file.
-    audio_filename = f"response_{uuid.uuid4().hex}.mp3"
-    audio_dir = os.path.join(os.getcwd(), "app", "static", "audio")
-    os.makedirs(audio_dir, exist_ok=True)
-    audio_filepath = os.path.join(audio_dir, audio_filename)
-    
-    # Generate the audio file using gTTS.
-    tts = gTTS(text_response)
-    tts.save(audio_filepath)
-    
-    # Construct the media URL using the static domain defined in Config.
-    # If Config does not define STATIC_DOMAIN, it defaults to the provided domain.
-    static_domain = getattr(Config, "STATIC_DOMAIN", "https://duck-healthy-easily.ngrok-free.app")
-    media_url = f"{static_domain}/static/audio/{audio_filename}"
-    return media_url
+    return synthesize(text_response).url
 
-def send_twilio_message(body: str, recipient: str, media_url: str) -> str:
+def send_twilio_message(body: str, recipient: str, media_url: Optional[str]) -> str:
     """
-    Sends a message via Twilio with the given message body and media URL.
+    Sends a message via Twilio with the given message body and media URL,
+    through the shared dispatcher so the connection pool is reused.
 
     Args:
-        body (str): The text message to send.
+        body (str): The text message to send (may be empty for media-only messages).
         recipient (str): The recipient's phone number.
-        media_url (str): The URL to the media (audio file).
+        media_url (str, optional): The URL to the media (audio file).
 
     Returns:
         str: The Twilio message SID.
     """
-    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
-    twilio_number = os.environ.get("TWILIO_NUMBER")
-    status_callback = getattr(Config, "STATUS_CALLBACK_URL", "https://duck-healthy-easily.ngrok-free.app/status")
-    message = client.messages.create(
-        body=body,
-        media_url=[media_url],
-        from_=twilio_number,
-        to=recipient,
-        status_callback=status_callback
+    return get_dispatcher().send(recipient, body, [media_url] if media_url else None)
+
+
+# === SCHEDULED MESSAGES === ⏰
+# The audio for these messages is rendered ahead of time by
+# prerender_scheduled_audio, so at the scheduled time delivery is a cache
+# lookup plus the Twilio call. Beat passes either one phone number or a list
+# of them. A list is fanned out: recipients are sent to in batches spread over
+# the workers, and a chord callback records each recipient's result.
+
+MORNING_AFFIRMATION = "Good morning! You are capable, resilient, and ready to seize the day!"
+EVENING_REFLECTION = ("Good evening. Take a moment to reflect on your day, celebrate your victories, "
+                      "and learn from your challenges.")
+FOCUS_TIME_SUGGESTION = (
+    "This is your moment for focused self-improvement. "
+    "Consider spending 15 minutes in quiet reflection, reading an inspiring article, "
+    "or planning your next step towards a better tomorrow."
+)
+
+# Scheduled task name -> the message it sends, for pre-rendering.
+SCHEDULED_MESSAGES = {
+    "tasks.send_morning_affirmation": MORNING_AFFIRMATION,
+    "tasks.send_evening_reflection": EVENING_REFLECTION,
+    "tasks.send_focus_time_suggestion": FOCUS_TIME_SUGGESTION,
+}
+
+@celery.task
+def prerender_scheduled_audio(lead_minutes: Optional[float] = None) -> List[str]:
+    """
+    Celery beat task that renders (or refreshes) the audio of every scheduled
+    message due within the lead time, so the delivery task only has to look
+    the file up. Refreshing a cached file also keeps it from being evicted.
+
+    Args:
+        lead_minutes (float, optional): How far ahead to look (default Config.PRERENDER_LEAD_MINUTES).
+
+    Returns:
+        list: The media URLs that are now ready.
+    """
+    lead = timedelta(minutes=lead_minutes or Config.PRERENDER_LEAD_MINUTES)
+    ready = []
+    for entry in celery.conf.beat_schedule.values():
+        text = SCHEDULED_MESSAGES.get(entry["task"])
+        if text is None:
+            continue
+        schedule = entry["schedule"]
+        if hasattr(schedule, "remaining_estimate"):
+            schedule.app = celery
+            if schedule.remaining_estimate(schedule.now()) > lead:
+                continue
+        url = render_audio_or_none(text)
+        if url:
+            ready.append(url)
+        else:
+            logger.warning("Pre-render failed for %s; it will render at send time.", entry["task"])
+    return ready
+
+def scheduled_audio_url(text: str) -> Optional[str]:
+    """
+    Returns the pre-rendered audio URL for a scheduled message. On a miss the
+    audio is rendered now, bounded by Config.TTS_STAGE_TIMEOUT.
+    """
+    cached = get_tts_cache().lookup(text, Config.TTS_LANG, Config.TTS_VOICE)
+    if cached:
+        return cached.url
+    logger.info("Scheduled audio was not pre-rendered; rendering at send time.")
+    return render_audio_or_none(text)
+
+def render_audio_or_none(text: str) -> Optional[str]:
+    """
+    Returns the media URL for the text's audio, or None if rendering fails or
+    takes longer than Config.TTS_STAGE_TIMEOUT.
+    """
+    graph = StageGraph("render")
+    graph.add("audio_url", lambda ctx: generate_audio_message(ctx["text"]),
+              timeout=Config.TTS_STAGE_TIMEOUT, retries=1)
+    return graph.run(text=text).values.get("audio_url")
+
+def fan_out_message(text: str, recipients: Union[str, List[str]]):
+    """
+    Sends a scheduled message to one or many recipients.
+
+    Args:
+        text (str): The message text.
+        recipients (str or list): One phone number, or a list of them.
+
+    Returns:
+        str or dict: The Twilio message SID for a single recipient; otherwise
+        the number of recipients and batches and the id of the chord whose
+        callback collects the per-recipient results.
+    """
+    media_url = scheduled_audio_url(text)
+    if isinstance(recipients, str):
+        return send_twilio_message(text, recipients, media_url)
+    size = Config.FANOUT_BATCH_SIZE
+    batches = [recipients[i:i + size] for i in range(0, len(recipients), size)]
+    job = chord(send_message_batch.s(text, media_url, batch) for batch in batches)(
+        record_fanout_results.s(text)
     )
-    return message.sid
+    return {"recipients": len(recipients), "batches": len(batches), "results_id": job.id}
+
+@celery.task(bind=True)
+def send_message_batch(self, text: str, media_url: Optional[str], recipients: List[str]) -> List[dict]:
+    """
+    Celery task that sends one message to a batch of recipients. Sends run in
+    parallel (Config.FANOUT_BATCH_CONCURRENCY) but are paced by the sender
+    number's shared rate limiter, so all batches together stay within
+    Config.TWILIO_SEND_RATE.
+
+    Args:
+        text (str): The message text.
+        media_url (str, optional): The pre-rendered audio URL.
+        recipients (list): The phone numbers in this batch.
+
+    Returns:
+        list: One {"recipient", "sid"} or {"recipient", "error"} dict per recipient.
+    """
+    limiter = get_send_limiter()
+
+    def send_one(recipient: str) -> dict:
+        limiter.acquire()
+        try:
+            return {"recipient": recipient, "sid": send_twilio_message(text, recipient, media_url)}
+        except Exception as e:
+            logger.warning("Scheduled send to %s failed: %r", recipient, e)
+            return {"recipient": recipient, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=Config.FANOUT_BATCH_CONCURRENCY) as pool:
+        return list(pool.map(send_one, recipients))
+
+@celery.task
+def record_fanout_results(batch_results: List[List[dict]], text: str) -> dict:
+    """
+    Celery chord callback that collects the per-recipient results of a fan-out.
+
+    Args:
+        batch_results (list): The return values of every send_message_batch task.
+        text (str): The message that was sent.
+
+    Returns:
+        dict: Sent/failed counts and every recipient's result.
+    """
+    results = [result for batch in batch_results for result in batch]
+    failed = [r for r in results if "error" in r]
+    logger.info("Fan-out finished: %d sent, %d failed for message %r",
+                len(results) - len(failed), len(failed), truncate(text, 40))
+    return {"sent": len(results) - len(failed), "failed": len(failed), "results": results}
 
 @celery.task
-def send_morning_affirmation(recipient: str) -> str:
+def send_morning_affirmation(recipients: Union[str, List[str]]):
     """
     Celery task that sends a morning affirmation via Twilio.
 
     Args:
-        recipient (str): The recipient's phone number.
+        recipients (str or list): The recipient's phone number, or a list of them.
 
     Returns:
-        str: The Twilio message SID.
+        str or dict: The Twilio message SID, or the fan-out summary for a list.
     """
-    affirmation = "Good morning! You are capable, resilient, and ready to seize the day!"
-    media_url = generate_audio_message(affirmation)
-    return send_twilio_message(affirmation, recipient, media_url)
+    return fan_out_message(MORNING_AFFIRMATION, recipients)
 
 @celery.task
-def send_evening_reflection(recipient: str) -> str:
+def send_evening_reflection(recipients: Union[str, List[str]]):
     """
     Celery task that sends an evening reflection message via Twilio.
 
     Args:
-        recipient (str): The recipient's phone number.
+        recipients (str or list): The recipient's phone number, or a list of them.
 
     Returns:
-        str: The Twilio message SID.
+        str or dict: The Twilio message SID, or the fan-out summary for a list.
     """
-    reflection = ("Good evening. Take a moment to reflect on your day, celebrate your victories, "
-                  "and learn from your challenges.")
-    media_url = generate_audio_message(reflection)
-    return send_twilio_message(reflection, recipient, media_url)
+    return fan_out_message(EVENING_REFLECTION, recipients)
 
 @celery.task
-def send_focus_time_suggestion(recipient: str) -> str:
+def send_focus_time_suggestion(recipients: Union[str, List[str]]):
     """
     Celery task that sends a focus time suggestion via Twilio.
 
     Args:
-        recipient (str): The recipient's phone number.
+        recipients (str or list): The recipient's phone number, or a list of them.
 
     Returns:
-        str: The Twilio message SID.
+        str or dict: The Twilio message SID, or the fan-out summary for a list.
     """
-    suggestion = (
-        "This is your moment for focused self-improvement. "
-        "Consider spending 15 minutes in quiet reflection, reading an inspiring article, "
-        "or planning your next step towards a better tomorrow."
-    )
-    media_url = generate_audio_message(suggestion)
-    return send_twilio_message(suggestion, recipient, media_url)
+    return fan_out_message(FOCUS_TIME_SUGGESTION, recipients)
+
+
+# === REPLY PIPELINE === 🔁
+# The Twilio webhook only queues handle_incoming_message; the reply is then
+# produced by a stage graph:
+#
+#     reply_text ──┬──> text_sid ──┐
+#                  └──> audio_url ─┴──> media_sid
+#
+# The text goes out as soon as the LLM finishes while the audio renders
+# alongside it, and the audio follows once ready. If the reply's audio is
+# already cached, both go out as one MMS. With Config.REPLY_TEXT_FIRST
+# disabled, the text waits for the audio and is sent together with it.
+# A failed or slow render never stops the text from being delivered.
+#
+# A timed-out send is abandoned, not cancelled, so it may still go through.
+# Sends are therefore keyed per reply and stage in the idempotency store, and
+# a retry passes back the reply text and audio already produced: only the
+# sends that have not happened run again, never the LLM or the render. A send
+# that failed in a way Twilio may still have delivered (a read timeout, a
+# dropped connection, a 5xx) keeps its key as "uncertain" and is not retried,
+# so the user never gets the same reply twice.
+
+# Stages whose values a retry reuses; the send stages always run again (behind their keys).
+REUSABLE_STAGES = ("reply_text", "cached_audio_url", "audio_url")
+
+
+class SendInFlight(Exception):
+    """Raised when an earlier attempt at the same send may still be running."""
+
+
+def _send_once(ctx: dict, stage: str, send) -> str:
+    from app.idempotency import get_idempotency_store
+    from app.messaging import failed_before_delivery
+    outcome = get_idempotency_store().run(f"reply:{ctx['reply_id']}:{stage}", send, wait=0,
+                                          release_on=failed_before_delivery)
+    if outcome.result is None:
+        raise SendInFlight(f"{stage} of reply {ctx['reply_id']} is still being sent")
+    return outcome.result
+
+def _generate_reply_text(ctx: dict) -> str:
+    from app.prompts import build_system_prompt
+    from app.routing import SMS, routed_response
+    system_msg = build_system_prompt(ctx["message_body"]).text
+    return routed_response(get_llm(), ctx["message_body"], SMS, system_msg=system_msg).text
+
+def _cached_reply_audio(ctx: dict) -> Optional[str]:
+    cached = get_tts_cache().lookup(ctx["reply_text"], Config.TTS_LANG, Config.TTS_VOICE)
+    return cached.url if cached else None
+
+def _render_reply_audio(ctx: dict) -> str:
+    return generate_audio_message(ctx["reply_text"])
+
+def _send_reply_text(ctx: dict) -> str:
+    return _send_once(ctx, "text_sid", lambda: send_twilio_message(
+        ctx["reply_text"], ctx["recipient"], ctx.get("cached_audio_url")))
+
+def _send_reply_text_with_audio(ctx: dict) -> str:
+    media_url = ctx.get("cached_audio_url") or ctx.get("audio_url")
+    return _send_once(ctx, "text_sid", lambda: send_twilio_message(ctx["reply_text"], ctx["recipient"], media_url))
+
+def _send_reply_media(ctx: dict) -> Optional[str]:
+    if ctx.get("cached_audio_url"):
+        return None  # Already sent together with the text.
+    return _send_once(ctx, "media_sid", lambda: send_twilio_message("", ctx["recipient"], ctx["audio_url"]))
+
+def build_reply_graph() -> StageGraph:
+    """
+    Builds the stage graph that turns an incoming message into a delivered reply.
+    """
+    graph = StageGraph("reply")
+    graph.add("reply_text", _generate_reply_text, timeout=Config.LLM_STAGE_TIMEOUT, retries=2,
+              fallback=lambda error, ctx: FALLBACK_REPLY)
+    graph.add("cached_audio_url", _cached_reply_audio, deps=["reply_text"])
+    graph.add("audio_url", _render_reply_audio, deps=["reply_text"],
+              timeout=Config.TTS_STAGE_TIMEOUT, retries=1)
+    if Config.REPLY_TEXT_FIRST:
+        graph.add("text_sid", _send_reply_text, deps=["reply_text", "cached_audio_url"],
+                  timeout=Config.SEND_STAGE_TIMEOUT)
+        graph.add("media_sid", _send_reply_media, deps=["audio_url", "text_sid"],
+                  timeout=Config.SEND_STAGE_TIMEOUT)
+    else:
+        graph.add("text_sid", _send_reply_text_with_audio, deps=["reply_text"], after=["audio_url"],
+                  timeout=Config.SEND_STAGE_TIMEOUT)
+    return graph
+
+def _run_reply_graph(message_body: str, recipient: str, reply_id: str, done: Optional[dict] = None):
+    """
+    Runs the reply graph, resuming from the stage values in `done`.
+    """
+    return build_reply_graph().run(message_body=message_body, recipient=recipient, reply_id=reply_id,
+                                   **(done or {}))
+
+def _reusable_values(result) -> dict:
+    return {name: result.values[name] for name in REUSABLE_STAGES if name in result.values}
+
+@celery.task(bind=True, max_retries=3)
+def handle_incoming_message(self, message_body: str, recipient: str, reply_id: Optional[str] = None,
+                            done: Optional[dict] = None) -> dict:
+    """
+    Celery task that runs the reply graph for an incoming message.
+    The task is retried only if the reply text was certainly not delivered,
+    and the retry reuses the reply text and audio that were already produced.
+
+    Args:
+        message_body (str): The text the user sent.
+        recipient (str): The phone number to reply to.
+        reply_id (str, optional): Keys the sends of this reply across retries
+            (default: the task ID).
+        done (dict, optional): Stage values from an earlier attempt.
+
+    Returns:
+        dict: The stage values, errors and durations of the run.
+    """
+    reply_id = reply_id or self.request.id or uuid.uuid4().hex
+    from app.idempotency import OutcomeUnknown
+    result = _run_reply_graph(message_body, recipient, reply_id, done)
+    if isinstance(result.errors.get("text_sid"), OutcomeUnknown):
+        logger.warning("Reply %s may or may not have been delivered; not retrying: %s",
+                       reply_id, result.errors["text_sid"])
+    elif "text_sid" in result.errors:
+        raise self.retry(exc=result.errors["text_sid"], countdown=2 ** self.request.retries,
+                         kwargs={"reply_id": reply_id, "done": _reusable_values(result)})
+    return result.summary()
+
+def queue_reply(sender: str, message_body: str):
+    """
+    Queues the reply pipeline for an incoming message.
+
+    Args:
+        sender (str): The phone number that sent the message.
+        message_body (str): The text the user sent.
+
+    Returns:
+        AsyncResult: The result handle of the reply task.
+    """
+    return handle_incoming_message.delay(message_body, sender)
+
+@celery.task(bind=True, max_retries=2)
+def handle_voice_message(self, media_url: str, media_type: Optional[str], recipient: str,
+                         caption: str = "") -> dict:
+    """
+    Celery task that transcribes a voice note and runs the reply graph on the
+    transcript (after any text sent along with it). If the note still cannot
+    be transcribed after the retries, the sender is asked to resend it. A
+    reply that cannot be delivered is retried by handle_incoming_message.
+
+    Args:
+        media_url (str): The MediaUrl0 of the incoming message.
+        media_type (str, optional): Its MediaContentType0.
+        recipient (str): The phone number to reply to.
+        caption (str): Text sent with the voice note, if any.
+
+    Returns:
+        dict: The stage values, errors and durations of the run.
+    """
+    try:
+        transcript = transcribe_voice_note(media_url, media_type)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        logger.exception("Voice note from %s could not be transcribed", recipient)
+        return {"values": {"text_sid": send_twilio_message(VOICE_FALLBACK_REPLY, recipient, None)},
+                "errors": {"transcript": repr(e)}, "durations": {}}
+    logger.info("Transcribed voice note from %s: %s", recipient, truncate(transcript))
+    message_body = "\n".join(part for part in (caption, transcript) if part)
+    reply_id = self.request.id or uuid.uuid4().hex
+    result = _run_reply_graph(message_body, recipient, reply_id)
+    if "text_sid" in result.errors:
+        # Retry the delivery only; the note is not transcribed again.
+        handle_incoming_message.apply_async((message_body, recipient),
+                                            {"reply_id": reply_id, "done": _reusable_values(result)}, countdown=1)
+    return result.summary()
+
+def queue_voice_reply(sender: str, media_url: str, media_type: Optional[str], caption: str = ""):
+    """
+    Queues transcription and the reply pipeline for an incoming voice note.
+
+    Args:
+        sender (str): The phone number that sent the message.
+        media_url (str): The MediaUrl0 of the message.
+        media_type (str, optional): Its MediaContentType0.
+        caption (str): Text sent with the voice note, if any.
+
+    Returns:
+        AsyncResult: The result handle of the voice task.
+    """
+    return handle_voice_message.delay(media_url, media_type, sender, caption)
+
+
+# === CONVERSATION MEMORY === 🧵
+SUMMARY_SYSTEM_PROMPT = (
+    "You keep the running memory of a conversation between Caelum, an ADHD assistant, and the woman "
+    "he supports. Merge the previous summary with the new turns into one short third-person summary. "
+    "Keep her goals, commitments, moods, preferences and anything Caelum promised; drop small talk."
+)
+
+def _summarize_turns(previous: Optional[str], turns: List[dict]) -> str:
+    from app.llm import LLMEngine
+    from app.ratelimit import BATCH
+    # Summaries can wait; live replies go first when OpenAI capacity is short.
+    engine = LLMEngine(debug=False, priority=BATCH)
+    engine.max_tokens = Config.MEMORY_SUMMARY_MAX_TOKENS
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    prompt = f"Previous summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"
+    return engine.generate_response(prompt, system_msg=SUMMARY_SYSTEM_PROMPT, use_cache=False)
+
+# Seconds a queued summary keeps others for the same user from being queued
+# (covers the retries; the task frees it as soon as it is done).
+SUMMARY_CLAIM_TTL = 300
+
+def _summary_key(user_id: str) -> str:
+    return f"summary:{user_id}"
+
+@celery.task(bind=True, max_retries=3)
+def summarize_conversation(self, user_id: str) -> bool:
+    """
+    Celery task that folds the turns that fell out of the /respond context
+    window into the user's rolling summary.
+
+    Args:
+        user_id (str): The user whose conversation to summarize.
+
+    Returns:
+        bool: True if the summary was updated.
+    """
+    from app.idempotency import get_idempotency_store
+    from app.memory import get_memory
+    try:
+        updated = get_memory().fold_into_summary(user_id, _summarize_turns)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        get_idempotency_store().release(_summary_key(user_id))
+        raise
+    get_idempotency_store().release(_summary_key(user_id))
+    return updated
+
+def queue_summary(user_id: str):
+    """
+    Queues a summary update for the user's conversation, unless one is
+    already queued or running.
+
+    Args:
+        user_id (str): The user.
+
+    Returns:
+        AsyncResult: The result handle of the summary task, or None if one is pending.
+    """
+    from app.idempotency import get_idempotency_store
+    if not get_idempotency_store().claim(_summary_key(user_id), ttl=SUMMARY_CLAIM_TTL):
+        return None
+    try:
+        return summarize_conversation.delay(user_id)
+    except Exception:
+        get_idempotency_store().release(_summary_key(user_id))
+        raise
+
+
+# === PDF EXPORTS === 📄
+# Rendering is done here, not in the web request. The job ID is the export's
+# content hash (see app/exports.py), so the task is queued under that ID and a
+# repeated export finds the finished PDF without rendering it again.
+
+@celery.task(bind=True, max_retries=2)
+def render_export(self, markdown_text: str, title: str = "") -> str:
+    """
+    Celery task that renders a Markdown document to a PDF in Config.EXPORT_DIR.
+
+    Args:
+        markdown_text (str): The document.
+        title (str): The document title.
+
+    Returns:
+        str: The PDF's filename.
+    """
+    from app.exports import export_pdf
+    try:
+        return export_pdf(markdown_text, title).filename
+    except Exception as e:
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+def queue_export(markdown_text: str, title: str = "") -> str:
+    """
+    Queues a PDF export unless it has already been rendered.
+
+    Args:
+        markdown_text (str): The document.
+        title (str): The document title.
+
+    Returns:
+        str: The job ID to poll with export_status.
+    """
+    from app.exports import export_id, find_export
+    job_id = export_id(markdown_text, title)
+    if not find_export(job_id):
+        # A failed (or expired) earlier run left its result under this ID; drop
+        # it so export_status reports the new run rather than the old outcome.
+        result = render_export.AsyncResult(job_id)
+        try:
+            if result.state in ("FAILURE", "SUCCESS"):
+                result.forget()
+        except Exception as e:
+            logger.warning("Could not clear export job %s: %r", job_id, e)
+        render_export.apply_async((markdown_text, title), task_id=job_id)
+    return job_id
+
+def export_status(job_id: str) -> str:
+    """
+    Returns "done", "failed" or "pending" for an export job, or "expired" if
+    the PDF was rendered but has since been deleted (export it again).
+    """
+    from app.exports import find_export
+    if find_export(job_id):
+        return "done"
+    try:
+        state = render_export.AsyncResult(job_id).state
+    except Exception as e:
+        logger.warning("Could not read export job %s: %r", job_id, e)
+        return "pending"
+    return {"FAILURE": "failed", "SUCCESS": "expired"}.get(state, "pending")
@@ -0,0 +1,33 @@
+# tests/conftest.py
+import pytest
+from app.config import Config
+from benchmarks.fakes import FakeServices
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_services(tmp_path_factory):
+    """
+    Points the app at the local OpenAI/Twilio/TTS stand-ins so no test needs
+    network access or real credentials.
+    """
+    services = FakeServices()
+    overrides = {
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_BASE_URL": f"{services.url}/v1",
+        "TWILIO_ACCOUNT_SID": "ACfake",
+        "TWILIO_AUTH_TOKEN": "fake-token",
+        "TWILIO_NUMBER": "+15550000000",
+        "TWILIO_API_BASE_URL": services.url,
+        "TTS_BACKEND_URL": f"{services.url}/tts",
+        "REDIS_URL": "",
+        "OPENAI_RPM_LIMIT": 0,
+        "OPENAI_TPM_LIMIT": 0,
+        "DATABASE_PATH": str(tmp_path_factory.mktemp("db") / "caelum.db"),
+    }
+    originals = {name: getattr(Config, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    yield services
+    for name, value in originals.items():
+        setattr(Config, name, value)
+    services.stop()
@@ -0,0 +1,128 @@
+# tests/test_async_llm.py
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.llm import AsyncLLMEngine
+
+
+class SlowCompletions:
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        message = SimpleNamespace(content=kwargs["messages"][-1]["content"].upper())
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeClient:
+    closed = 0
+
+    def __init__(self, completions):
+        self.chat = SimpleNamespace(completions=completions)
+
+    async def close(self):
+        FakeClient.closed += 1
+
+
+def make_engine(completions, **kwargs):
+    engine = AsyncLLMEngine(debug=False, cache=None, **kwargs)
+    engine.cache = None
+    engine._create_client = lambda: FakeClient(completions)
+    return engine
+
+def test_concurrency_gate_limits_in_flight_requests():
+    completions = SlowCompletions(0.02)
+    engine = make_engine(completions, max_concurrency=3)
+
+    async def run():
+        return await asyncio.gather(*(engine.generate_response(f"hi {i}") for i in range(10)))
+
+    replies = asyncio.run(run())
+    assert replies == [f"HI {i}" for i in range(10)]
+    assert completions.peak == 3
+
+def test_timeout_cancels_request_and_frees_slot():
+    completions = SlowCompletions(1.0)
+    engine = make_engine(completions, max_concurrency=1)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await engine.generate_response("slow", timeout=0.01)
+        assert completions.in_flight == 0
+        completions.delay = 0
+        return await engine.generate_response("fast", timeout=1)
+
+    assert asyncio.run(run()) == "FAST"
+
+def test_rate_limiter_waits_do_not_use_the_default_executor(monkeypatch):
+    import threading
+    release = threading.Event()
+    waits = []
+
+    def slow_admit(messages, *args):
+        waits.append(threading.current_thread().name)
+        release.wait(1)
+        return 0
+
+    engine = make_engine(SlowCompletions(0), max_concurrency=2)
+    monkeypatch.setattr(engine, "_admit", slow_admit)
+
+    async def run():
+        from concurrent.futures import ThreadPoolExecutor
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        pending = asyncio.ensure_future(engine.generate_response("hi"))
+        await asyncio.sleep(0.05)
+        # The default executor's only thread is still free while the request waits for admission.
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: "free"), 0.5) == "free"
+        release.set()
+        return await pending
+
+    assert asyncio.run(run()) == "HI"
+    assert waits[0].startswith("llm-admit")
+
+def test_concurrency_cap_holds_across_event_loops_and_clients_close_with_their_loop():
+    import threading
+    completions = SlowCompletions(0.02)
+    engine = make_engine(completions, max_concurrency=2)
+    closed_before = FakeClient.closed
+
+    async def request(i):
+        return await engine.generate_response(f"hi {i}")
+
+    def one_request_loop(i):
+        # Like a Flask async view: a fresh event loop per request.
+        asyncio.run(request(i))
+
+    threads = [threading.Thread(target=one_request_loop, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert completions.peak == 2
+    assert FakeClient.closed - closed_before == 8
+    assert engine._gate.active == 0
+
+def test_cancelled_request_gives_its_rate_limit_charge_back(monkeypatch):
+    settled = []
+    engine = make_engine(SlowCompletions(1.0))
+    monkeypatch.setattr(engine, "_admit", lambda messages, *args: 500)
+    monkeypatch.setattr("app.llm.get_openai_limiter",
+                        lambda: SimpleNamespace(settle=lambda model, cost, used: settled.append((cost, used))))
+
+    async def run():
+        request = asyncio.ensure_future(engine.generate_response("hi", timeout=5))
+        await asyncio.sleep(0.05)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+
+    asyncio.run(run())
+    assert len(settled) == 1 and settled[0][0] == 500 and settled[0][1] < 500
@@ -0,0 +1,99 @@
+# tests/test_exports.py
+import threading
+import time
+import pytest
+from app import create_app
+from app import exports
+from app.exports import RenderSlots, export_id, export_pdf, find_export
+
+
+def fake_renderer(calls):
+    def render(page, path):
+        calls.append(page)
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4 fake")
+    return render
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(exports.Config, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(exports, "_slots", None)
+    return tmp_path
+
+
+def test_export_is_rendered_once_per_content_hash(export_dir):
+    calls = []
+    first = export_pdf("# Week\n\n- slept *well*", "Journal", renderer=fake_renderer(calls))
+    again = export_pdf("# Week\n\n- slept *well*", "Journal", renderer=fake_renderer(calls))
+    other = export_pdf("# Week\n\n- slept *well*", "Another title", renderer=fake_renderer(calls))
+    assert first == again and first.job_id == export_id("# Week\n\n- slept *well*", "Journal")
+    assert other.job_id != first.job_id
+    assert len(calls) == 2
+    assert "<em>well</em>" in calls[0] and "<h1>Journal</h1>" in calls[0]
+    assert find_export(first.job_id).path == first.path
+    assert find_export("../../etc/passwd") is None
+
+
+def test_render_slots_bound_concurrent_renders(tmp_path):
+    slots = RenderSlots(str(tmp_path), 2, poll_interval=0.01)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def render():
+        handle = slots.acquire()
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        slots.release(handle)
+
+    threads = [threading.Thread(target=render) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+
+
+def test_export_routes_queue_poll_and_download(export_dir, monkeypatch):
+    queued = []
+    monkeypatch.setattr("tasks.render_export.apply_async", lambda args, task_id: queued.append(task_id))
+    monkeypatch.setattr("tasks.render_export.AsyncResult", lambda job_id: type("R", (), {"state": "PENDING"})())
+    client = create_app().test_client()
+
+    response = client.post("/exports", json={"markdown": "# Notes", "title": "Today"})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert queued == [job_id]
+    assert client.get(f"/exports/{job_id}").get_json()["status"] == "pending"
+    assert client.get(f"/exports/{job_id}/download").status_code == 404
+
+    export_pdf("# Notes", "Today", renderer=fake_renderer([]))
+    status = client.get(f"/exports/{job_id}").get_json()
+    assert status["status"] == "done"
+    download = client.get(status["download_url"])
+    assert download.mimetype == "application/pdf"
+    assert download.data == b"%PDF-1.4 fake"
+    # Exporting the same document again does not queue another render.
+    assert client.post("/exports", json={"markdown": "# Notes", "title": "Today"}).status_code == 200
+    assert queued == [job_id]
+
+
+def test_raw_html_is_escaped_and_network_loads_are_blocked():
+    from app.exports import PDF_OPTIONS, render_html
+    page = render_html('<img src="http://169.254.169.254/latest">\n\nHi <link href="http://internal/x">')
+    assert "<img" not in page and "<link" not in page
+    assert "&lt;img src=" in page
+    assert PDF_OPTIONS["proxy"] == "http://127.0.0.1:9"
+
+
+def test_failed_export_is_forgotten_before_it_is_queued_again(export_dir, monkeypatch):
+    import tasks
+    forgotten, queued = [], []
+    result = type("R", (), {"state": "FAILURE", "forget": lambda self: forgotten.append(True)})()
+    monkeypatch.setattr("tasks.render_export.AsyncResult", lambda job_id: result)
+    monkeypatch.setattr("tasks.render_export.apply_async", lambda args, task_id: queued.append(task_id))
+    job_id = tasks.queue_export("# Notes", "Retry")
+    assert forgotten == [True] and queued == [job_id]
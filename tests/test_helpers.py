@@ -0,0 +1,88 @@
+# tests/test_helpers.py
+import sqlite3
+import threading
+from app.utils import helpers
+from app.utils.helpers import BatchWriter, get_db
+from init_system import MIGRATIONS, migrate
+
+
+def test_connection_uses_wal_and_is_reused_per_thread(tmp_path):
+    path = str(tmp_path / "caelum.db")
+    conn = get_db(path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert get_db(path) is conn
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_db(path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+def test_migrations_upgrade_existing_database_once(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("CREATE TABLE archetype_usage (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+                 "archetype TEXT, is_custom INTEGER, module TEXT, mood TEXT, timestamp TEXT)")
+    assert migrate(conn) == len(MIGRATIONS)
+    assert migrate(conn) == len(MIGRATIONS)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM archetype_usage WHERE user_id = 'u' "
+                        "ORDER BY timestamp DESC").fetchall()
+    assert "idx_archetype_usage_user_time" in str(plan)
+
+def test_batch_writer_defers_and_groups_inserts(tmp_path, monkeypatch):
+    path = str(tmp_path / "caelum.db")
+    writer = BatchWriter(path, flush_interval=60)
+    monkeypatch.setattr(helpers, "_writer", writer)
+    for score in (3, 5, 8):
+        helpers.log_mood("u1", score)
+    helpers.log_archetype_usage("u1", "Jasper", module="spiral", mood="low")
+    helpers.log_user_feedback("u1", rating=5, comment="helpful")
+    monkeypatch.setattr(helpers.Config, "DATABASE_PATH", path)
+    assert helpers.get_recent_moods("u1") == []
+    assert writer.flush() == 5
+    assert [row["mood_score"] for row in helpers.get_recent_moods("u1")] == [8, 5, 3]
+    assert get_db(path).execute("SELECT COUNT(*) FROM user_feedback").fetchone()[0] == 1
+
+def test_mood_aggregates_update_on_write_and_route_archetype(tmp_path, monkeypatch):
+    path = str(tmp_path / "caelum.db")
+    writer = BatchWriter(path, flush_interval=60)
+    monkeypatch.setattr(helpers, "_writer", writer)
+    monkeypatch.setattr(helpers.Config, "DATABASE_PATH", path)
+    monkeypatch.setattr(helpers.Config, "MOOD_LAST_N", 3)
+    assert helpers.get_recent_mood_summary("u1") is None
+    for score in (8, 6, 4, 2):
+        helpers.log_mood("u1", score)
+    writer.flush()
+    summary = helpers.get_recent_mood_summary("u1")
+    assert summary["last_scores"] == [6, 4, 2]
+    assert summary["total"] == 4
+    assert summary["band_counts"] == {"low": 1, "medium": 2, "high": 1}
+    assert summary["ema"] == round(((8 + 0.3 * (6 - 8)) * 0.7 + 0.3 * 4) * 0.7 + 0.3 * 2, 2)
+    assert helpers.map_mood_to_archetype(summary)[0] == "Orion"
+    assert helpers.map_mood_to_archetype(helpers.with_new_score(summary, 9))[0] == "Fox"
+
+def test_status_events_build_delivery_timeline_and_reports(tmp_path, monkeypatch):
+    path = str(tmp_path / "caelum.db")
+    writer = BatchWriter(path, flush_interval=60)
+    monkeypatch.setattr(helpers, "_writer", writer)
+    monkeypatch.setattr(helpers.Config, "DATABASE_PATH", path)
+    times = iter(["2026-01-01T10:00:00+00:00", "2026-01-01T10:00:02+00:00", "2026-01-01T10:00:01+00:00",
+                  "2026-01-01T10:00:00+00:00", "2026-01-01T10:00:05+00:00", "2026-01-01T10:00:30+00:00"])
+    monkeypatch.setattr(helpers, "_now", lambda: next(times))
+    helpers.log_message_status("SM1", "queued", "+15550001111")
+    helpers.log_message_status("SM1", "delivered", "+15550001111")
+    # A late "sent" callback fills in its timestamp but does not undo "delivered".
+    helpers.log_message_status("SM1", "sent", "+15550001111")
+    helpers.log_message_status("SM2", "queued", "+15550002222")
+    helpers.log_message_status("SM2", "sent", "+15550002222")
+    helpers.log_message_status("SM2", "undelivered", "+15550002222", "30003", "Unreachable handset")
+    assert writer.flush() == 6
+
+    since = "2026-01-01T00:00:00+00:00"
+    latency = helpers.get_delivery_latency(since)
+    assert latency["queued_to_sent"] == {"count": 2, "avg": 3.0, "p50": 5.0, "p95": 5.0}
+    assert latency["queued_to_delivered"]["avg"] == 2.0
+    failures = helpers.get_failure_rates(since)
+    assert failures["messages"] == 2 and failures["failure_rate"] == 0.5
+    assert failures["by_error_code"] == [{"error_code": "30003", "count": 1, "rate": 0.5}]
+    history = helpers.get_recipient_history("+15550001111")
+    assert [(m["message_sid"], m["status"]) for m in history] == [("SM1", "delivered")]
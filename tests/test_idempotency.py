@@ -0,0 +1,82 @@
+# tests/test_idempotency.py
+import threading
+import pytest
+from app.idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def store():
+    return IdempotencyStore(ttl=60, pending_ttl=5, redis_url="", poll_interval=0.01)
+
+
+def test_work_runs_once_and_duplicates_get_the_stored_result(store):
+    calls = []
+    first = store.run("webhook:SM1", lambda: calls.append(1) or {"task_id": "t1"})
+    again = store.run("webhook:SM1", lambda: calls.append(2) or {"task_id": "t2"})
+    assert first == ({"task_id": "t1"}, False)
+    assert again == ({"task_id": "t1"}, True)
+    assert calls == [1]
+    assert store.run("webhook:SM2", lambda: "other").duplicate is False
+
+
+def test_failed_work_releases_the_key_for_the_next_retry(store):
+    with pytest.raises(RuntimeError):
+        store.run("webhook:SM1", lambda: (_ for _ in ()).throw(RuntimeError("broker down")))
+    assert store.run("webhook:SM1", lambda: "queued") == ("queued", False)
+
+
+def test_retry_during_first_delivery_attaches_to_it(store):
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def slow_work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "reply-1"
+
+    results = {}
+    first = threading.Thread(target=lambda: results.update(first=store.run("webhook:SM1", slow_work)))
+    first.start()
+    started.wait(5)
+    retry = threading.Thread(target=lambda: results.update(retry=store.run("webhook:SM1", slow_work, wait=5)))
+    retry.start()
+    release.set()
+    first.join()
+    retry.join()
+    assert calls == [1]
+    assert results == {"first": ("reply-1", False), "retry": ("reply-1", True)}
+    # A retry that gives up waiting does not run the work either.
+    store._claim("webhook:SM3")
+    assert store.run("webhook:SM3", slow_work, wait=0) == (None, True)
+    assert calls == [1]
+
+
+def test_local_keys_expire_from_the_front_and_are_capped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.idempotency.time.time", lambda: now[0])
+    store = IdempotencyStore(ttl=10, pending_ttl=5, redis_url="", max_local_keys=3)
+    for i in range(5):
+        store.run(f"status:SM{i}", lambda: "logged")
+    assert list(store._local) == ["status:SM2", "status:SM3", "status:SM4"]
+    now[0] += 11
+    assert store.run("status:SM9", lambda: "logged").duplicate is False
+    assert list(store._local) == ["status:SM9"]
+
+
+def test_rejected_failure_keeps_the_key_as_uncertain(store):
+    from app.idempotency import OutcomeUnknown
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise TimeoutError("response lost")
+
+    with pytest.raises(OutcomeUnknown):
+        store.run("reply:R1:text_sid", send, release_on=lambda e: not isinstance(e, TimeoutError))
+    with pytest.raises(OutcomeUnknown):
+        store.run("reply:R1:text_sid", send, wait=0)
+    assert calls == [1]
+    with pytest.raises(ConnectionError):
+        store.run("reply:R2:text_sid", lambda: (_ for _ in ()).throw(ConnectionError("refused")),
+                  release_on=lambda e: isinstance(e, ConnectionError))
+    assert store.run("reply:R2:text_sid", lambda: "SM2") == ("SM2", False)
@@ -0,0 +1,11 @@
+# tests/test_import_time.py
+import json
+import pytest
+from benchmarks.import_time import BUDGET_FILE, loaded_modules
+
+with open(BUDGET_FILE) as f:
+    BUDGETS = json.load(f)
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_boot_modules_do_not_import_heavy_dependencies(module):
+    assert loaded_modules(module, BUDGETS[module]["forbidden"]) == []
@@ -0,0 +1,44 @@
+# tests/test_llm_cache.py
+from types import SimpleNamespace
+import app.llm
+from app.llm import LLMEngine
+from app.llm_cache import ResponseCache
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=f"reply {self.calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_local_lru_hits_misses_and_eviction():
+    cache = ResponseCache(max_entries=2, ttl=60, redis_url="")
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+    assert cache.stats() == {"hits": 2, "misses": 1, "entries": 2}
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = ResponseCache(ttl=10, redis_url="")
+    now = [1000.0]
+    monkeypatch.setattr("app.llm_cache.time.time", lambda: now[0])
+    cache.set("a", "1")
+    now[0] += 11
+    assert cache.get("a") is None
+
+def test_generate_response_uses_cache_unless_opted_out(monkeypatch):
+    completions = FakeCompletions()
+    monkeypatch.setattr(app.llm, "_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    engine = LLMEngine(debug=False, cache=ResponseCache(redis_url=""))
+    assert engine.generate_response("Caelum, start my morning.") == "reply 1"
+    assert engine.generate_response("Caelum, start my morning.") == "reply 1"
+    assert engine.generate_response("Caelum, start my morning.", use_cache=False) == "reply 2"
+    assert engine.generate_response("Caelum, start my morning.", system_msg="Be brief.") == "reply 3"
+    assert completions.calls == 3
@@ -0,0 +1,65 @@
+# tests/test_log.py
+import io
+import json
+import logging
+import queue
+from app import create_app
+from app import log
+from app.log import DroppingQueueHandler, SamplingFilter, truncate
+
+
+def test_truncate_shortens_long_text():
+    assert truncate("short", 10) == "short"
+    assert truncate("x" * 30, 10) == "xxxxxxxxxx… (+20 chars)"
+
+def test_sampling_filter_keeps_info_and_samples_debug():
+    debug = logging.makeLogRecord({"levelno": logging.DEBUG})
+    info = logging.makeLogRecord({"levelno": logging.INFO})
+    assert SamplingFilter(0.0).filter(info)
+    assert not SamplingFilter(0.0).filter(debug)
+    assert SamplingFilter(1.0).filter(debug)
+
+def test_sampling_filter_samples_only_debug():
+    records = [logging.makeLogRecord({"levelno": level}) for level in (logging.DEBUG, logging.INFO, logging.WARNING)]
+    kept = [record.levelno for record in records for _ in range(200) if SamplingFilter(0.1).filter(record)]
+    assert kept.count(logging.INFO) == kept.count(logging.WARNING) == 200
+    assert 0 < kept.count(logging.DEBUG) < 60
+
+def test_queued_records_are_flushed_at_exit():
+    import subprocess
+    import sys
+    script = ("import logging; from app.log import configure_logging; configure_logging('INFO'); "
+              "[logging.getLogger('exit').info('record %d', i) for i in range(500)]")
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=30).stdout
+    assert output.count('"logger": "exit"') == 500
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    logger = logging.getLogger("test_log.dropping")
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.warning("first")
+    logger.warning("second")
+    assert handler.dropped == 1
+
+def test_records_are_json_with_request_id():
+    stream = io.StringIO()
+    log.stop_logging()
+    log.configure_logging("INFO", stream=stream)
+    try:
+        token = log.set_request_id("req-123")
+        try:
+            logging.getLogger("test_log").warning("hello %s", "world")
+        finally:
+            log.reset_request_id(token)
+    finally:
+        log.stop_logging()
+    record = json.loads(stream.getvalue().splitlines()[-1])
+    assert record["message"] == "hello world"
+    assert record["request_id"] == "req-123"
+    assert record["level"] == "WARNING"
+
+def test_request_id_is_echoed_in_response():
+    client = create_app().test_client()
+    assert client.get('/', headers={"X-Request-ID": "abc"}).headers["X-Request-ID"] == "abc"
+    assert len(client.get('/').headers["X-Request-ID"]) == 32
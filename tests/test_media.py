@@ -0,0 +1,68 @@
+# tests/test_media.py
+import pytest
+from app import create_app
+from app.config import Config
+
+AUDIO_HASH = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "AUDIO_OUTPUT_DIR", str(tmp_path))
+    (tmp_path / f"tts_{AUDIO_HASH}.mp3").write_bytes(b"ID3" + bytes(range(97)))
+    (tmp_path / "legacy.mp3").write_bytes(b"ID3legacy")
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_content_addressed_audio_is_immutable_and_conditional(client):
+    response = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3")
+    assert response.status_code == 200
+    assert response.mimetype == "audio/mpeg"
+    etag = response.headers["ETag"]
+    assert etag.startswith(f'"{AUDIO_HASH}-64-')
+    assert response.cache_control.immutable and response.cache_control.max_age == 31536000
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    again = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+
+    ranged = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3", headers={"Range": "bytes=0-2"})
+    assert ranged.status_code == 206
+    assert ranged.data == b"ID3"
+    assert ranged.headers["Content-Range"] == "bytes 0-2/100"
+
+
+def test_other_audio_gets_short_cache_and_missing_files_404(client):
+    response = client.get("/static/audio/legacy.mp3")
+    assert response.status_code == 200
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age == Config.STATIC_AUDIO_MAX_AGE
+    assert client.get("/static/audio/missing.mp3").status_code == 404
+    assert client.get("/static/audio/../../config.py").status_code == 404
+
+
+def test_x_accel_mode_hands_the_file_to_the_proxy(client, monkeypatch):
+    monkeypatch.setattr(Config, "STATIC_OFFLOAD", "x-accel")
+    response = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3")
+    assert response.status_code == 200
+    assert response.data == b""
+    assert response.headers["X-Accel-Redirect"] == f"/_audio/tts_{AUDIO_HASH}.mp3"
+    assert response.cache_control.immutable
+
+    again = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3", headers={"If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304
+    assert "X-Accel-Redirect" not in again.headers
+
+
+def test_rerendered_audio_gets_a_new_etag(client, tmp_path):
+    import os
+    path = tmp_path / f"tts_{AUDIO_HASH}.mp3"
+    first = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3").headers["ETag"]
+    path.write_bytes(b"ID3" + bytes(range(40)))
+    os.utime(path, ns=(1, 1_000_000_000))
+    response = client.get(f"/static/audio/tts_{AUDIO_HASH}.mp3", headers={"If-Range": first, "Range": "bytes=3-"})
+    assert response.headers["ETag"] != first
+    assert response.status_code == 200 and len(response.data) == 43
@@ -0,0 +1,66 @@
+# tests/test_memory.py
+from app.memory import ConversationMemory
+
+
+def make_memory(tmp_path, **kwargs):
+    return ConversationMemory(db_path=str(tmp_path / "memory.db"), **kwargs)
+
+def test_context_keeps_newest_turns_within_budget(tmp_path):
+    memory = make_memory(tmp_path, token_budget=30, summary_trigger=10)
+    for i in range(10):
+        memory.append("u1", "user", f"message number {i} " + "x" * 20)
+    context = memory.build_context("u1")
+    assert context.tokens <= 30
+    assert [m["content"][:16] for m in context.messages] == ["message number 7", "message number 8", "message number 9"]
+    assert context.needs_summary
+
+def test_fold_into_summary_covers_older_turns_only(tmp_path):
+    memory = make_memory(tmp_path, token_budget=30, summary_trigger=10, summary_max_tokens=10)
+    for i in range(6):
+        memory.append("u1", "user", f"turn {i} " + "y" * 30)
+    seen = []
+
+    def summarize(previous, turns):
+        seen.append((previous, [t["content"][:6] for t in turns]))
+        return "She is planning her week."
+
+    assert memory.fold_into_summary("u1", summarize)
+    context = memory.build_context("u1")
+    assert context.summary == "She is planning her week."
+    assert seen[0][0] is None
+    assert seen[0][1] + [m["content"][:6] for m in context.messages] == [f"turn {i}" for i in range(6)]
+    assert not context.needs_summary
+
+def test_fold_into_summary_covers_short_turns_outside_the_turn_window(tmp_path):
+    memory = make_memory(tmp_path, token_budget=1000, summary_trigger=100, max_recent_turns=4)
+    for i in range(10):
+        memory.append("u1", "user", f"ok {i}")
+    assert memory.build_context("u1").needs_summary
+    seen = []
+
+    def summarize(previous, turns):
+        seen.extend(t["content"] for t in turns)
+        return "Short check-ins."
+
+    assert memory.fold_into_summary("u1", summarize)
+    context = memory.build_context("u1")
+    assert seen + [m["content"] for m in context.messages] == [f"ok {i}" for i in range(10)]
+    assert len(context.messages) == 4
+    assert not context.needs_summary
+    assert not memory.fold_into_summary("u1", summarize)
+
+def test_stale_summary_run_does_not_move_coverage_back(tmp_path):
+    memory = make_memory(tmp_path, token_budget=1000, summary_trigger=100, max_recent_turns=2)
+    for i in range(4):
+        memory.append("u1", "user", f"ok {i}")
+
+    def slow_summarize(previous, turns):
+        # A second run starts, sees more turns and finishes first.
+        for i in range(4, 8):
+            memory.append("u1", "user", f"ok {i}")
+        memory.fold_into_summary("u1", lambda previous, turns: "newer")
+        return "stale"
+
+    assert not memory.fold_into_summary("u1", slow_summarize)
+    row = memory.summary("u1")
+    assert (row["summary"], row["covered_until"]) == ("newer", 6)
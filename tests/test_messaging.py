@@ -0,0 +1,96 @@
+# tests/test_messaging.py
+import pytest
+from twilio.base.exceptions import TwilioRestException
+from app import messaging
+from app.messaging import TwilioDispatcher
+
+
+class FakeMessages:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            raise TwilioRestException(failure, "https://api.twilio.com", "error")
+        return type("Message", (), {"sid": f"SM{len(self.calls)}"})()
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(messaging.time, "sleep", lambda seconds: None)
+    d = TwilioDispatcher("AC123", "token", "+15550000000", status_callback="https://example.test/status")
+    d.messages = FakeMessages()
+    d._client = type("FakeClient", (), {"messages": d.messages})()
+    d._pid = messaging.os.getpid()
+    return d
+
+def test_send_combines_body_and_media_in_one_message(dispatcher):
+    dispatcher.send("+15550001111", "Hello", ["https://example.test/a.mp3"])
+    assert dispatcher.messages.calls == [{
+        "from_": "+15550000000", "to": "+15550001111", "body": "Hello",
+        "media_url": ["https://example.test/a.mp3"], "status_callback": "https://example.test/status",
+    }]
+
+def test_send_appends_media_link_on_sms_only_channels(dispatcher):
+    dispatcher.send("+445550001111", "Hello", ["https://example.test/a.mp3"])
+    call = dispatcher.messages.calls[0]
+    assert call["body"] == "Hello\nhttps://example.test/a.mp3"
+    assert "media_url" not in call
+
+def test_send_retries_throttling_but_not_client_errors(dispatcher):
+    dispatcher.messages.failures = [429, 503]
+    assert dispatcher.send("+15550001111", "Hello") == "SM3"
+    dispatcher.messages.failures = [400]
+    with pytest.raises(TwilioRestException):
+        dispatcher.send("+15550001111", "Hello")
+
+def test_send_retries_failed_connects_but_not_read_timeouts(dispatcher):
+    from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
+    from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+    refused = ConnectionError(MaxRetryError(None, "/Messages.json", NewConnectionError(None, "refused")))
+    dispatcher.messages.failures = [ConnectTimeout(), refused]
+    assert dispatcher.send("+15550001111", "Hello") == "SM3"
+    for failure in (ReadTimeout(), ConnectionError(ProtocolError("Connection aborted."))):
+        dispatcher.messages.calls.clear()
+        dispatcher.messages.failures = [failure]
+        with pytest.raises(type(failure)):
+            dispatcher.send("+15550001111", "Hello")
+        assert len(dispatcher.messages.calls) == 1
+
+def test_rate_limiter_paces_after_burst(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(messaging.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(messaging.time, "sleep", lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+    limiter = messaging.RateLimiter(rate=2, burst=2)
+    for _ in range(6):
+        limiter.acquire()
+    assert clock[0] == pytest.approx(2.0)
+
+def test_rate_limiter_shares_the_sender_bucket_through_redis(monkeypatch):
+    slept, calls = [], []
+    waits = ["0.5", "0"]
+    monkeypatch.setattr(messaging.time, "sleep", slept.append)
+    limiter = messaging.RateLimiter(rate=2, key="+15550000000", redis_url="redis://test")
+    limiter._redis = object()
+    limiter._script = lambda keys, args: calls.append((keys, args)) or waits.pop(0)
+    limiter.acquire()
+    assert slept == [0.5]
+    assert calls[0] == (["caelum:sendrate:+15550000000"], [2, 2])
+
+def test_rate_limiter_falls_back_to_a_local_bucket_without_redis(monkeypatch):
+    limiter = messaging.RateLimiter(rate=1, key="+15550000000", redis_url="redis://test")
+    limiter._redis = object()
+    limiter._script = lambda keys, args: 1 / 0
+    limiter.acquire()
+    assert limiter._get_redis() is None and limiter._tokens < 1
+
+def test_dispatcher_sends_through_fake_twilio_api(fake_services):
+    d = TwilioDispatcher(status_callback="https://example.test/status")
+    before = fake_services.settings.requests["twilio"]
+    assert d.send("+15550001111", "Hello").startswith("SM")
+    assert fake_services.settings.requests["twilio"] == before + 1
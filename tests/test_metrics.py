@@ -0,0 +1,110 @@
+# tests/test_metrics.py
+import fnmatch
+import pytest
+from app import create_app
+from app.metrics import MetricsRegistry
+
+
+class FakeRedis:
+    """The hash commands the registry uses, shared by several registries."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=False):
+        return self
+
+    def execute(self):
+        return []
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self.hashes.setdefault(key, {}).update(mapping or {field: value})
+
+    def hincrbyfloat(self, key, field, delta):
+        values = self.hashes.setdefault(key, {})
+        values[field] = values.get(field, 0.0) + delta
+
+    def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def scan_iter(self, match, count=None):
+        return [key for key in list(self.hashes) if fnmatch.fnmatch(key, match)]
+
+
+def shared_registry(redis, pid):
+    metrics = MetricsRegistry(redis_url="redis://test")
+    metrics._redis, metrics._flusher_pid = redis, object()
+    metrics._gauge_key = lambda: f"caelum:metrics:gauges:host:{pid}"
+    return metrics
+
+
+def test_track_records_histogram_in_flight_and_errors():
+    metrics = MetricsRegistry(redis_url="")
+    with metrics.track("tts"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.track("tts"):
+            raise ValueError("boom")
+    text = metrics.render()
+    assert "# TYPE caelum_stage_duration_seconds histogram" in text
+    assert 'caelum_stage_duration_seconds_count{stage="tts"} 2' in text
+    assert 'caelum_stage_duration_seconds_bucket{le="+Inf",stage="tts"} 2' in text
+    assert 'caelum_stage_in_flight{stage="tts"} 0' in text
+    assert 'caelum_stage_errors_total{error="ValueError",stage="tts"} 1' in text
+
+def test_track_does_not_count_generator_exit_as_an_error():
+    metrics = MetricsRegistry(redis_url="")
+
+    def stream():
+        with metrics.track("llm_stream"):
+            yield "a"
+            yield "b"
+
+    fragments = stream()
+    next(fragments)
+    fragments.close()
+    text = metrics.render()
+    assert "caelum_stage_errors_total" not in text
+    assert 'caelum_stage_in_flight{stage="llm_stream"} 0' in text
+
+def test_gauges_are_per_process_snapshots_that_vanish_with_the_process():
+    redis = FakeRedis()
+    alive, killed = shared_registry(redis, 1), shared_registry(redis, 2)
+    alive.gauge_add("caelum_stage_in_flight", 1, stage="llm")
+    killed.gauge_add("caelum_stage_in_flight", 1, stage="llm")
+    killed.flush()
+    assert 'caelum_stage_in_flight{stage="llm"} 2' in alive.render()
+    # The killed worker's snapshot expires; only live processes are summed.
+    redis.delete("caelum:metrics:gauges:host:2")
+    alive.gauge_add("caelum_stage_in_flight", -1, stage="llm")
+    assert 'caelum_stage_in_flight{stage="llm"} 0' in alive.render()
+    alive.close()
+    assert "caelum:metrics:gauges:host:1" not in redis.hashes
+
+def test_buckets_are_cumulative_and_ordered():
+    metrics = MetricsRegistry(redis_url="")
+    metrics.observe("latency", 0.3, buckets=(0.1, 0.5, 1.0))
+    lines = [line for line in metrics.render().splitlines() if line.startswith("latency_bucket")]
+    assert lines == ['latency_bucket{le="0.1"} 0', 'latency_bucket{le="0.5"} 1',
+                     'latency_bucket{le="1"} 1', 'latency_bucket{le="+Inf"} 1']
+
+def test_record_usage_counts_tokens():
+    metrics = MetricsRegistry(redis_url="")
+    usage = type("Usage", (), {"prompt_tokens": 12, "completion_tokens": 30})()
+    metrics.record_usage("gpt-4", usage)
+    text = metrics.render()
+    assert 'caelum_llm_tokens_total{kind="prompt",model="gpt-4"} 12' in text
+    assert 'caelum_llm_tokens_total{kind="completion",model="gpt-4"} 30' in text
+
+def test_metrics_endpoint_reports_llm_stage():
+    client = create_app().test_client()
+    client.post('/llm', json={"prompt": "Hello", "cache": False})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'caelum_stage_duration_seconds_count{stage="llm"}' in response.get_data(as_text=True)
@@ -0,0 +1,49 @@
+# tests/test_pipeline.py
+import threading
+import time
+from app.pipeline import StageGraph, StageSkipped, StageTimeout
+
+
+def test_independent_stages_run_concurrently():
+    audio_started = threading.Event()
+    graph = StageGraph("test")
+    graph.add("text", lambda ctx: ctx["prompt"].upper())
+    graph.add("audio", lambda ctx: audio_started.set() or time.sleep(0.2) or "audio.mp3", deps=["text"])
+    # Finishes only if it runs while "audio" is still rendering.
+    graph.add("send_text", lambda ctx: audio_started.wait(1) and f"sent {ctx['text']}", deps=["text"])
+    graph.add("send_media", lambda ctx: f"sent {ctx['audio']}", deps=["audio", "send_text"])
+    result = graph.run(prompt="hi")
+    assert result.ok
+    assert result.values["send_text"] == "sent HI"
+    assert result.values["send_media"] == "sent audio.mp3"
+    assert result.durations["send_text"] < result.durations["audio"] + 0.1
+
+def test_timeout_skips_hard_dependents_but_not_soft_ones():
+    graph = StageGraph("test")
+    graph.add("audio", lambda ctx: time.sleep(1), timeout=0.05)
+    graph.add("send_media", lambda ctx: "media", deps=["audio"])
+    graph.add("send_text", lambda ctx: f"text, audio={ctx.get('audio')}", after=["audio"])
+    started = time.monotonic()
+    result = graph.run()
+    assert time.monotonic() - started < 0.5
+    assert isinstance(result.errors["audio"], StageTimeout)
+    assert isinstance(result.errors["send_media"], StageSkipped)
+    assert result.values["send_text"] == "text, audio=None"
+
+def test_retries_then_fallback():
+    attempts = []
+    graph = StageGraph("test")
+    graph.add("flaky", lambda ctx: attempts.append(1) or 1 / 0, retries=1, fallback=lambda error, ctx: "fallback")
+    graph.add("after", lambda ctx: ctx["flaky"] + "!", deps=["flaky"])
+    result = graph.run()
+    assert len(attempts) == 2
+    assert result.values == {"flaky": "fallback", "after": "fallback!"}
+
+def test_inputs_named_after_stages_are_not_rerun():
+    calls = []
+    graph = StageGraph("test")
+    graph.add("text", lambda ctx: calls.append("text") or "hi")
+    graph.add("send", lambda ctx: calls.append("send") or f"sent {ctx['text']}", deps=["text"])
+    result = graph.run(text="cached")
+    assert calls == ["send"]
+    assert result.values == {"text": "cached", "send": "sent cached"}
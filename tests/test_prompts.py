@@ -0,0 +1,31 @@
+from app.prompts import CORE_PROMPT, SCENARIOS, build_system_prompt, count_tokens, detect_scenario
+
+
+def test_detect_scenario_by_intent():
+    assert detect_scenario("Good morning Caelum") == "morning"
+    assert detect_scenario("mood 3/10") == "morning"
+    assert detect_scenario("7") == "morning"
+    assert detect_scenario("This report is a monster and I keep avoiding it") == "monster_task"
+    assert detect_scenario("I'm spiraling this morning") == "spiral"
+    assert detect_scenario("What should I cook tonight?") is None
+    assert detect_scenario("") is None
+
+def test_core_prefix_is_byte_identical_across_turns():
+    first = build_system_prompt("I'm spiraling", mood_block="Recent mood: low.", summary="She moved house.")
+    second = build_system_prompt("What should I cook tonight?")
+    assert first.text.startswith(CORE_PROMPT + "\n\n" + SCENARIOS["spiral"])
+    assert first.text.index("Recent mood") < first.text.index("She moved house.")
+    assert second.text == CORE_PROMPT and second.scenario is None
+
+def test_only_one_scenario_block_is_included():
+    prompt = build_system_prompt("Good morning, I'm stuck on a monster task")
+    assert prompt.scenario == "monster_task"
+    assert sum(block in prompt.text for block in SCENARIOS.values()) == 1
+    assert build_system_prompt("hi", scenario="spiral").scenario == "spiral"
+
+def test_token_accounting_counts_every_part():
+    prompt = build_system_prompt("Good morning", summary="She likes tea.")
+    expected = (count_tokens(CORE_PROMPT) + count_tokens(SCENARIOS["morning"])
+                + count_tokens("Summary of your earlier conversation with her: She likes tea."))
+    assert prompt.tokens == expected
+    assert count_tokens.cache_info().hits > 0
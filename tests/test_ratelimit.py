@@ -0,0 +1,77 @@
+# tests/test_ratelimit.py
+import threading
+import time
+import pytest
+from app.ratelimit import BATCH, INTERACTIVE, OpenAIRateLimiter, RateLimitTimeout, estimate_request_tokens
+
+
+def limiter(**kwargs):
+    options = dict(rpm=60, tpm=6000, batch_reserve=0.25, max_wait=2, redis_url="")
+    options.update(kwargs)
+    return OpenAIRateLimiter(**options)
+
+
+def test_cost_estimate_covers_prompt_and_completion_allowance():
+    messages = [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 40}]
+    assert estimate_request_tokens(messages, 500) == 100 + 4 + 10 + 4 + 500
+
+
+def test_token_bucket_waits_then_times_out_and_refunds_unused_tokens():
+    bucket = limiter(tpm=600, max_wait=0.1)
+    assert bucket.acquire("gpt-4", 600) < 0.05
+    # 60 more tokens take 6s to refill at 600/min, longer than max_wait.
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire("gpt-4", 60)
+    assert time.monotonic() - started >= 0.1
+    # Refunding what the first call did not use lets the next one in at once.
+    bucket.settle("gpt-4", 600, 500)
+    assert bucket.acquire("gpt-4", 90) < 0.05
+
+
+def test_batch_calls_leave_a_reserve_for_interactive_ones():
+    bucket = limiter(tpm=1000, max_wait=0.05)
+    bucket.acquire("gpt-4", 700, BATCH)
+    # 300 tokens left is less than the 250 reserve plus a 100 token cost.
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire("gpt-4", 100, BATCH)
+    assert bucket.acquire("gpt-4", 250, INTERACTIVE) < 0.05
+
+
+def test_waiting_interactive_call_is_admitted_before_batch_work():
+    bucket = limiter(rpm=600, tpm=10 ** 6, batch_reserve=0, max_wait=5)
+    for _ in range(600):
+        bucket.acquire("gpt-4", 1)
+    order = []
+
+    def call(priority):
+        bucket.acquire("gpt-4", 1, priority)
+        order.append(priority)
+
+    interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+    batch = threading.Thread(target=call, args=(BATCH,))
+    interactive.start()
+    time.sleep(0.02)
+    batch.start()
+    interactive.join()
+    batch.join()
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_failed_call_gets_its_completion_allowance_back(monkeypatch):
+    from types import SimpleNamespace
+    import app.llm
+    from app.llm import LLMEngine
+
+    def create(**kwargs):
+        raise TimeoutError("Request timed out.")
+
+    bucket = limiter(tpm=1000, max_wait=0.05)
+    monkeypatch.setattr(app.llm, "get_openai_limiter", lambda: bucket)
+    monkeypatch.setattr(app.llm, "_client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    engine = LLMEngine(debug=False, cache=None)
+    engine.cache, engine.max_tokens = None, 900
+    with pytest.raises(TimeoutError):
+        engine.generate_response("hi", system_msg="Be brief.")
+    # Only the prompt stays charged, so a full-allowance call fits straight away.
+    assert bucket.acquire("gpt-4", 900) < 0.05
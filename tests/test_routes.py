@@ -27,3 +27,96 @@ def test_llm_endpoint(client):
     # Expect the default prompt to end with a check-in like "Is this helpful?" Uncomment the following
     # assert "Is this helpful" in response.get_data(as_text=True)
 
+
+def test_llm_endpoint_sends_scenario_prompt(client, monkeypatch):
+    from types import SimpleNamespace
+    from app.prompts import CORE_PROMPT, SCENARIOS
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["messages"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Breathe with me."))])
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    fake.with_options = lambda **options: fake
+    monkeypatch.setattr("app.llm._client", fake)
+    response = client.post("/llm", json={"prompt": "I'm spiraling again", "cache": False})
+    assert response.get_data(as_text=True) == "Breathe with me."
+    assert sent[0][0]["content"] == f"{CORE_PROMPT}\n\n{SCENARIOS['spiral']}"
+
+def test_webhook_queues_reply_and_acks(client, monkeypatch):
+    queued = []
+    monkeypatch.setattr("tasks.queue_reply", lambda sender, body: queued.append((sender, body)))
+    response = client.post("/webhook", data={"From": "+15550001111", "Body": "Hi Caelum"})
+    assert response.status_code == 200
+    assert response.mimetype == "application/xml"
+    assert queued == [("+15550001111", "Hi Caelum")]
+
+def test_webhook_rejects_missing_fields(client, monkeypatch):
+    monkeypatch.setattr("tasks.queue_reply", lambda sender, body: pytest.fail("should not queue"))
+    response = client.post("/webhook", data={"From": "+15550001111"})
+    assert response.status_code == 400
+
+def test_tts_stream_streams_audio(client, monkeypatch):
+    monkeypatch.setattr("app.routes.stream_synthesis", lambda text: iter([b"ID3", b"frames"]))
+    response = client.post("/tts-stream", json={"text": "Hello. Goodbye."})
+    assert response.status_code == 200
+    assert response.mimetype == "audio/mpeg"
+    assert response.data == b"ID3frames"
+
+def test_llm_endpoint_streams_text(client, monkeypatch):
+    monkeypatch.setattr(client.application.extensions["caelum"].llm, "stream_response", lambda prompt, use_cache=True: iter(["Hello", ", ", "love"]))
+    response = client.post("/llm?stream=1", json={"prompt": "Hi"})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == "Hello, love"
+
+def test_llm_endpoint_streams_sse(client, monkeypatch):
+    monkeypatch.setattr(client.application.extensions["caelum"].llm, "stream_response", lambda prompt, use_cache=True: iter(["Hi", "!"]))
+    response = client.post("/llm?stream=sse", json={"prompt": "Hi"})
+    assert response.mimetype == "text/event-stream"
+    assert response.get_data(as_text=True) == 'data: "Hi"\n\ndata: "!"\n\nevent: done\ndata: ""\n\n'
+
+def test_webhook_queues_voice_note_without_body(client, monkeypatch):
+    queued = []
+    monkeypatch.setattr("tasks.queue_voice_reply", lambda *args: queued.append(args))
+    response = client.post("/webhook", data={"From": "+15550001111", "NumMedia": "1",
+                                             "MediaUrl0": "https://api.twilio.com/media/ME1",
+                                             "MediaContentType0": "audio/ogg"})
+    assert response.status_code == 200
+    assert queued == [("+15550001111", "https://api.twilio.com/media/ME1", "audio/ogg", "")]
+
+def test_respond_remembers_previous_turns(client, monkeypatch):
+    calls = []
+
+    def generate(prompt, system_msg=None, use_cache=True, history=None, **tier):
+        calls.append(history)
+        return f"reply to {prompt}"
+
+    monkeypatch.setattr(client.application.extensions["caelum"].llm, "generate_response", generate)
+    monkeypatch.setattr("tasks.queue_summary", lambda user_id: None)
+    assert client.post('/respond', json={"input": "I have a deadline"}).get_json()["response"] == "reply to I have a deadline"
+    client.post('/respond', json={"input": "Help me start"})
+    assert calls[-1][-2:] == [{"role": "user", "content": "I have a deadline"},
+                              {"role": "assistant", "content": "reply to I have a deadline"}]
+
+def test_webhook_retries_with_same_message_sid_queue_once(client, monkeypatch):
+    from app.idempotency import IdempotencyStore
+    queued, store = [], IdempotencyStore(redis_url="")
+    monkeypatch.setattr("app.routes.get_idempotency_store", lambda: store)
+    monkeypatch.setattr("tasks.queue_reply", lambda sender, body: queued.append((sender, body)))
+    form = {"From": "+15550001111", "Body": "Hi Caelum", "MessageSid": "SM123"}
+    assert client.post("/webhook", data=form).status_code == 200
+    assert client.post("/webhook", data=form).status_code == 200
+    assert queued == [("+15550001111", "Hi Caelum")]
+
+def test_status_callbacks_are_queued_once_per_status(client, monkeypatch):
+    from app.idempotency import IdempotencyStore
+    events, store = [], IdempotencyStore(redis_url="")
+    monkeypatch.setattr("app.routes.get_idempotency_store", lambda: store)
+    monkeypatch.setattr("app.routes.log_message_status", lambda *args, **kwargs: events.append(args[:3]))
+    form = {"MessageSid": "SM9", "MessageStatus": "delivered", "To": "+15550001111"}
+    assert client.post("/status", data=form).status_code == 200
+    assert client.post("/status", data=form).status_code == 200
+    assert events == [("SM9", "delivered", "+15550001111")]
+    report = client.get("/status/report").get_json()
+    assert set(report) == {"since", "latency", "failures"}
@@ -0,0 +1,82 @@
+# tests/test_routing.py
+import time
+import pytest
+from app.config import Config
+from app.routing import CHAT, SMS, choose_route, routed_response
+
+LONG_MESSAGE = "This task feels like a monster and I have been avoiding it all week. " * 3
+
+
+class FakeEngine:
+    def __init__(self, delays, failures=()):
+        self.delays, self.failures, self.calls = delays, failures, []
+
+    def generate_response(self, prompt, model=None, max_tokens=None, timeout=None, **kwargs):
+        self.calls.append((model, max_tokens))
+        delay = self.delays.get(model, 0)
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError("Request timed out.")
+        if model in self.failures:
+            raise RuntimeError(f"{model} failed")
+        return f"{model} reply"
+
+
+@pytest.fixture(autouse=True)
+def tiers(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_PRIMARY_MODEL", "big")
+    monkeypatch.setattr(Config, "LLM_FAST_MODEL", "small")
+    monkeypatch.setattr(Config, "LLM_HEDGE_AFTER", 0.1)
+    monkeypatch.setattr(Config, "LLM_FAST_HEDGE_AFTER", 0.1)
+    monkeypatch.setattr(Config, "LLM_MAX_LATENCY", 0.5)
+
+
+def test_short_messages_go_to_the_fast_tier_and_sms_gets_fewer_tokens():
+    assert choose_route(SMS, "7").first == ("fast", "small", Config.LLM_FAST_MAX_TOKENS)
+    assert choose_route(SMS, LONG_MESSAGE).first == ("primary", "big", Config.LLM_SMS_MAX_TOKENS)
+    assert choose_route(CHAT, LONG_MESSAGE).first == ("primary", "big", Config.LLM_PRIMARY_MAX_TOKENS)
+    reply = routed_response(FakeEngine({}), "7", SMS)
+    assert (reply.text, reply.tier, reply.hedged) == ("small reply", "fast", False)
+
+
+def test_slow_primary_is_hedged_with_the_fast_tier():
+    engine = FakeEngine({"big": 0.4})
+    reply = routed_response(engine, LONG_MESSAGE, CHAT)
+    assert (reply.tier, reply.model, reply.hedged) == ("fast", "small", True)
+    assert reply.seconds < 0.3
+    assert [model for model, _ in engine.calls] == ["big", "small"]
+
+
+def test_failed_primary_falls_back_without_waiting_for_the_hedge_delay():
+    reply = routed_response(FakeEngine({}, failures={"big"}), LONG_MESSAGE, CHAT)
+    assert reply.tier == "fast" and reply.seconds < 0.1
+
+
+def test_worst_case_is_capped_by_the_deadline():
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        routed_response(FakeEngine({"big": 2, "small": 2}), LONG_MESSAGE, CHAT)
+    assert time.monotonic() - started < 0.7
+
+
+def test_losing_call_still_waiting_for_the_limiter_is_cancelled(monkeypatch):
+    import threading
+    from app.llm import LLMEngine
+    from app.ratelimit import CallCancelled, OpenAIRateLimiter
+    limiter = OpenAIRateLimiter(rpm=1, tpm=0, redis_url="", max_wait=5)
+    limiter.acquire("small", 0)  # The fast tier's bucket is empty for the next minute.
+    monkeypatch.setattr("app.llm.get_openai_limiter", lambda: limiter)
+    cancel, errors = threading.Event(), []
+
+    def loser():
+        try:
+            LLMEngine(debug=False, cache=None).generate_response("hi", model="small", cancel=cancel)
+        except CallCancelled as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=loser)
+    thread.start()
+    time.sleep(0.05)
+    cancel.set()
+    thread.join(1)
+    assert not thread.is_alive() and len(errors) == 1
@@ -0,0 +1,156 @@
+# tests/test_tasks.py
+import pytest
+from datetime import timedelta
+import tasks
+from app.tts import TTSCache
+
+
+@pytest.fixture
+def eager_celery():
+    tasks.celery.conf.task_always_eager = True
+    yield tasks.celery
+    tasks.celery.conf.task_always_eager = False
+
+class FakeLLM:
+    def generate_response(self, prompt, **kwargs):
+        return "echo: " + prompt
+
+@pytest.fixture
+def pipeline(eager_celery, monkeypatch, tmp_path):
+    sent = []
+    cache = TTSCache(directory=str(tmp_path), max_bytes=0, static_domain="https://example.test")
+    monkeypatch.setattr(tasks, "get_llm", lambda: FakeLLM())
+    monkeypatch.setattr(tasks, "get_tts_cache", lambda: cache)
+    monkeypatch.setattr(tasks, "generate_audio_message", lambda text: "https://example.test/a.mp3")
+    monkeypatch.setattr(tasks, "send_twilio_message", lambda body, to, url: sent.append((body, to, url)) or "SM1")
+    return sent, cache
+
+def test_reply_pipeline_sends_text_then_audio(pipeline):
+    sent, _ = pipeline
+    result = tasks.queue_reply("+15550001111", "hello").get()
+    assert result["values"]["reply_text"] == "echo: hello"
+    assert sent == [
+        ("echo: hello", "+15550001111", None),
+        ("", "+15550001111", "https://example.test/a.mp3"),
+    ]
+
+def test_reply_pipeline_sends_one_mms_when_audio_is_cached(pipeline):
+    sent, cache = pipeline
+    cached = cache.put("echo: hello", "en", "com", b"mp3")
+    tasks.queue_reply("+15550001111", "hello")
+    assert sent == [("echo: hello", "+15550001111", cached.url)]
+
+def test_reply_pipeline_still_sends_text_when_tts_fails(pipeline, monkeypatch):
+    sent, _ = pipeline
+    monkeypatch.setattr(tasks, "generate_audio_message", lambda text: 1 / 0)
+    monkeypatch.setattr(tasks.Config, "TTS_STAGE_TIMEOUT", 5)
+    monkeypatch.setattr("app.pipeline.time.sleep", lambda seconds: None)
+    result = tasks.queue_reply("+15550001111", "hello").get()
+    assert sent == [("echo: hello", "+15550001111", None)]
+    assert "audio_url" in result["errors"]
+
+def test_reply_retry_resends_only_the_failed_send(pipeline, monkeypatch):
+    sent, _ = pipeline
+    from requests.exceptions import ConnectTimeout
+    prompts, failures = [], [ConnectTimeout("Twilio unreachable")]
+
+    class CountingLLM(FakeLLM):
+        def generate_response(self, prompt, **kwargs):
+            prompts.append(prompt)
+            return super().generate_response(prompt, **kwargs)
+
+    def send(body, to, url):
+        if failures:
+            raise failures.pop()
+        sent.append((body, to, url))
+        return f"SM{len(sent)}"
+
+    monkeypatch.setattr(tasks, "get_llm", lambda: CountingLLM())
+    monkeypatch.setattr(tasks, "send_twilio_message", send)
+    tasks.queue_reply("+15550001111", "hello")
+    assert prompts == ["hello"]
+    assert sent == [("echo: hello", "+15550001111", None),
+                    ("", "+15550001111", "https://example.test/a.mp3")]
+
+def test_reply_is_not_resent_after_an_ambiguous_failure(pipeline, monkeypatch):
+    from requests.exceptions import ReadTimeout
+    calls = []
+
+    def send(body, to, url):
+        calls.append(body)
+        raise ReadTimeout("accepted, then the response was lost")
+
+    monkeypatch.setattr(tasks, "send_twilio_message", send)
+    monkeypatch.setattr(tasks.Config, "REPLY_TEXT_FIRST", True)
+    result = tasks.queue_reply("+15550001111", "hello").get()
+    assert calls == ["echo: hello"]
+    assert "text_sid" in result["errors"]
+
+def test_reply_sends_are_keyed_per_reply_and_stage(pipeline):
+    sent, _ = pipeline
+    done = {"reply_text": "echo: hello", "cached_audio_url": None, "audio_url": "https://example.test/a.mp3"}
+    tasks.handle_incoming_message.run("hello", "+15550001111", reply_id="R2", done=done)
+    tasks.handle_incoming_message.run("hello", "+15550001111", reply_id="R2", done=done)
+    assert len(sent) == 2
+
+def test_scheduled_message_falls_back_to_text_only(pipeline, monkeypatch):
+    sent, _ = pipeline
+    monkeypatch.setattr(tasks, "generate_audio_message", lambda text: 1 / 0)
+    monkeypatch.setattr("app.pipeline.time.sleep", lambda seconds: None)
+    assert tasks.send_morning_affirmation("+15550001111") == "SM1"
+    assert sent[0][2] is None
+
+def test_fan_out_renders_once_and_records_each_recipient(pipeline, monkeypatch):
+    sent, _ = pipeline
+    renders = []
+    monkeypatch.setattr(tasks, "generate_audio_message", lambda text: renders.append(text) or "https://example.test/a.mp3")
+    monkeypatch.setattr(tasks.Config, "FANOUT_BATCH_SIZE", 2)
+    monkeypatch.setattr(tasks, "get_send_limiter", lambda: type("NoLimit", (), {"acquire": lambda self: None})())
+    recipients = ["+15550000001", "+15550000002", "+15550000003"]
+    summary = tasks.send_morning_affirmation(recipients)
+    assert summary["batches"] == 2
+    assert renders == [tasks.MORNING_AFFIRMATION]
+    assert sorted(to for _, to, _ in sent) == recipients
+
+def test_record_fanout_results_counts_failures():
+    summary = tasks.record_fanout_results(
+        [[{"recipient": "+1", "sid": "SM1"}], [{"recipient": "+2", "error": "boom"}]], "Good morning!")
+    assert (summary["sent"], summary["failed"]) == (1, 1)
+    assert [r["recipient"] for r in summary["results"]] == ["+1", "+2"]
+
+def test_prerender_renders_only_messages_due_within_lead(pipeline, monkeypatch):
+    renders = []
+    monkeypatch.setattr(tasks, "generate_audio_message", lambda text: renders.append(text) or "https://example.test/a.mp3")
+    schedule = {
+        "soon": {"task": "tasks.send_morning_affirmation",
+                 "schedule": type("Soon", (), {"remaining_estimate": lambda self, now: timedelta(minutes=5),
+                                               "now": lambda self: None})()},
+        "later": {"task": "tasks.send_evening_reflection",
+                  "schedule": type("Later", (), {"remaining_estimate": lambda self, now: timedelta(hours=5),
+                                                 "now": lambda self: None})()},
+    }
+    monkeypatch.setattr(tasks.celery.conf, "beat_schedule", schedule)
+    assert tasks.prerender_scheduled_audio(lead_minutes=60) == ["https://example.test/a.mp3"]
+    assert renders == [tasks.MORNING_AFFIRMATION]
+
+def test_scheduled_send_uses_prerendered_audio_without_rendering(pipeline, monkeypatch):
+    sent, cache = pipeline
+    cached = cache.put(tasks.MORNING_AFFIRMATION, "en", "com", b"mp3")
+    monkeypatch.setattr(tasks, "generate_audio_message", lambda text: pytest.fail("should not render"))
+    tasks.send_morning_affirmation("+15550001111")
+    assert sent == [(tasks.MORNING_AFFIRMATION, "+15550001111", cached.url)]
+
+def test_summary_is_queued_once_per_user_until_it_finishes(monkeypatch):
+    from app.idempotency import IdempotencyStore
+    queued = []
+    store = IdempotencyStore(redis_url="")
+    monkeypatch.setattr("app.idempotency.get_idempotency_store", lambda: store)
+    monkeypatch.setattr(tasks.summarize_conversation, "delay", lambda user_id: queued.append(user_id) or user_id)
+    monkeypatch.setattr("app.memory.get_memory",
+                        lambda: type("Memory", (), {"fold_into_summary": lambda self, user_id, summarize: True})())
+    assert tasks.queue_summary("u1") == "u1"
+    assert tasks.queue_summary("u1") is None
+    assert tasks.queue_summary("u2") == "u2"
+    assert tasks.summarize_conversation.run("u1") is True
+    assert tasks.queue_summary("u1") == "u1"
+    assert queued == ["u1", "u2", "u1"]
@@ -0,0 +1,95 @@
+# tests/test_tts.py
+import os
+import threading
+import time
+from app import tts
+from app.tts import TTSCache, split_sentences
+
+
+def fake_renderer(calls):
+    def render(text, lang, voice, path):
+        calls.append(text)
+        time.sleep(0.05)
+        with open(path, "wb") as f:
+            f.write(b"\xff\xfb" + text.encode() * 10)
+    return render
+
+def test_cache_hit_returns_stable_name_without_rendering(tmp_path):
+    calls = []
+    cache = TTSCache(directory=str(tmp_path), max_bytes=0, static_domain="https://example.test")
+    first = cache.get_or_render("Good morning!", renderer=fake_renderer(calls))
+    second = cache.get_or_render("Good morning!", renderer=fake_renderer(calls))
+    assert first == second
+    assert first.url == f"https://example.test/static/audio/{first.filename}"
+    assert calls == ["Good morning!"]
+    assert cache.get_or_render("Good morning!", voice="co.uk", renderer=fake_renderer(calls)) != first
+
+def test_concurrent_misses_render_once(tmp_path):
+    calls = []
+    cache = TTSCache(directory=str(tmp_path), max_bytes=0)
+    threads = [threading.Thread(target=cache.get_or_render, args=("same text",),
+                                kwargs={"renderer": fake_renderer(calls)}) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["same text"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".lock", ".tmp"))]
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    calls = []
+    cache = TTSCache(directory=str(tmp_path), max_bytes=250)
+    old = cache.get_or_render("a" * 10, renderer=fake_renderer(calls))
+    recent = cache.get_or_render("b" * 10, renderer=fake_renderer(calls))
+    os.utime(old.path, (1, 1))
+    os.utime(recent.path, (2, 2))
+    cache.lookup("b" * 10)
+    newest = cache.get_or_render("c" * 10, renderer=fake_renderer(calls))
+    assert not os.path.exists(old.path)
+    assert os.path.exists(recent.path) and os.path.exists(newest.path)
+
+def test_lookup_leaves_the_modification_time_alone(tmp_path):
+    cache = TTSCache(directory=str(tmp_path))
+    cached = cache.get_or_render("hello", renderer=fake_renderer([]))
+    os.utime(cached.path, (5, 5))
+    cache.lookup("hello")
+    st = os.stat(cached.path)
+    assert st.st_mtime == 5 and st.st_atime > 5
+
+def test_split_sentences():
+    assert split_sentences("Hello there. How are you?  Fine!") == ["Hello there.", "How are you?", "Fine!"]
+
+def test_stream_synthesis_yields_sentences_in_order_and_caches(tmp_path, monkeypatch):
+    def render(text, lang, voice):
+        time.sleep(0.05 if text.startswith("One") else 0)
+        return text.encode()
+    monkeypatch.setattr(tts, "render_gtts_bytes", render)
+    monkeypatch.setattr(tts, "_cache", TTSCache(directory=str(tmp_path), max_bytes=0))
+    chunks = list(tts.stream_synthesis("One. Two. Three."))
+    assert chunks == [b"One.", b"Two.", b"Three."]
+    with open(tts._cache.lookup("One. Two. Three.", "en", "com").path, "rb") as f:
+        assert f.read() == b"One.Two.Three."
+
+
+def test_render_lock_is_held_past_the_stale_timeout(tmp_path):
+    cache = TTSCache(directory=str(tmp_path), lock_timeout=0.01)
+    calls = []
+
+    def slow_renderer(text, lang, voice, path):
+        calls.append(text)
+        time.sleep(0.2)
+        with open(path, "wb") as f:
+            f.write(b"mp3")
+
+    threads = [threading.Thread(target=cache.get_or_render, args=("slow text",),
+                                kwargs={"renderer": slow_renderer}) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["slow text"]
+
+def test_stream_synthesis_does_not_cache_empty_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "_cache", TTSCache(directory=str(tmp_path), max_bytes=0))
+    assert list(tts.stream_synthesis("   ")) == []
+    assert tts._cache.lookup("   ", "en", "com") is None
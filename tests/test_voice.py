@@ -0,0 +1,85 @@
+# tests/test_voice.py
+import os
+import sys
+import textwrap
+import threading
+import time
+import pytest
+from app import voice
+from app.voice import plan_segments, transcribe_segments
+
+
+def test_plan_segments_cuts_at_last_pause_within_limit():
+    silences = [(4.0, 5.0), (18.0, 19.0), (27.0, 28.0), (40.0, 41.0)]
+    assert plan_segments(50.0, silences, 30.0) == [(0.0, 27.5), (27.5, 50.0)]
+
+def test_plan_segments_hard_cuts_without_pauses():
+    assert plan_segments(70.0, [], 30.0) == [(0.0, 30.0), (30.0, 60.0), (60.0, 70.0)]
+    assert plan_segments(20.0, [], 30.0) == [(0.0, 20.0)]
+
+def test_transcribe_segments_runs_in_parallel_and_keeps_order():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def transcribe(path):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return f" part {path} "
+
+    started = time.monotonic()
+    text = transcribe_segments(["a", "b", "c", "d"], transcribe, concurrency=4)
+    assert text == "part a part b part c part d"
+    assert peak[0] == 4
+    assert time.monotonic() - started < 0.15
+
+def test_transcribe_voice_note_streams_download_and_cleans_up(fake_services, monkeypatch):
+    monkeypatch.setattr(voice.shutil, "which", lambda name: None)
+    seen = []
+
+    def transcribe(path):
+        seen.append((path, os.path.getsize(path)))
+        return "hello from a voice note"
+
+    text = voice.transcribe_voice_note(f"{fake_services.url}/media/ME1", "audio/ogg", transcribe)
+    assert text == "hello from a voice note"
+    path, size = seen[0]
+    assert path.endswith(".ogg") and size == 8 * 16 * len(b"\xff\xfb\x90\x64" + b"\x00" * 413)
+    assert not os.path.exists(path)
+
+def test_whisper_transcription_uses_transcriptions_api(fake_services, tmp_path):
+    from app.llm import LLMEngine
+    audio = tmp_path / "note.ogg"
+    audio.write_bytes(b"OggS" + b"\x00" * 64)
+    assert LLMEngine(debug=False).transcribe_audio_whisper(str(audio)) == "This is a transcribed voice note."
+
+def test_split_at_silence_without_ffmpeg_keeps_one_piece(monkeypatch):
+    monkeypatch.setattr(voice.shutil, "which", lambda name: None)
+    monkeypatch.setattr(voice.subprocess, "run", lambda *args, **kwargs: pytest.fail("ffmpeg was run"))
+    assert voice.split_at_silence("/tmp/note.ogg", max_length=30.0) == ["/tmp/note.ogg"]
+
+def test_split_at_silence_cuts_with_ffmpeg(tmp_path, monkeypatch):
+    # A stand-in ffmpeg: reports a 50 s recording with pauses, and writes each segment it is asked for.
+    stub = tmp_path / "bin" / "ffmpeg"
+    stub.parent.mkdir()
+    stub.write_text(f"#!{sys.executable}\n" + textwrap.dedent("""
+        import sys
+        if "-af" in sys.argv:
+            sys.stderr.write("  Duration: 00:00:50.00, start: 0.000000\\n"
+                             "silence_start: 18.0\\nsilence_end: 19.0\\n"
+                             "silence_start: 27.0\\nsilence_end: 28.0\\n")
+        else:
+            open(sys.argv[-1], "w").write(" ".join(sys.argv[1:]))
+    """))
+    stub.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{stub.parent}{os.pathsep}{os.environ['PATH']}")
+    note = tmp_path / "note.ogg"
+    note.write_bytes(b"OggS")
+
+    paths = voice.split_at_silence(str(note), max_length=30.0)
+    assert paths == [str(tmp_path / "note_000.ogg"), str(tmp_path / "note_001.ogg")]
+    assert "-ss 0.000 -to 27.500" in open(paths[0]).read()
+    assert "-ss 27.500 -to 50.000" in open(paths[1]).read()